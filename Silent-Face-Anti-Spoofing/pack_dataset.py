@@ -0,0 +1,33 @@
+import argparse
+import time
+
+from src.data_io.packed_dataset import pack_folder
+from src.default_config import get_default_config
+from src.utility import get_width_height, get_kernel
+
+
+def parse_args():
+    """parsing and configuration"""
+    desc = "Pack training patches and FT maps into memory-mapped shards"
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("--patch_info", type=str, default="1_80x80",
+                        help="[org_1_80x60 / 1_80x80 / 2.7_80x80 / 4_80x80]")
+    parser.add_argument("--src_root", type=str, default=None,
+                        help="image folder root (default: conf.train_root_path)")
+    parser.add_argument("--dst_root", type=str, default=None,
+                        help="packed root (default: conf.packed_root_path or ./datasets/packed)")
+    parser.add_argument("--workers", type=int, default=None, help="decode processes (default: all cores)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    conf = get_default_config()
+    width, height = get_width_height(args.patch_info)
+    kernel_size = get_kernel(height, width)
+    src_root = '{}/{}'.format(args.src_root or conf.train_root_path, args.patch_info)
+    dst_root = '{}/{}'.format(args.dst_root or conf.packed_root_path or './datasets/packed', args.patch_info)
+    start = time.time()
+    index = pack_folder(src_root, dst_root, width, height,
+                        ft_width=2 * kernel_size[1], ft_height=2 * kernel_size[0], workers=args.workers)
+    print("packed {} samples into {} in {:.1f}s".format(index['count'], dst_root, time.time() - start))
@@ -8,13 +8,13 @@
 import os
 import cv2
 import math
+import threading
 import torch
 import numpy as np
 import torch.nn.functional as F
 
 
 from src.model_lib.MiniFASNet import MiniFASNetV1, MiniFASNetV2,MiniFASNetV1SE,MiniFASNetV2SE
-from src.data_io import transform as trans
 from src.utility import get_kernel, parse_model_name
 
 MODEL_MAPPING = {
@@ -51,17 +51,25 @@ class Detection:
 
 
 class AntiSpoofPredict(Detection):
-    def __init__(self, device_id):
+    def __init__(self, device_id, num_threads=None):
         super(AntiSpoofPredict, self).__init__()
         self.device = torch.device("cuda:{}".format(device_id)
                                    if torch.cuda.is_available() else "cpu")
-
-    def _load_model(self, model_path):
-        # define model
-        model_name = os.path.basename(model_path)
-        h_input, w_input, model_type, _ = parse_model_name(model_name)
-        self.kernel_size = get_kernel(h_input, w_input,)
-        self.model = MODEL_MAPPING[model_type](conv6_kernel=self.kernel_size).to(self.device)
+        if num_threads:
+            # intra-op threads of this process; with several workers per host keep workers * threads <= cores
+            torch.set_num_threads(num_threads)
+        # input buffers are reused between calls, one set per thread so concurrent predictions don't share them
+        self._buffers = threading.local()
+
+    def load_model(self, model_path, model_type=None, h_input=None, w_input=None):
+        """
+        Build the model for model_path and load its weights, in eval mode. The type and input size default to
+        the ones in the file name (see parse_model_name).
+        """
+        if model_type is None:
+            h_input, w_input, model_type, _ = parse_model_name(os.path.basename(model_path))
+        kernel_size = get_kernel(h_input, w_input,)
+        model = MODEL_MAPPING[model_type](conv6_kernel=kernel_size).to(self.device)
 
         # load model weight
         state_dict = torch.load(model_path, map_location=self.device)
@@ -73,31 +81,57 @@ class AntiSpoofPredict(Detection):
             for key, value in state_dict.items():
                 name_key = key[7:]
                 new_state_dict[name_key] = value
-            self.model.load_state_dict(new_state_dict)
+            model.load_state_dict(new_state_dict)
         else:
-            self.model.load_state_dict(state_dict)
+            model.load_state_dict(state_dict)
+        model.eval()
+        return model
+
+    def _load_model(self, model_path):
+        # define model
+        model_name = os.path.basename(model_path)
+        h_input, w_input, model_type, _ = parse_model_name(model_name)
+        self.kernel_size = get_kernel(h_input, w_input,)
+        self.model = self.load_model(model_path, model_type, h_input, w_input)
         return None
 
-    def predict(self, img, model_path):
-        test_transform = trans.Compose([
-            trans.ToTensor(),
-        ])
-        img = test_transform(img)
-        img = img.unsqueeze(0).to(self.device)
-        self._load_model(model_path)
-        self.model.eval()
-        with torch.no_grad():
-            result = self.model.forward(img)
-            result = F.softmax(result).cpu().numpy()
+    def _input_buffer(self, shape):
+        """
+        This thread's 1 x C x H x W input tensor for an H x W x C image, with an H x W x C numpy view of it.
+        The storage is H x W x C (channels_last), the layout ToTensor's transposed view gave the model, so the
+        copy in is contiguous. The host tensor is pinned on cuda, so the copy to the device can be asynchronous.
+        """
+        buffers = getattr(self._buffers, 'by_shape', None)
+        if buffers is None:
+            buffers = self._buffers.by_shape = {}
+        if shape not in buffers:
+            use_cuda = self.device.type == 'cuda'
+            host = torch.empty((1,) + tuple(shape), dtype=torch.float32, pin_memory=use_cuda)
+            device = torch.empty_like(host, device=self.device) if use_cuda else host
+            buffers[shape] = (host.numpy()[0], host, device.permute(0, 3, 1, 2))
+        return buffers[shape]
+
+    def predict_model(self, img, model):
+        """
+        predict() with a model from load_model, so callers can keep models loaded between calls.
+        The image is copied into a reused input buffer (same values as ToTensor: float, not rescaled).
+        Args:
+            img: H x W x C (or H x W) uint8 image
+            model: model returned by load_model
+        Returns:
+            1 x 3 softmax output
+        """
+        if img.ndim == 2:
+            img = img[:, :, None]
+        view, host, inputs = self._input_buffer(img.shape)
+        np.copyto(view, img, casting='unsafe')  # uint8 -> float32, no intermediate array
+        with torch.inference_mode():
+            if inputs.device != host.device:
+                inputs.copy_(host.permute(0, 3, 1, 2), non_blocking=True)
+            result = model.forward(inputs)
+            result = F.softmax(result, dim=1).cpu().numpy()
         return result
 
-
-
-
-
-
-
-
-
-
-
+    def predict(self, img, model_path):
+        self._load_model(model_path)
+        return self.predict_model(img, self.model)
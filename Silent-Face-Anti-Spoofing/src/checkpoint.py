@@ -0,0 +1,106 @@
+"""
+Training checkpoints: CPU snapshots of the training state, written to disk by a background thread.
+"""
+
+import glob
+import os
+import random
+import threading
+
+import numpy as np
+import torch
+
+STATE_GLOB = '*_state_iter-*.pth'
+
+
+def to_cpu(obj):
+    """Copy every tensor in a (nested) state dict to the CPU, so later in-place updates don't leak into it."""
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return type(obj)((k, to_cpu(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(v) for v in obj)
+    return obj
+
+
+def get_rng_state():
+    # numpy keys as a list: the checkpoint stays loadable with torch.load(weights_only=True)
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    state = {
+        'torch': torch.get_rng_state(),
+        'numpy': (name, keys.tolist(), pos, has_gauss, cached_gaussian),
+        'python': random.getstate(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state()
+    return state
+
+
+def set_rng_state(state):
+    torch.set_rng_state(state['torch'])
+    name, keys, pos, has_gauss, cached_gaussian = state['numpy']
+    np.random.set_state((name, np.asarray(keys, dtype=np.uint32), pos, has_gauss, cached_gaussian))
+    random.setstate(state['python'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state(state['cuda'])
+
+
+def list_states(directory):
+    """Training-state files in directory, oldest first."""
+    return sorted(glob.glob(os.path.join(directory, STATE_GLOB)), key=os.path.getmtime)
+
+
+def latest_state(directory):
+    states = list_states(directory)
+    return states[-1] if states else None
+
+
+class AsyncCheckpointer(object):
+    """
+    Writes checkpoint files in a background thread. Each file is written to <path>.tmp and renamed, so a
+    preempted save never leaves a truncated checkpoint behind. At most one save is in flight: save() waits
+    for the previous one. After each save only the newest `keep` training-state files are retained.
+
+    Args:
+        directory (str): checkpoint directory, used for rotation.
+        keep (int): number of training-state files to keep (0 keeps all).
+        async_save (bool): write in a background thread instead of in save().
+    """
+    def __init__(self, directory, keep=5, async_save=True):
+        self.directory = directory
+        self.keep = keep
+        self.async_save = async_save
+        self._thread = None
+        self._error = None
+
+    def save(self, files):
+        """files: list of (path, obj); obj must already be a CPU copy (see to_cpu)."""
+        self.wait()
+        if not self.async_save:
+            self._write(files)
+            self.wait()
+            return
+        self._thread = threading.Thread(target=self._write, args=(files,), name='checkpoint-writer')
+        self._thread.start()
+
+    def wait(self):
+        """Block until the pending save is on disk; re-raises an error from the writer."""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _write(self, files):
+        try:
+            for path, obj in files:
+                tmp_path = path + '.tmp'
+                torch.save(obj, tmp_path)
+                os.replace(tmp_path, path)
+            if self.keep > 0:
+                for path in list_states(self.directory)[:-self.keep]:
+                    os.remove(path)
+        except Exception as e:
+            self._error = e
@@ -0,0 +1,331 @@
+"""
+Training augmentations on uint8 H x W x C arrays (cv2/NumPy), plus a batched torch variant.
+
+Same augmentations as the PIL pipeline in transform.py (RandomResizedCrop, ColorJitter, RandomRotation,
+RandomHorizontalFlip) without the ndarray -> PIL -> tensor round trips:
+    - crop + resize, rotation and flip are composed into one affine matrix and applied with a single
+      cv2.warpAffine (rotation therefore samples the surrounding image instead of leaving black corners);
+    - brightness and contrast are 256-entry LUTs composed together and applied with one cv2.LUT,
+      saturation is one cv2.addWeighted with the grayscale image, hue is a LUT on the HSV hue channel.
+Channels are treated as RGB for the colour weights, like the PIL pipeline (images are BGR from cv2.imread).
+
+BatchAugment does the same per sample on a collated N x C x H x W tensor on the training device:
+one affine_grid/grid_sample for the geometry and one per-sample 3 x 4 colour matrix for the jitter.
+"""
+
+from __future__ import division
+import math
+import random
+import numbers
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+__all__ = ["RandomResizedCropRotateFlip", "ColorJitter", "BatchAugment"]
+
+# ITU-R 601-2 luma, as PIL's convert('L')
+_LUMA = (0.299, 0.587, 0.114)
+_IDENTITY_LUT = np.arange(256, dtype=np.float32)
+
+
+def _degrees_range(degrees):
+    if isinstance(degrees, numbers.Number):
+        if degrees < 0:
+            raise ValueError("If degrees is a single number, it must be positive.")
+        return -degrees, degrees
+    if len(degrees) != 2:
+        raise ValueError("If degrees is a sequence, it must be of len 2.")
+    return tuple(degrees)
+
+
+def _crop_params(height, width, scale, ratio):
+    """(i, j, h, w) like transform.RandomResizedCrop.get_params, for an array of height x width."""
+    area = height * width
+    for attempt in range(10):
+        target_area = random.uniform(*scale) * area
+        aspect_ratio = random.uniform(*ratio)
+
+        w = int(round(math.sqrt(target_area * aspect_ratio)))
+        h = int(round(math.sqrt(target_area / aspect_ratio)))
+
+        if random.random() < 0.5:
+            w, h = h, w
+
+        if w <= width and h <= height:
+            i = random.randint(0, height - h)
+            j = random.randint(0, width - w)
+            return i, j, h, w
+
+    # Fallback
+    w = min(width, height)
+    i = (height - w) // 2
+    j = (width - w) // 2
+    return i, j, w, w
+
+
+def affine_matrix(i, j, h, w, out_h, out_w, angle, flip):
+    """2 x 3 source -> output pixel map: crop (i, j, h, w) resized to out_h x out_w, rotated by angle degrees
+    (counter-clockwise) about the output center, then optionally mirrored."""
+    sx = out_w / float(w)
+    sy = out_h / float(h)
+    # pixel-center convention of cv2.resize: dst = (src - j + 0.5) * sx - 0.5
+    m = np.array([[sx, 0., (0.5 - j) * sx - 0.5],
+                  [0., sy, (0.5 - i) * sy - 0.5],
+                  [0., 0., 1.]])
+    rot = cv2.getRotationMatrix2D(((out_w - 1) / 2., (out_h - 1) / 2.), angle, 1.0)
+    m = np.vstack([rot, [0., 0., 1.]]).dot(m)
+    if flip:
+        m = np.array([[-1., 0., out_w - 1.], [0., 1., 0.], [0., 0., 1.]]).dot(m)
+    return m[:2]
+
+
+class RandomResizedCropRotateFlip(object):
+    """RandomResizedCrop + RandomRotation + RandomHorizontalFlip as one warp of a uint8 H x W x C array.
+
+    Args:
+        size: expected output size (height, width) or a single edge
+        scale: range of size of the origin size cropped
+        ratio: range of aspect ratio of the origin aspect ratio cropped
+        degrees: rotation range, (min, max) or a number d for (-d, d)
+        flip_prob: probability of a horizontal flip
+        interpolation: cv2 interpolation flag. Default: cv2.INTER_LINEAR
+    """
+
+    def __init__(self, size, scale=(0.08, 1.0), ratio=(3. / 4., 4. / 3.), degrees=0,
+                 flip_prob=0.5, interpolation=cv2.INTER_LINEAR):
+        if isinstance(size, tuple):
+            self.size = size
+        else:
+            self.size = (size, size)
+        self.scale = scale
+        self.ratio = ratio
+        self.degrees = _degrees_range(degrees)
+        self.flip_prob = flip_prob
+        self.interpolation = interpolation
+
+    def __call__(self, img):
+        """
+        Args:
+            img (numpy.ndarray): H x W x C uint8 image.
+
+        Returns:
+            numpy.ndarray: Augmented image of self.size.
+        """
+        out_h, out_w = self.size
+        i, j, h, w = _crop_params(img.shape[0], img.shape[1], self.scale, self.ratio)
+        angle = np.random.uniform(self.degrees[0], self.degrees[1])
+        flip = random.random() < self.flip_prob
+        m = affine_matrix(i, j, h, w, out_h, out_w, angle, flip)
+        return cv2.warpAffine(img, m, (out_w, out_h), flags=self.interpolation,
+                              borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+
+def _to_lut(values):
+    return np.clip(values + 0.5, 0, 255).astype(np.uint8)
+
+
+def _gray_mean(img, lut):
+    """Mean luma of cv2.LUT(img, lut) without applying the LUT (per-channel histograms)."""
+    channels = img.reshape(-1, img.shape[-1])
+    if lut is None:
+        means = channels.mean(axis=0)
+    else:
+        table = lut.astype(np.float64)
+        means = [np.bincount(channels[:, c], minlength=256).dot(table) / channels.shape[0]
+                 for c in range(channels.shape[1])]
+    return float(np.dot(_LUMA, means))
+
+
+class ColorJitter(object):
+    """Randomly change the brightness, contrast, saturation and hue of a uint8 H x W x 3 array.
+
+    Factors are drawn as in transform.ColorJitter and applied in random order. Consecutive brightness and
+    contrast steps are merged into one LUT.
+
+    Args:
+        brightness (float): brightness_factor is chosen uniformly from [max(0, 1 - brightness), 1 + brightness].
+        contrast (float): contrast_factor is chosen uniformly from [max(0, 1 - contrast), 1 + contrast].
+        saturation (float): saturation_factor is chosen uniformly from [max(0, 1 - saturation), 1 + saturation].
+        hue(float): hue_factor is chosen uniformly from [-hue, hue]. Should be >=0 and <= 0.5.
+    """
+    def __init__(self, brightness=0, contrast=0, saturation=0, hue=0):
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self.hue = hue
+
+    @staticmethod
+    def get_params(brightness, contrast, saturation, hue):
+        """Returns the list of (name, factor) steps in the order they are applied."""
+        steps = []
+        if brightness > 0:
+            steps.append(('brightness', np.random.uniform(max(0, 1 - brightness), 1 + brightness)))
+        if contrast > 0:
+            steps.append(('contrast', np.random.uniform(max(0, 1 - contrast), 1 + contrast)))
+        if saturation > 0:
+            steps.append(('saturation', np.random.uniform(max(0, 1 - saturation), 1 + saturation)))
+        if hue > 0:
+            steps.append(('hue', np.random.uniform(-hue, hue)))
+        np.random.shuffle(steps)
+        return steps
+
+    def __call__(self, img):
+        """
+        Args:
+            img (numpy.ndarray): H x W x 3 uint8 image.
+
+        Returns:
+            numpy.ndarray: Color jittered image.
+        """
+        lut = None
+        for name, factor in self.get_params(self.brightness, self.contrast, self.saturation, self.hue):
+            if name == 'brightness':
+                step = _to_lut(_IDENTITY_LUT * factor)
+            elif name == 'contrast':
+                mean = _gray_mean(img, lut)
+                step = _to_lut((_IDENTITY_LUT - mean) * factor + mean)
+            else:
+                if lut is not None:
+                    img = cv2.LUT(img, lut)
+                    lut = None
+                if name == 'saturation':
+                    gray = cv2.cvtColor(cv2.cvtColor(img, cv2.COLOR_RGB2GRAY), cv2.COLOR_GRAY2RGB)
+                    img = cv2.addWeighted(img, factor, gray, 1 - factor, 0)
+                else:
+                    hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV_FULL)
+                    shift = int(round(factor * 255))
+                    hsv[..., 0] = cv2.LUT(hsv[..., 0], ((np.arange(256) + shift) % 256).astype(np.uint8))
+                    img = cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB_FULL)
+                continue
+            lut = step if lut is None else step[lut]
+        if lut is not None:
+            img = cv2.LUT(img, lut)
+        return img
+
+
+# RGB <-> YIQ; a hue shift is a rotation of the (I, Q) chroma plane
+_RGB2YIQ = torch.tensor([[0.299, 0.587, 0.114],
+                         [0.596, -0.274, -0.322],
+                         [0.211, -0.523, 0.312]])
+_YIQ2RGB = torch.inverse(_RGB2YIQ)
+
+
+class BatchAugment(torch.nn.Module):
+    """Per-sample random crop/rotate/flip and colour jitter of a collated batch, on the batch's device.
+
+    Input: N x 3 x H x W float tensor in [0, 255] (transform.ToTensor output). Output: N x 3 x size.
+    Crop parameters are drawn per sample (a crop larger than the image is clamped to it instead of re-drawn);
+    the colour steps are drawn per sample and applied in one random order per batch.
+
+    Args:
+        size: output (height, width)
+        scale, ratio, degrees, flip_prob: as RandomResizedCropRotateFlip
+        brightness, contrast, saturation, hue: as ColorJitter (hue shifts rotate the YIQ chroma plane)
+    """
+
+    def __init__(self, size, scale=(0.08, 1.0), ratio=(3. / 4., 4. / 3.), degrees=0, flip_prob=0.5,
+                 brightness=0, contrast=0, saturation=0, hue=0):
+        super(BatchAugment, self).__init__()
+        self.size = tuple(size) if isinstance(size, (tuple, list)) else (size, size)
+        self.scale = scale
+        self.ratio = ratio
+        self.degrees = _degrees_range(degrees)
+        self.flip_prob = flip_prob
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self.hue = hue
+
+    def _theta(self, n, in_h, in_w, device):
+        """N x 2 x 3 affine_grid thetas (output -> input, normalized coords, align_corners=False)."""
+        out_h, out_w = self.size
+        kw = dict(device=device, dtype=torch.float32)
+        area = in_h * in_w * torch.empty(n, **kw).uniform_(*self.scale)
+        log_ratio = torch.empty(n, **kw).uniform_(math.log(self.ratio[0]), math.log(self.ratio[1]))
+        aspect = torch.exp(log_ratio)
+        w = torch.sqrt(area * aspect).round().clamp(1, in_w)
+        h = torch.sqrt(area / aspect).round().clamp(1, in_h)
+        j = torch.floor(torch.rand(n, **kw) * (in_w - w + 1))
+        i = torch.floor(torch.rand(n, **kw) * (in_h - h + 1))
+        angle = torch.empty(n, **kw).uniform_(*self.degrees) * (math.pi / 180.)
+        flip = (torch.rand(n, **kw) < self.flip_prob).float()
+
+        # source -> output pixel map, as affine_matrix()
+        sx, sy = out_w / w, out_h / h
+        zeros, ones = torch.zeros(n, **kw), torch.ones(n, **kw)
+        crop = torch.stack([
+            torch.stack([sx, zeros, (0.5 - j) * sx - 0.5], 1),
+            torch.stack([zeros, sy, (0.5 - i) * sy - 0.5], 1),
+            torch.stack([zeros, zeros, ones], 1)], 1)
+        cx, cy = (out_w - 1) / 2., (out_h - 1) / 2.
+        a, b = torch.cos(angle), torch.sin(angle)
+        rot = torch.stack([
+            torch.stack([a, b, (1 - a) * cx - b * cy], 1),
+            torch.stack([-b, a, b * cx + (1 - a) * cy], 1),
+            torch.stack([zeros, zeros, ones], 1)], 1)
+        sign = 1 - 2 * flip
+        mirror = torch.stack([
+            torch.stack([sign, zeros, flip * (out_w - 1)], 1),
+            torch.stack([zeros, ones, zeros], 1),
+            torch.stack([zeros, zeros, ones], 1)], 1)
+        inverse = torch.inverse(mirror @ rot @ crop)
+
+        # normalized output -> output pixels, input pixels -> normalized input
+        from_out = torch.tensor([[out_w / 2., 0., (out_w - 1) / 2.],
+                                 [0., out_h / 2., (out_h - 1) / 2.],
+                                 [0., 0., 1.]], **kw)
+        to_in = torch.tensor([[2. / in_w, 0., 1. / in_w - 1.],
+                              [0., 2. / in_h, 1. / in_h - 1.]], **kw)
+        return to_in @ inverse @ from_out
+
+    def _color_matrix(self, images):
+        """Per-sample N x 3 x 3 matrix and N x 3 offset composing the jitter steps."""
+        n, device = images.size(0), images.device
+        kw = dict(device=device, dtype=torch.float32)
+        eye = torch.eye(3, **kw).expand(n, 3, 3)
+        luma = torch.tensor(_LUMA, **kw)
+        mat, off = eye.clone(), torch.zeros(n, 3, **kw)
+        means = images.mean(dim=(2, 3))
+
+        def factors(amount):
+            return torch.empty(n, 1, 1, **kw).uniform_(max(0, 1 - amount), 1 + amount)
+
+        steps = [name for name, amount in (('brightness', self.brightness), ('contrast', self.contrast),
+                                           ('saturation', self.saturation), ('hue', self.hue)) if amount > 0]
+        random.shuffle(steps)
+        for name in steps:
+            step_off = torch.zeros(n, 3, **kw)
+            if name == 'brightness':
+                step = eye * factors(self.brightness)
+            elif name == 'contrast':
+                f = factors(self.contrast)
+                gray_mean = ((mat @ means.unsqueeze(2)).squeeze(2) + off) @ luma
+                step = eye * f
+                step_off = ((1 - f.view(n, 1)) * gray_mean.view(n, 1)).expand(n, 3)
+            elif name == 'saturation':
+                f = factors(self.saturation)
+                step = eye * f + (1 - f) * luma.view(1, 1, 3).expand(n, 3, 3)
+            else:
+                theta = torch.empty(n, **kw).uniform_(-self.hue, self.hue) * (2 * math.pi)
+                c, s = torch.cos(theta), torch.sin(theta)
+                zeros, ones = torch.zeros(n, **kw), torch.ones(n, **kw)
+                rot = torch.stack([
+                    torch.stack([ones, zeros, zeros], 1),
+                    torch.stack([zeros, c, -s], 1),
+                    torch.stack([zeros, s, c], 1)], 1)
+                step = _YIQ2RGB.to(device) @ rot @ _RGB2YIQ.to(device)
+            off = (step @ off.unsqueeze(2)).squeeze(2) + step_off
+            mat = step @ mat
+        return mat, off
+
+    def forward(self, images):
+        images = images.float()
+        n, _, in_h, in_w = images.shape
+        theta = self._theta(n, in_h, in_w, images.device)
+        grid = F.affine_grid(theta, [n, images.size(1), self.size[0], self.size[1]], align_corners=False)
+        images = F.grid_sample(images, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+        mat, off = self._color_matrix(images)
+        images = torch.einsum('nij,njhw->nihw', mat, images) + off.view(n, 3, 1, 1)
+        return images.clamp_(0, 255)
@@ -7,6 +7,7 @@
 
 import cv2
 import torch
+import torch.nn.functional as F
 from torchvision import datasets
 import numpy as np
 
@@ -17,26 +18,32 @@ def opencv_loader(path):
 
 
 class DatasetFolderFT(datasets.ImageFolder):
+    """
+    ft_on_device=True: return the grayscale image (uint8, 1xHxW) instead of its FT map;
+    the trainer then builds the FT targets per batch with generate_FT_batch.
+    """
     def __init__(self, root, transform=None, target_transform=None,
-                 ft_width=10, ft_height=10, loader=opencv_loader):
+                 ft_width=10, ft_height=10, loader=opencv_loader, ft_on_device=False):
         super(DatasetFolderFT, self).__init__(root, transform, target_transform, loader)
         self.root = root
         self.ft_width = ft_width
         self.ft_height = ft_height
+        self.ft_on_device = ft_on_device
 
     def __getitem__(self, index):
         path, target = self.samples[index]
         sample = self.loader(path)
-        # generate the FT picture of the sample
-        ft_sample = generate_FT(sample)
         if sample is None:
             print('image is None --> ', path)
-        if ft_sample is None:
-            print('FT image is None -->', path)
         assert sample is not None
 
-        ft_sample = cv2.resize(ft_sample, (self.ft_width, self.ft_height))
-        ft_sample = torch.from_numpy(ft_sample).float()
+        if self.ft_on_device:
+            ft_sample = torch.from_numpy(cv2.cvtColor(sample, cv2.COLOR_BGR2GRAY))
+        else:
+            # generate the FT picture of the sample
+            ft_sample = generate_FT(sample)
+            ft_sample = cv2.resize(ft_sample, (self.ft_width, self.ft_height))
+            ft_sample = torch.from_numpy(ft_sample)
         ft_sample = torch.unsqueeze(ft_sample, 0)
 
         if self.transform is not None:
@@ -49,17 +56,42 @@ class DatasetFolderFT(datasets.ImageFolder):
         return sample, ft_sample, target
 
 
+def _fft_magnitude(gray):
+    """|fft2(gray)| from the half spectrum of rfft2 (real input: |F[u, v]| == |F[-u, -v]|)."""
+    height, width = gray.shape
+    half = np.abs(np.fft.rfft2(gray))
+    mag = np.empty((height, width), dtype=np.float32)
+    mag[:, :half.shape[1]] = half
+    cols = np.arange(half.shape[1], width)
+    if cols.size:
+        rows = -np.arange(height) % height
+        mag[:, cols] = half[rows][:, width - cols]
+    return mag
+
+
 def generate_FT(image):
+    """Log-magnitude spectrum (centered) of a BGR image, scaled to (0, 1] as float32."""
     image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    f = np.fft.fft2(image)
-    fshift = np.fft.fftshift(f)
-    fimg = np.log(np.abs(fshift)+1)
-    maxx = -1
-    minn = 100000
-    for i in range(len(fimg)):
-        if maxx < max(fimg[i]):
-            maxx = max(fimg[i])
-        if minn > min(fimg[i]):
-            minn = min(fimg[i])
-    fimg = (fimg - minn+1) / (maxx - minn+1)
-    return fimg
\ No newline at end of file
+    fimg = np.log1p(np.fft.fftshift(_fft_magnitude(image)))
+    minn = fimg.min()
+    maxx = fimg.max()
+    fimg -= minn - 1
+    fimg /= maxx - minn + 1
+    return fimg
+
+
+def generate_FT_batch(images, ft_height, ft_width):
+    """
+    Batched generate_FT on the images' device (torch.fft), resized to (ft_height, ft_width).
+    images: N x 1 x H x W grayscale or N x 3 x H x W BGR, any dtype. Returns N x 1 x ft_height x ft_width float32.
+    """
+    images = images.float()
+    if images.size(1) == 3:
+        # cv2.COLOR_BGR2GRAY weights, rounded to integers like the uint8 conversion
+        weights = images.new_tensor([0.114, 0.587, 0.299]).view(1, 3, 1, 1)
+        images = (images * weights).sum(dim=1, keepdim=True).round()
+    fimg = torch.log1p(torch.fft.fftshift(torch.fft.fft2(images).abs(), dim=(-2, -1)))
+    minn = fimg.amin(dim=(-2, -1), keepdim=True)
+    maxx = fimg.amax(dim=(-2, -1), keepdim=True)
+    fimg = (fimg - minn + 1) / (maxx - minn + 1)
+    return F.interpolate(fimg, size=(ft_height, ft_width), mode='bilinear', align_corners=False)
\ No newline at end of file
@@ -6,28 +6,78 @@
 # @Software : PyCharm
 
 from torch.utils.data import DataLoader
+from torch.utils.data.distributed import DistributedSampler
 from src.data_io.dataset_folder import DatasetFolderFT
+import os
+
+from src.data_io.packed_dataset import PackedDatasetFT, is_packed, stale_reason
 from src.data_io import transform as trans
+from src.data_io import array_transform
 
 
-def get_train_loader(conf):
-    train_transform = trans.Compose([
-        trans.ToPILImage(),
-        trans.RandomResizedCrop(size=tuple(conf.input_size),
-                                scale=(0.9, 1.1)),
-        trans.ColorJitter(brightness=0.4,
-                          contrast=0.4, saturation=0.4, hue=0.1),
-        trans.RandomRotation(10),
-        trans.RandomHorizontalFlip(),
+def get_train_transform(conf):
+    if conf.augment == 'pil':
+        return trans.Compose([
+            trans.ToPILImage(),
+            trans.RandomResizedCrop(size=tuple(conf.input_size),
+                                    scale=(0.9, 1.1)),
+            trans.ColorJitter(brightness=0.4,
+                              contrast=0.4, saturation=0.4, hue=0.1),
+            trans.RandomRotation(10),
+            trans.RandomHorizontalFlip(),
+            trans.ToTensor()
+        ])
+    if conf.augment == 'batch':
+        # augmented per batch by get_batch_augment
+        return trans.Compose([trans.ToTensor()])
+    return trans.Compose([
+        array_transform.RandomResizedCropRotateFlip(size=tuple(conf.input_size),
+                                                    scale=(0.9, 1.1), degrees=10),
+        array_transform.ColorJitter(brightness=0.4,
+                                    contrast=0.4, saturation=0.4, hue=0.1),
         trans.ToTensor()
     ])
+
+
+def get_batch_augment(conf):
+    """BatchAugment matching get_train_transform, or None unless conf.augment == 'batch'."""
+    if conf.augment != 'batch':
+        return None
+    return array_transform.BatchAugment(size=tuple(conf.input_size), scale=(0.9, 1.1), degrees=10,
+                                        brightness=0.4, contrast=0.4, saturation=0.4, hue=0.1)
+
+
+def get_train_loader(conf):
+    train_transform = get_train_transform(conf)
     root_path = '{}/{}'.format(conf.train_root_path, conf.patch_info)
-    trainset = DatasetFolderFT(root_path, train_transform,
-                               None, conf.ft_width, conf.ft_height)
+    packed_path = '{}/{}'.format(conf.packed_root_path, conf.patch_info)
+    use_packed = False
+    if conf.packed_root_path and is_packed(packed_path):
+        # the pack is a snapshot of root_path: fall back to the images if they changed since pack_dataset.py ran
+        reason = stale_reason(packed_path, root_path) if os.path.isdir(root_path) else None
+        if reason is None:
+            use_packed = True
+        else:
+            print('packed data in {} is stale ({}); rerun pack_dataset.py'.format(packed_path, reason))
+    if use_packed:
+        print('training data: packed shards in {}'.format(packed_path))
+        trainset = PackedDatasetFT(packed_path, train_transform,
+                                   None, conf.ft_width, conf.ft_height,
+                                   ft_on_device=conf.ft_on_device)
+    else:
+        print('training data: images in {}'.format(root_path))
+        trainset = DatasetFolderFT(root_path, train_transform,
+                                   None, conf.ft_width, conf.ft_height,
+                                   ft_on_device=conf.ft_on_device)
+    # one shard of the dataset per rank; TrainMain calls sampler.set_epoch to reshuffle each epoch
+    sampler = None
+    if conf.world_size > 1:
+        sampler = DistributedSampler(trainset, num_replicas=conf.world_size, rank=conf.rank, shuffle=True)
     train_loader = DataLoader(
         trainset,
-        batch_size=conf.batch_size,
-        shuffle=True,
+        batch_size=conf.batch_size // conf.world_size,
+        shuffle=sampler is None,
+        sampler=sampler,
         pin_memory=True,
-        num_workers=16)
+        num_workers=max(1, conf.num_workers // conf.local_world_size))
     return train_loader
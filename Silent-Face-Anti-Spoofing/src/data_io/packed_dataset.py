@@ -0,0 +1,166 @@
+"""
+Packed training shards: decoded patches and their FT maps in memory-mapped .npy files.
+
+Layout of <packed_root>/<patch_info>/:
+    images.npy   uint8   N x H x W x 3  (BGR, as cv2.imread)
+    ft.npy       float16 N x ft_height x ft_width  (generate_FT, resized)
+    labels.npy   int64   N
+    index.json   shapes, class_to_idx and the source path of every sample (row i <-> samples[i])
+
+Built once by pack_dataset.py; PackedDatasetFT then serves samples straight from the page cache (no JPEG decode,
+no FFT), and DataLoader workers share those pages instead of each holding a copy.
+"""
+
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from torchvision import datasets
+
+from src.data_io.dataset_folder import generate_FT
+
+PACK_VERSION = 1
+INDEX_FILE = 'index.json'
+
+
+def _load_sample(args):
+    path, width, height, ft_width, ft_height = args
+    img = cv2.imread(path)
+    if img is None:
+        raise IOError('image is None --> {}'.format(path))
+    # FT of the image as stored on disk, like DatasetFolderFT
+    ft = cv2.resize(generate_FT(img), (ft_width, ft_height))
+    if img.shape[:2] != (height, width):
+        img = cv2.resize(img, (width, height))
+    return img, ft.astype(np.float16)
+
+
+def pack_folder(src_root, out_dir, width, height, ft_width, ft_height, workers=None, chunk_size=64):
+    """
+    Pack an ImageFolder tree (<src_root>/<label>/*.jpg) into out_dir. Patches not already width x height are resized.
+    Written to a temporary directory and renamed at the end, so out_dir is never half-written.
+    """
+    folder = datasets.ImageFolder(src_root, loader=lambda p: p)
+    count = len(folder.samples)
+    tmp_dir = out_dir.rstrip('/') + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    images = np.lib.format.open_memmap(os.path.join(tmp_dir, 'images.npy'), mode='w+',
+                                       dtype=np.uint8, shape=(count, height, width, 3))
+    fts = np.lib.format.open_memmap(os.path.join(tmp_dir, 'ft.npy'), mode='w+',
+                                    dtype=np.float16, shape=(count, ft_height, ft_width))
+    labels = np.asarray([target for _, target in folder.samples], dtype=np.int64)
+    np.save(os.path.join(tmp_dir, 'labels.npy'), labels)
+
+    jobs = [(path, width, height, ft_width, ft_height) for path, _ in folder.samples]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for i, (img, ft) in enumerate(pool.map(_load_sample, jobs, chunksize=chunk_size)):
+            images[i] = img
+            fts[i] = ft
+    images.flush()
+    fts.flush()
+    del images, fts
+
+    index = {
+        'version': PACK_VERSION,
+        'count': count,
+        'image_shape': [height, width, 3],
+        'ft_shape': [ft_height, ft_width],
+        'class_to_idx': folder.class_to_idx,
+        'samples': [os.path.relpath(path, src_root) for path, _ in folder.samples],
+    }
+    with open(os.path.join(tmp_dir, INDEX_FILE), 'w') as f:
+        json.dump(index, f)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.rename(tmp_dir, out_dir)
+    return index
+
+
+def is_packed(root):
+    return os.path.isfile(os.path.join(root, INDEX_FILE))
+
+
+def stale_reason(root, src_root):
+    """
+    Why the pack in root no longer matches the ImageFolder tree src_root, or None if it does.
+    Compares the sample list in index.json and the image mtimes against the index.
+    """
+    with open(os.path.join(root, INDEX_FILE)) as f:
+        index = json.load(f)
+    if index.get('version') != PACK_VERSION:
+        return 'pack version {} (expected {})'.format(index.get('version'), PACK_VERSION)
+    folder = datasets.ImageFolder(src_root, loader=lambda p: p)
+    if folder.class_to_idx != index['class_to_idx']:
+        return 'classes changed'
+    samples = [os.path.relpath(path, src_root) for path, _ in folder.samples]
+    if samples != index['samples']:
+        return '{} samples in {}, {} packed'.format(len(samples), src_root, index['count'])
+    packed_at = os.path.getmtime(os.path.join(root, INDEX_FILE))
+    for path, _ in folder.samples:
+        if os.path.getmtime(path) > packed_at:
+            return '{} changed after packing'.format(path)
+    return None
+
+
+class PackedDatasetFT(Dataset):
+    """
+    Drop-in for DatasetFolderFT over a packed directory: returns (sample, ft_sample, target).
+    The .npy files are mapped lazily in each process (mappings are not pickled into DataLoader workers).
+    """
+    def __init__(self, root, transform=None, target_transform=None,
+                 ft_width=10, ft_height=10, ft_on_device=False):
+        with open(os.path.join(root, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        if self.index.get('version') != PACK_VERSION:
+            raise ValueError('Unsupported pack version in {}'.format(root))
+        if tuple(self.index['ft_shape']) != (ft_height, ft_width):
+            raise ValueError('{} was packed with FT size {}, expected {}'.format(
+                root, self.index['ft_shape'], [ft_height, ft_width]))
+        self.root = root
+        self.transform = transform
+        self.target_transform = target_transform
+        self.ft_on_device = ft_on_device
+        self.class_to_idx = self.index['class_to_idx']
+        self.classes = sorted(self.class_to_idx, key=self.class_to_idx.get)
+        self.targets = np.load(os.path.join(root, 'labels.npy')).tolist()
+        self._images = None
+        self._fts = None
+
+    def __len__(self):
+        return self.index['count']
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_images'] = None
+        state['_fts'] = None
+        return state
+
+    def _open(self):
+        self._images = np.load(os.path.join(self.root, 'images.npy'), mmap_mode='r')
+        self._fts = np.load(os.path.join(self.root, 'ft.npy'), mmap_mode='r')
+
+    def __getitem__(self, index):
+        if self._images is None:
+            self._open()
+        sample = self._images[index]
+        target = self.targets[index]
+
+        if self.ft_on_device:
+            ft_sample = torch.from_numpy(cv2.cvtColor(sample, cv2.COLOR_BGR2GRAY))
+        else:
+            ft_sample = torch.from_numpy(self._fts[index].astype(np.float32))
+        ft_sample = torch.unsqueeze(ft_sample, 0)
+
+        if self.transform is not None:
+            sample = self.transform(sample)
+        else:
+            sample = np.array(sample)
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+        return sample, ft_sample, target
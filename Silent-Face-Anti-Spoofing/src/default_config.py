@@ -25,7 +25,10 @@ def get_default_config():
     conf.gamma = 0.1
     conf.epochs = 25
     conf.momentum = 0.9
+    # global batch size; each of the world_size processes loads batch_size // world_size
     conf.batch_size = 1024
+    # DataLoader workers per node, split across the local training processes
+    conf.num_workers = 16
 
     # model
     conf.num_classes = 3
@@ -34,10 +37,37 @@ def get_default_config():
 
     # dataset
     conf.train_root_path = './datasets/rgb_image'
+    # packed shards from pack_dataset.py (<packed_root_path>/<patch_info>); used instead of train_root_path if present
+    conf.packed_root_path = './datasets/packed'
+    # training augmentation: "numpy" (cv2 on arrays in the loader), "batch" (on conf.device after collation)
+    # or "pil" (the original PIL transforms)
+    conf.augment = 'numpy'
+    # compute the Fourier targets per batch on conf.device (torch.fft) instead of per sample in the loader
+    conf.ft_on_device = False
 
     # save file path
     conf.snapshot_dir_path = './saved_logs/snapshot'
 
+    # speed options: autocast to amp_dtype ("bfloat16" on CPU/recent GPUs, "float16" uses a GradScaler on CUDA),
+    # channels_last memory format, torch.compile of the training forward
+    conf.amp = False
+    conf.amp_dtype = 'bfloat16'
+    conf.channels_last = False
+    conf.compile = False
+
+    # distributed training (train.py --nproc N or torchrun): DistributedDataParallel over dist_backend;
+    # rank / world_size / local_rank / local_world_size are filled in by the launcher
+    conf.dist_backend = 'gloo'
+    conf.rank = 0
+    conf.world_size = 1
+    conf.local_rank = 0
+    conf.local_world_size = 1
+    # training state file to resume from, or "latest" for the newest one in the snapshot dir
+    conf.resume = None
+    # training-state files kept in the snapshot dir (0 keeps all); written by a background thread if async
+    conf.keep_checkpoints = 5
+    conf.async_checkpoint = True
+
     # log path
     conf.log_path = './saved_logs/jobs'
     # tensorboard
@@ -51,6 +81,7 @@ def get_default_config():
 def update_config(args, conf):
     conf.devices = args.devices
     conf.patch_info = args.patch_info
+    conf.resume = getattr(args, 'resume', None)
     w_input, h_input = get_width_height(args.patch_info)
     conf.input_size = [h_input, w_input]
     conf.kernel_size = get_kernel(h_input, w_input)
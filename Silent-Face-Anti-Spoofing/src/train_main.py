@@ -6,14 +6,17 @@
 # @Software : PyCharm
 
 import torch
+import torch.distributed as dist
 from torch import optim
 from torch.nn import CrossEntropyLoss, MSELoss
 from tqdm import tqdm
 from tensorboardX import SummaryWriter
 
 from src.utility import get_time
+from src.checkpoint import AsyncCheckpointer, to_cpu, get_rng_state, set_rng_state, latest_state
 from src.model_lib.MultiFTNet import MultiFTNet
-from src.data_io.dataset_loader import get_train_loader
+from src.data_io.dataset_loader import get_train_loader, get_batch_augment
+from src.data_io.dataset_folder import generate_FT_batch
 
 
 class TrainMain:
@@ -23,16 +26,31 @@ class TrainMain:
         self.save_every = conf.save_every
         self.step = 0
         self.start_epoch = 0
+        # only rank 0 logs and checkpoints under DistributedDataParallel
+        self.is_main = conf.rank == 0
         self.train_loader = get_train_loader(self.conf)
+        self.batch_augment = get_batch_augment(self.conf)
 
     def train_model(self):
         self._init_model_param()
-        self._train_stage()
+        try:
+            self._train_stage()
+        finally:
+            if self.checkpointer is not None:
+                self.checkpointer.wait()
 
     def _init_model_param(self):
         self.cls_criterion = CrossEntropyLoss()
         self.ft_criterion = MSELoss()
         self.model = self._define_network()
+        # compiled view shares parameters with self.model; state_dict keys stay unprefixed
+        self.forward_model = torch.compile(self.model) if self.conf.compile else self.model
+        self.device_type = torch.device(self.conf.device).type
+        self.amp_dtype = getattr(torch, self.conf.amp_dtype)
+        self.scaler = None
+        if self.conf.amp and self.amp_dtype == torch.float16 and self.device_type == 'cuda':
+            self.scaler = torch.cuda.amp.GradScaler()
+        self.memory_format = torch.channels_last if self.conf.channels_last else torch.contiguous_format
         self.optimizer = optim.SGD(self.model.module.parameters(),
                                    lr=self.conf.lr,
                                    weight_decay=5e-4,
@@ -41,9 +59,23 @@ class TrainMain:
         self.schedule_lr = optim.lr_scheduler.MultiStepLR(
             self.optimizer, self.conf.milestones, self.conf.gamma, - 1)
 
-        print("lr: ", self.conf.lr)
-        print("epochs: ", self.conf.epochs)
-        print("milestones: ", self.conf.milestones)
+        self.checkpointer = None
+        if self.is_main:
+            self.checkpointer = AsyncCheckpointer(self.conf.model_path, keep=self.conf.keep_checkpoints,
+                                                  async_save=self.conf.async_checkpoint)
+        resume = self.conf.resume
+        if resume == 'latest':
+            resume = latest_state(self.conf.model_path)
+            if resume is None and self.is_main:
+                print('no training state in {}, starting from scratch'.format(self.conf.model_path))
+        if resume:
+            self._load_state(resume)
+        self.epoch = self.start_epoch
+
+        if self.is_main:
+            print("lr: ", self.conf.lr)
+            print("epochs: ", self.conf.epochs)
+            print("milestones: ", self.conf.milestones)
 
     def _train_stage(self):
         self.model.train()
@@ -53,16 +85,21 @@ class TrainMain:
         running_loss_ft = 0.
         is_first = True
         for e in range(self.start_epoch, self.conf.epochs):
-            if is_first:
+            self.epoch = e
+            if is_first and self.is_main:
                 self.writer = SummaryWriter(self.conf.log_path)
                 is_first = False
-            print('epoch {} started'.format(e))
-            print("lr: ", self.schedule_lr.get_lr())
+            if hasattr(self.train_loader.sampler, 'set_epoch'):
+                self.train_loader.sampler.set_epoch(e)
+            if self.is_main:
+                print('epoch {} started'.format(e))
+                print("lr: ", self.schedule_lr.get_last_lr())
 
-            for sample, ft_sample, target in tqdm(iter(self.train_loader)):
+            for sample, ft_sample, target in tqdm(iter(self.train_loader), disable=not self.is_main):
                 imgs = [sample, ft_sample]
                 labels = target
 
+                # metrics stay on the device; the host syncs once per board_loss_every steps
                 loss, acc, loss_cls, loss_ft = self._train_batch_data(imgs, labels)
                 running_loss_cls += loss_cls
                 running_loss_ft += loss_ft
@@ -72,21 +109,20 @@ class TrainMain:
                 self.step += 1
 
                 if self.step % self.board_loss_every == 0 and self.step != 0:
-                    loss_board = running_loss / self.board_loss_every
-                    self.writer.add_scalar(
-                        'Training/Loss', loss_board, self.step)
-                    acc_board = running_acc / self.board_loss_every
-                    self.writer.add_scalar(
-                        'Training/Acc', acc_board, self.step)
-                    lr = self.optimizer.param_groups[0]['lr']
-                    self.writer.add_scalar(
-                        'Training/Learning_rate', lr, self.step)
-                    loss_cls_board = running_loss_cls / self.board_loss_every
-                    self.writer.add_scalar(
-                        'Training/Loss_cls', loss_cls_board, self.step)
-                    loss_ft_board = running_loss_ft / self.board_loss_every
-                    self.writer.add_scalar(
-                        'Training/Loss_ft', loss_ft_board, self.step)
+                    loss_board, acc_board, loss_cls_board, loss_ft_board = self._reduce_board(
+                        running_loss, running_acc, running_loss_cls, running_loss_ft)
+                    if self.is_main:
+                        self.writer.add_scalar(
+                            'Training/Loss', loss_board, self.step)
+                        self.writer.add_scalar(
+                            'Training/Acc', acc_board, self.step)
+                        lr = self.optimizer.param_groups[0]['lr']
+                        self.writer.add_scalar(
+                            'Training/Learning_rate', lr, self.step)
+                        self.writer.add_scalar(
+                            'Training/Loss_cls', loss_cls_board, self.step)
+                        self.writer.add_scalar(
+                            'Training/Loss_ft', loss_ft_board, self.step)
 
                     running_loss = 0.
                     running_acc = 0.
@@ -96,24 +132,48 @@ class TrainMain:
                     time_stamp = get_time()
                     self._save_state(time_stamp, extra=self.conf.job_name)
             self.schedule_lr.step()
+            self.epoch = e + 1
 
         time_stamp = get_time()
         self._save_state(time_stamp, extra=self.conf.job_name)
-        self.writer.close()
+        if self.is_main:
+            self.writer.close()
 
-    def _train_batch_data(self, imgs, labels):
-        self.optimizer.zero_grad()
-        labels = labels.to(self.conf.device)
-        embeddings, feature_map = self.model.forward(imgs[0].to(self.conf.device))
-
-        loss_cls = self.cls_criterion(embeddings, labels)
-        loss_fea = self.ft_criterion(feature_map, imgs[1].to(self.conf.device))
+    def _reduce_board(self, *running):
+        """Mean of the running sums over board_loss_every steps (and over ranks), as host floats."""
+        stats = torch.stack([torch.as_tensor(v, dtype=torch.float32).reshape(()) for v in running])
+        if dist.is_initialized():
+            dist.all_reduce(stats)
+            stats /= dist.get_world_size()
+        return (stats / self.board_loss_every).tolist()
 
-        loss = 0.5*loss_cls + 0.5*loss_fea
-        acc = self._get_accuracy(embeddings, labels)[0]
-        loss.backward()
-        self.optimizer.step()
-        return loss.item(), acc, loss_cls.item(), loss_fea.item()
+    def _train_batch_data(self, imgs, labels):
+        """One optimizer step. Returns detached device tensors (loss, acc, loss_cls, loss_ft)."""
+        self.optimizer.zero_grad(set_to_none=True)
+        labels = labels.to(self.conf.device, non_blocking=True)
+        sample = imgs[0].to(self.conf.device, non_blocking=True)
+        if self.batch_augment is not None:
+            sample = self.batch_augment(sample)
+        sample = sample.contiguous(memory_format=self.memory_format)
+        ft_target = imgs[1].to(self.conf.device, non_blocking=True)
+        if self.conf.ft_on_device:
+            ft_target = generate_FT_batch(ft_target, self.conf.ft_height, self.conf.ft_width)
+
+        with torch.autocast(self.device_type, dtype=self.amp_dtype, enabled=self.conf.amp):
+            embeddings, feature_map = self.forward_model(sample)
+            loss_cls = self.cls_criterion(embeddings, labels)
+            loss_fea = self.ft_criterion(feature_map.float(), ft_target)
+            loss = 0.5*loss_cls + 0.5*loss_fea
+
+        if self.scaler is not None:
+            self.scaler.scale(loss).backward()
+            self.scaler.step(self.optimizer)
+            self.scaler.update()
+        else:
+            loss.backward()
+            self.optimizer.step()
+        acc = self._get_accuracy(embeddings.detach(), labels)[0]
+        return loss.detach(), acc, loss_cls.detach(), loss_fea.detach()
 
     def _define_network(self):
         param = {
@@ -122,9 +182,14 @@ class TrainMain:
             'embedding_size': self.conf.embedding_size,
             'conv6_kernel': self.conf.kernel_size}
 
-        model = MultiFTNet(**param).to(self.conf.device)
-        model = torch.nn.DataParallel(model, self.conf.devices)
-        model.to(self.conf.device)
+        model = MultiFTNet(**param).to(self.conf.device, memory_format=(
+            torch.channels_last if self.conf.channels_last else torch.contiguous_format))
+        if self.conf.world_size > 1:
+            device_ids = [self.conf.devices[0]] if torch.device(self.conf.device).type == 'cuda' else None
+            model = torch.nn.parallel.DistributedDataParallel(model, device_ids=device_ids)
+        else:
+            model = torch.nn.DataParallel(model, self.conf.devices)
+            model.to(self.conf.device)
         return model
 
     def _get_accuracy(self, output, target, topk=(1,)):
@@ -141,6 +206,42 @@ class TrainMain:
         return ret
 
     def _save_state(self, time_stamp, extra=None):
+        # every rank's RNG goes into the checkpoint; all ranks reach the same step, so the gather is safe
+        rng_states = [get_rng_state()]
+        if dist.is_initialized():
+            rng_states = [None] * dist.get_world_size()
+            dist.all_gather_object(rng_states, get_rng_state())
+        if not self.is_main:
+            return
         save_path = self.conf.model_path
-        torch.save(self.model.state_dict(), save_path + '/' +
-                   ('{}_{}_model_iter-{}.pth'.format(time_stamp, extra, self.step)))
+        # copied to the CPU here; the checkpointer thread writes them while training continues
+        model_state = to_cpu(self.model.state_dict())
+        # training state for conf.resume; a run resumed mid-epoch restarts that epoch
+        state = {
+            'model': model_state,
+            'optimizer': to_cpu(self.optimizer.state_dict()),
+            'scheduler': self.schedule_lr.state_dict(),
+            'step': self.step,
+            'epoch': self.epoch,
+            'rng': rng_states,
+        }
+        if self.scaler is not None:
+            state['scaler'] = self.scaler.state_dict()
+        self.checkpointer.save([
+            (save_path + '/' + ('{}_{}_model_iter-{}.pth'.format(time_stamp, extra, self.step)), model_state),
+            (save_path + '/' + ('{}_{}_state_iter-{}.pth'.format(time_stamp, extra, self.step)), state),
+        ])
+
+    def _load_state(self, path):
+        state = torch.load(path, map_location='cpu')
+        self.model.load_state_dict(state['model'])
+        self.optimizer.load_state_dict(state['optimizer'])
+        self.schedule_lr.load_state_dict(state['scheduler'])
+        if self.scaler is not None and 'scaler' in state:
+            self.scaler.load_state_dict(state['scaler'])
+        if 'rng' in state:
+            set_rng_state(state['rng'][self.conf.rank % len(state['rng'])])
+        self.step = state['step']
+        self.start_epoch = state['epoch']
+        if self.is_main:
+            print('resumed from {} (step {}, epoch {})'.format(path, self.step, self.start_epoch))
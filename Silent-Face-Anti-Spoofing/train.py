@@ -7,6 +7,11 @@
 
 import argparse
 import os
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
 from src.train_main import TrainMain
 from src.default_config import get_default_config, update_config
 
@@ -18,6 +23,11 @@ def parse_args():
     parser.add_argument("--device_ids", type=str, default="1", help="which gpu id, 0123")
     parser.add_argument("--patch_info", type=str, default="1_80x80",
                         help="[org_1_80x60 / 1_80x80 / 2.7_80x80 / 4_80x80]")
+    parser.add_argument("--nproc", type=int, default=1,
+                        help="training processes on this node (DistributedDataParallel when > 1); "
+                             "ignored under torchrun")
+    parser.add_argument("--resume", type=str, nargs='?', const='latest', default=None,
+                        help="training state file to resume from (no value: the latest in the snapshot dir)")
     args = parser.parse_args()
     cuda_devices = [int(elem) for elem in args.device_ids]
     os.environ["CUDA_VISIBLE_DEVICES"] = ','.join(map(str, cuda_devices))
@@ -25,10 +35,48 @@ def parse_args():
     return args
 
 
+def init_distributed(conf, local_rank, local_world_size):
+    """
+    Join the process group and bind this process to its device. Rank and world size come from the
+    torchrun environment when present, otherwise from the single-node --nproc spawn.
+    """
+    os.environ.setdefault('MASTER_ADDR', '127.0.0.1')
+    os.environ.setdefault('MASTER_PORT', '29500')
+    rank = int(os.environ.get('RANK', local_rank))
+    world_size = int(os.environ.get('WORLD_SIZE', local_world_size))
+    dist.init_process_group(conf.dist_backend, rank=rank, world_size=world_size)
+
+    conf.rank = rank
+    conf.world_size = world_size
+    conf.local_rank = local_rank
+    conf.local_world_size = local_world_size
+    if torch.cuda.is_available():
+        conf.devices = [conf.devices[local_rank % len(conf.devices)]]
+        conf.device = "cuda:{}".format(conf.devices[0])
+        torch.cuda.set_device(conf.devices[0])
+    else:
+        # share the cores between the local ranks instead of every rank spinning up all of them
+        torch.set_num_threads(max(1, os.cpu_count() // local_world_size))
+    return conf
+
+
+def train_worker(local_rank, conf, local_world_size):
+    if local_world_size > 1 or 'WORLD_SIZE' in os.environ:
+        conf = init_distributed(conf, local_rank, local_world_size)
+    trainer = TrainMain(conf)
+    trainer.train_model()
+    if dist.is_initialized():
+        dist.destroy_process_group()
+
+
 if __name__ == "__main__":
     args = parse_args()
     conf = get_default_config()
     conf = update_config(args, conf)
-    trainer = TrainMain(conf)
-    trainer.train_model()
-
+    if 'LOCAL_RANK' in os.environ:
+        # launched by torchrun: one process per rank already
+        train_worker(int(os.environ['LOCAL_RANK']), conf, int(os.environ.get('LOCAL_WORLD_SIZE', 1)))
+    elif args.nproc > 1:
+        mp.spawn(train_worker, args=(conf, args.nproc), nprocs=args.nproc)
+    else:
+        train_worker(0, conf, 1)
@@ -50,6 +50,28 @@ class Settings(BaseSettings):
     # NEVER enable this in production.
     fido2_allow_any_origin: bool = False
 
+    # Short-lived auth flow state (FIDO2 begin/complete, device-auth challenges, pending transactions).
+    # Abandoned entries expire after the TTL; each store holds at most auth_state_max_entries (oldest evicted).
+    auth_state_ttl_seconds: int = 300
+    transaction_state_ttl_seconds: int = 600
+    auth_state_max_entries: int = 10_000
+    # Where that state lives: "local" (per process; single worker only), "redis" (shared via REDIS_URL) or
+    # "token" (challenges are sealed with AUTH_STATE_SECRET, no server-side state). More than one worker needs
+    # redis, or token with REDIS_URL (its replay filters live there); per-process stores refuse to start otherwise.
+    auth_state_backend: str = "local"
+    redis_url: str = ""
+    auth_state_secret: str = ""
+    # uvicorn worker processes (run-local.sh exports WORKERS), used to refuse per-process state with WORKERS > 1.
+    workers: int = 1
+    # Parsed FIDO2 credentials are cached per customer for this long (per process; cleared on registration).
+    fido2_credential_cache_ttl_seconds: int = 60
+    # Parsed device-auth Ed25519 keys are cached per customer for this long (per process; cleared on register).
+    device_key_cache_ttl_seconds: int = 60
+
+    # Idempotency-Key on POST /api/transactions/transfer: outcomes are replayed for this long (same store as auth state).
+    idempotency_ttl_seconds: int = 86_400
+    idempotency_max_entries: int = 100_000
+
     # Android Digital Asset Links (for passkeys). Comma-separated SHA256 cert fingerprints (e.g. "AB:CD:...")
     android_package_name: str = "com.blackgram.spoofdetectionmobile"
     android_sha256_cert_fingerprints: str = ""
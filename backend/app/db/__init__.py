@@ -1,5 +1,6 @@
 """Database package."""
 
+from app.db.backend import StorageBackend, get_storage_backend
 from app.db.firestore_client import get_firestore_client, FirestoreClient
 
-__all__ = ["get_firestore_client", "FirestoreClient"]
+__all__ = ["get_firestore_client", "FirestoreClient", "StorageBackend", "get_storage_backend"]
@@ -0,0 +1,302 @@
+"""
+Asynchronous, batched writer for audit logs and device-auth events.
+
+Request handlers call submit(), which assigns the record id and enqueues it on a bounded in-process queue; a
+background thread drains the queue into StorageBackend.write_audit_batch() in batches of up to BATCH_MAX records
+(one Firestore batch commit each).
+
+Durability: a batch the sink rejects, and any record that cannot be queued within BLOCK_TIMEOUT_SEC (backpressure:
+the caller waits briefly for space first), is appended to a JSONL spool file under backend/data/. The spool is
+replayed once the sink accepts writes again, and on the next start. Ids are fixed at submit time and the sinks
+write by id, so replaying a batch that did reach the sink does not duplicate it. close() drains the queue
+(spooling whatever the sink does not take in time) and runs at shutdown.
+
+Every worker process shares the spool file. Appends and claims are serialised across processes with an flock on
+<spool>.lock. A worker replays by moving the spool to its own audit_spool.replay.<pid>.jsonl, and replay files
+left by dead processes are put back into the spool at start and before each replay.
+
+Set AUDIT_WRITER=sync to write inline instead. stats() is reported under "audit_writer" in /health.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: the in-process lock only, run a single worker
+    fcntl = None
+
+from app.db.backend import AUDIT_COLLECTIONS, AuditRecord
+
+logger = logging.getLogger(__name__)
+
+_DATA_DIR = Path(__file__).resolve().parent.parent.parent / "data"
+
+QUEUE_MAX = 10_000
+BATCH_MAX = 500
+FLUSH_INTERVAL_SEC = 0.2
+BLOCK_TIMEOUT_SEC = 0.05
+RETRY_BACKOFF_SEC = 2.0
+
+_STOP = object()
+
+
+class AuditWriter:
+    """Bounded queue + writer thread + spool file. Thread-safe."""
+
+    def __init__(
+        self,
+        sink: Callable[[list[AuditRecord]], None],
+        spool_path: Path = _DATA_DIR / "audit_spool.jsonl",
+        queue_max: int = QUEUE_MAX,
+        batch_max: int = BATCH_MAX,
+        flush_interval: float = FLUSH_INTERVAL_SEC,
+        block_timeout: float = BLOCK_TIMEOUT_SEC,
+    ):
+        self._sink = sink
+        self._spool_path = Path(spool_path)
+        self._lock_path = self._spool_path.with_name(self._spool_path.name + ".lock")
+        self._replay_path = self._spool_path.with_name(f"{self._spool_path.stem}.replay.{os.getpid()}.jsonl")
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_max)
+        self._batch_max = batch_max
+        self._flush_interval = flush_interval
+        self._block_timeout = block_timeout
+        self._spool_lock = threading.Lock()
+        self._closed = False
+        self._retry_at = 0.0
+        self.submitted = 0
+        self.written = 0
+        self.batches = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.sink_errors = 0
+        self.last_batch_ms = 0.0
+        with self._spool_locked():
+            self._adopt_orphans_locked()  # picked up by the first replay
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    # --- Producer side ---
+
+    def submit(self, collection: str, record: dict[str, Any]) -> str:
+        """Queue a record for writing; returns its id. Never drops: spools if the queue stays full."""
+        if collection not in AUDIT_COLLECTIONS:
+            raise ValueError(f"Unknown audit collection {collection!r}")
+        record_id = str(uuid.uuid4())
+        item = (collection, record_id, record)
+        self.submitted += 1
+        if self._closed:
+            self._spool([item])
+            return record_id
+        try:
+            self._queue.put(item, timeout=self._block_timeout)
+        except queue.Full:
+            self._spool([item])
+        return record_id
+
+    # --- Spool ---
+
+    @contextmanager
+    def _spool_locked(self) -> Iterator[None]:
+        """Exclusive access to the spool for this thread and, via flock, for the other worker processes."""
+        with self._spool_lock:
+            self._spool_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self._lock_path, "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)  # released when the file is closed
+                yield
+
+    def _spool(self, items: list[AuditRecord], new: bool = True) -> None:
+        lines = "".join(json.dumps(list(item), default=str) + "\n" for item in items)
+        with self._spool_locked():
+            with open(self._spool_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+        if new:
+            self.spooled += len(items)
+
+    def _read_spool(self, path: Path) -> list[AuditRecord]:
+        items = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    collection, record_id, record = json.loads(line)
+                    items.append((collection, record_id, record))
+                except ValueError:
+                    logger.warning("Skipping unreadable audit spool line")
+        return items
+
+    def _orphaned_replays(self) -> list[Path]:
+        """Replay files of processes that are gone (they died mid-replay); includes the pre-pid replay.jsonl."""
+        orphans = []
+        for path in self._spool_path.parent.glob(f"{self._spool_path.stem}.replay.*jsonl"):
+            pid = path.name[len(self._spool_path.stem) + len(".replay."):-len(".jsonl")]
+            if path != self._replay_path and not (pid.isdigit() and _pid_alive(int(pid))):
+                orphans.append(path)
+        return orphans
+
+    def _adopt_orphans_locked(self) -> None:
+        for orphan in self._orphaned_replays():
+            with open(orphan, encoding="utf-8") as src, open(self._spool_path, "a", encoding="utf-8") as dst:
+                dst.write(src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+            orphan.unlink()
+            logger.info("Audit spool: took over %s", orphan.name)
+
+    def _replay_spool(self) -> None:
+        """Move the spool aside and write it to the sink; whatever fails goes back to the spool."""
+        with self._spool_locked():
+            self._adopt_orphans_locked()
+            if not self._replay_path.exists():
+                if not self._spool_path.exists():
+                    return
+                os.replace(self._spool_path, self._replay_path)
+        items = self._read_spool(self._replay_path)
+        for start in range(0, len(items), self._batch_max):
+            batch = items[start:start + self._batch_max]
+            if not self._write(batch, spool_on_error=False):
+                self._spool(items[start:], new=False)
+                break
+            self.replayed += len(batch)
+        self._replay_path.unlink(missing_ok=True)
+        if self.replayed:
+            logger.info("Audit spool replayed (%d record(s) total)", self.replayed)
+
+    # --- Writer thread ---
+
+    def _write(self, batch: list[AuditRecord], spool_on_error: bool = True) -> bool:
+        started = time.perf_counter()
+        try:
+            self._sink(batch)
+        except Exception as e:
+            self.sink_errors += 1
+            self._retry_at = time.monotonic() + RETRY_BACKOFF_SEC
+            logger.warning("Audit sink write of %d record(s) failed: %s", len(batch), e)
+            if spool_on_error:
+                self._spool(batch)
+            return False
+        self.last_batch_ms = (time.perf_counter() - started) * 1000
+        self.written += len(batch)
+        self.batches += 1
+        return True
+
+    def _spool_pending(self) -> bool:
+        return self._spool_path.exists() or self._replay_path.exists()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=self._flush_interval)
+            except queue.Empty:
+                first = None
+            batch: list[AuditRecord] = []
+            if first is _STOP:
+                stopping = True
+            elif first is not None:
+                batch.append(first)
+            while len(batch) < self._batch_max:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    continue
+                batch.append(item)
+            if batch:
+                if time.monotonic() < self._retry_at:
+                    self._spool(batch)  # sink is failing: keep the queue moving
+                else:
+                    self._write(batch)
+            if self._spool_pending() and time.monotonic() >= self._retry_at:
+                self._replay_spool()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Stop accepting queued work, drain the queue to the sink (or spool) and stop the thread."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftover.append(item)
+        if leftover:
+            self._spool(leftover)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_max": self._queue.maxsize,
+            "submitted": self.submitted,
+            "written": self.written,
+            "batches": self.batches,
+            "last_batch_ms": round(self.last_batch_ms, 2),
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "spool_pending": self._spool_pending(),
+            "sink_errors": self.sink_errors,
+        }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_writer: Optional[AuditWriter] = None
+_writer_lock = threading.Lock()
+
+
+def audit_writer_enabled() -> bool:
+    """AUDIT_WRITER env var: "async" (default) or "sync"."""
+    return (os.environ.get("AUDIT_WRITER") or "async").strip().lower() != "sync"
+
+
+def get_audit_writer() -> Optional[AuditWriter]:
+    """Process-wide writer bound to the configured storage backend, or None when AUDIT_WRITER=sync."""
+    global _writer
+    if not audit_writer_enabled():
+        return None
+    with _writer_lock:
+        if _writer is None:
+            from app.db.backend import get_storage_backend
+
+            _writer = AuditWriter(get_storage_backend().write_audit_batch)
+            atexit.register(_writer.close)
+        return _writer
+
+
+def shutdown_audit_writer() -> None:
+    """Flush and stop the process-wide writer (app shutdown)."""
+    if _writer is not None:
+        _writer.close()
+
+
+def audit_writer_stats() -> Optional[dict[str, Any]]:
+    return _writer.stats() if _writer is not None else None
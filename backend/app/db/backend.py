@@ -0,0 +1,222 @@
+"""
+Storage backend interface.
+
+FirestoreClient (the API used by routers) owns the business rules: record shapes, limit clamping, transfer
+validation messages. A StorageBackend only stores and fetches records. Implementations:
+
+- FirestoreStore (app.db.firestore_store): Google Cloud Firestore, or the local emulator (FIRESTORE_EMULATOR_HOST).
+- MemoryStore (app.db.memory_store): process-local dicts persisted with an append-only WAL.
+- SQLiteStore (app.db.sqlite_store): embedded single-node SQLite.
+
+Select with STORAGE_BACKEND ("firestore" default, falls back to memory if unavailable; "memory"; "sqlite").
+Conformance checks and load benchmarks for any backend live in scripts/storage_conformance.py and scripts/bench_storage.py.
+"""
+
+import logging
+import os
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Optional
+
+from app.db.ledger import Cursor, transfer_entries
+
+logger = logging.getLogger(__name__)
+
+# (transaction_id, beneficiary_customer_id, now) -> audit log record
+AuditEntryBuilder = Callable[[str, str, str], dict[str, Any]]
+# (collection, record_id, record); collection is one of AUDIT_COLLECTIONS
+AuditRecord = tuple[str, str, dict]
+AUDIT_COLLECTIONS = ("audit_logs", "device_auth_events")
+
+
+class StorageBackend(ABC):
+    """Record storage for customers, accounts, ledger entries, audit logs, FIDO2 credentials and device-auth data."""
+
+    # True when execute_transfer is atomic on its own (FirestoreClient then skips the per-account executor)
+    atomic_transfers = False
+
+    name: str = "abstract"
+
+    # --- Customers ---
+
+    @abstractmethod
+    def create_customer(self, data: dict) -> str:
+        """Insert a customer record. Returns the new customer_id."""
+
+    @abstractmethod
+    def get_customer_by_id(self, customer_id: str) -> Optional[dict]:
+        """Customer record including "id", or None."""
+
+    @abstractmethod
+    def get_customer_by_bvn(self, bvn: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def get_customer_by_username(self, username: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def update_customer(self, customer_id: str, fields: dict[str, Any]) -> bool:
+        """Merge fields into a customer record. Returns False if not found."""
+
+    @abstractmethod
+    def has_customers(self) -> bool:
+        ...
+
+    # --- FIDO2 credentials ---
+
+    @abstractmethod
+    def add_fido2_credential(self, data: dict) -> None:
+        """Insert or replace a credential keyed by data["credential_id_b64"]."""
+
+    @abstractmethod
+    def get_fido2_credentials(self, customer_id: str) -> list[dict]:
+        ...
+
+    @abstractmethod
+    def update_fido2_sign_count(self, credential_id_b64: str, sign_count: int, now: str) -> bool:
+        ...
+
+    # --- Device public keys / events ---
+
+    @abstractmethod
+    def set_device_public_key(self, data: dict) -> None:
+        """Insert or replace the key keyed by data["customer_id"]."""
+
+    @abstractmethod
+    def get_device_public_key(self, customer_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def add_device_auth_event(self, data: dict) -> str:
+        ...
+
+    # --- Accounts ---
+
+    @abstractmethod
+    def add_account(self, customer_id: str, data: dict) -> str:
+        ...
+
+    @abstractmethod
+    def get_accounts(self, customer_id: str) -> list[dict]:
+        """Accounts for a customer, each including "id"."""
+
+    @abstractmethod
+    def get_account_by_account_number(self, account_number: str) -> Optional[dict]:
+        """Account record including "id" and "customer_id", or None."""
+
+    # --- Ledger (see app.db.ledger) ---
+
+    @abstractmethod
+    def post_ledger_entries(self, entries: list[dict]) -> list[dict]:
+        """Append entries (from app.db.ledger.new_entry) and apply them to each account's balance snapshot with
+        app.db.ledger.apply_entries, in one write per backend where possible. Returns the stored entries.
+        Raises ValueError("Account not found") if an entry's account does not belong to its customer_id."""
+
+    @abstractmethod
+    def get_ledger_entries(self, account_id: str, limit: int, before: Optional[Cursor] = None) -> list[dict]:
+        """Up to limit entries for an account, newest first by (timestamp, seq), strictly older than before."""
+
+    # --- Audit ---
+
+    @abstractmethod
+    def add_audit_log(self, record: dict[str, Any]) -> str:
+        ...
+
+    def write_audit_batch(self, records: list[AuditRecord]) -> None:
+        """Write audit logs / device-auth events with caller-chosen ids (the async audit writer's sink).
+        Writing the same id twice must not duplicate the record, so a spooled batch can be replayed.
+        Default: one write per record with backend-generated ids; backends override with a real batch."""
+        for collection, _, record in records:
+            if collection == "device_auth_events":
+                self.add_device_auth_event(record)
+            else:
+                self.add_audit_log(record)
+
+    def execute_transfer(
+        self,
+        sender_customer_id: str,
+        sender_account_id: str,
+        beneficiary_account_number: str,
+        amount_ngn: float,
+        limit_default: float,
+        build_audit_entry: AuditEntryBuilder,
+        now: str,
+        audit_sink: Optional[Callable[[dict], Any]] = None,
+        beneficiary: Optional[dict] = None,
+    ) -> str:
+        """
+        Validate, post the debit/credit ledger entries and write the audit log. Raises ValueError on rule violations.
+        Default implementation composes the primitives above (not atomic); backends with transactions override it.
+        audit_sink (e.g. the async audit writer) replaces add_audit_log; transactional backends may ignore it to
+        keep the audit row in the same transaction. beneficiary is the caller's get_account_by_account_number()
+        result ({} when it found none), so the lookup (a scan on Firestore) is not repeated.
+        """
+        sender_cust = self.get_customer_by_id(sender_customer_id)
+        if not sender_cust:
+            raise ValueError("Sender customer not found")
+        if not sender_cust.get("kyc_completed"):
+            raise ValueError("Sender must be KYC verified to transfer")
+        sender_accounts = self.get_accounts(sender_customer_id)
+        sender_acc = next((a for a in sender_accounts if a["id"] == sender_account_id), None)
+        if not sender_acc:
+            raise ValueError("Sender account not found")
+        sender_balance = sender_acc.get("balance_ngn", 0.0)
+        if sender_balance < amount_ngn:
+            raise ValueError("Insufficient balance")
+        limit = sender_cust.get("current_limit_ngn") or limit_default
+        if amount_ngn > limit:
+            raise ValueError("Amount exceeds your transfer limit")
+        if beneficiary is None:
+            beneficiary = self.get_account_by_account_number(beneficiary_account_number)
+        if not beneficiary:
+            raise ValueError("Beneficiary account not found")
+        beneficiary_customer_id = beneficiary["customer_id"]
+        beneficiary_cust = self.get_customer_by_id(beneficiary_customer_id)
+        if not beneficiary_cust or not beneficiary_cust.get("kyc_completed"):
+            raise ValueError("Beneficiary must be KYC verified to receive transfers")
+        if beneficiary_customer_id == sender_customer_id and beneficiary.get("id") == sender_account_id:
+            raise ValueError("Cannot transfer to the same account")
+        transaction_id = str(uuid.uuid4())
+        audit_entry = build_audit_entry(transaction_id, beneficiary_customer_id, now)
+        self.post_ledger_entries(transfer_entries(
+            transaction_id, sender_customer_id, sender_account_id, beneficiary_customer_id, beneficiary["id"],
+            amount_ngn, now,
+        ))
+        (audit_sink or self.add_audit_log)(audit_entry)
+        return transaction_id
+
+
+def get_storage_backend_name() -> str:
+    """STORAGE_BACKEND env var: "firestore" (default; falls back to memory if unavailable), "memory" or "sqlite"."""
+    return (os.environ.get("STORAGE_BACKEND") or "firestore").strip().lower()
+
+
+def create_backend(name: str) -> StorageBackend:
+    """Build a new backend instance by name. Firestore falls back to memory when not configured."""
+    if name == "sqlite":
+        from app.db.sqlite_store import SQLiteStore
+        return SQLiteStore()
+    if name == "memory":
+        from app.db.memory_store import MemoryStore
+        return MemoryStore.persistent()
+    from app.db.firestore_store import FirestoreStore, get_firestore_client
+    client = get_firestore_client()
+    if client is None:
+        logger.warning("Firestore not configured; using in-memory store.")
+        return create_backend("memory")
+    return FirestoreStore(client)
+
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_storage_backend() -> StorageBackend:
+    """Process-wide backend shared by every FirestoreClient."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend(get_storage_backend_name())
+    return _backend
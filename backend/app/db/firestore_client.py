@@ -1,183 +1,66 @@
 """
-Firestore client for customers, accounts, and audit logs.
-Uses Application Default Credentials on Cloud Run; set GOOGLE_APPLICATION_CREDENTIALS for local dev.
+Data access for customers, accounts and their ledgers, audit logs, FIDO2 credentials and device-auth data.
+FirestoreClient holds the record shapes and business rules; storage is delegated to a StorageBackend
+(Firestore, in-memory or SQLite; see app.db.backend).
 """
 
 import base64
-import hashlib
-import json
 import logging
-import uuid
 from datetime import datetime
-from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 
-
-def _fido2_doc_id(credential_id_b64: str) -> str:
-    """Firestore document IDs cannot contain '/' or '.'; standard base64 does. Use a safe hash."""
-    return hashlib.sha256(credential_id_b64.encode()).hexdigest()
+from app.db.audit_writer import AuditWriter, get_audit_writer
+from app.db.backend import StorageBackend, get_storage_backend
+from app.db.firestore_store import get_firestore_client
+from app.db.ledger import clamp_page_size, decode_cursor, encode_cursor, new_entry
+from app.db.transfer_executor import get_transfer_executor
 
 logger = logging.getLogger(__name__)
 
-COLLECTION_CUSTOMERS = "customers"
-SUBCOLLECTION_ACCOUNTS = "accounts"
-COLLECTION_AUDIT_LOGS = "audit_logs"
-COLLECTION_FIDO2_CREDENTIALS = "fido2_credentials"
-COLLECTION_DEVICE_PUBLIC_KEYS = "device_public_keys"
-COLLECTION_DEVICE_AUTH_EVENTS = "device_auth_events"
-
 DEFAULT_LIMIT_NGN = 100_000
 MIN_LIMIT_NGN = 100_000
 MAX_LIMIT_NGN = 50_000_000
 
-# In-memory fallback when Firestore is not configured (e.g. tests)
-_memory_store: dict = {"customers": {}, "accounts": {}, "audit_logs": {}, "fido2_credentials": {}, "device_public_keys": {}, "device_auth_events": []}
-
-# When using in-memory store, persist FIDO2 credentials to this file so they survive server restarts.
-_FIDO2_FILE = Path(__file__).resolve().parent.parent.parent / "data" / "fido2_credentials.json"
-_DEVICE_KEYS_FILE = Path(__file__).resolve().parent.parent.parent / "data" / "device_public_keys.json"
-_DEVICE_AUTH_EVENTS_FILE = Path(__file__).resolve().parent.parent.parent / "data" / "device_auth_events.json"
-
-
-def _load_fido2_from_file() -> None:
-    """Load FIDO2 credentials from file into _memory_store (dev fallback when Firestore not used)."""
-    if not _FIDO2_FILE.exists():
-        return
-    try:
-        with open(_FIDO2_FILE, encoding="utf-8") as f:
-            data = json.load(f)
-        if isinstance(data, dict):
-            _memory_store["fido2_credentials"].update(data)
-            logger.info("Loaded %d FIDO2 credential(s) from %s", len(data), _FIDO2_FILE)
-    except Exception as e:
-        logger.warning("Could not load FIDO2 credentials from file: %s", e)
-
-
-def _save_fido2_to_file() -> None:
-    """Persist in-memory FIDO2 credentials to file (dev fallback)."""
-    try:
-        _FIDO2_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with open(_FIDO2_FILE, "w", encoding="utf-8") as f:
-            json.dump(_memory_store["fido2_credentials"], f, indent=2)
-    except Exception as e:
-        logger.warning("Could not save FIDO2 credentials to file: %s", e)
-
-
-def _load_device_keys_from_file() -> None:
-    """Load device public keys from file into _memory_store (dev fallback)."""
-    if not _DEVICE_KEYS_FILE.exists():
-        return
-    try:
-        with open(_DEVICE_KEYS_FILE, encoding="utf-8") as f:
-            data = json.load(f)
-        if isinstance(data, dict):
-            _memory_store["device_public_keys"].update(data)
-            logger.info("Loaded %d device public key(s) from %s", len(data), _DEVICE_KEYS_FILE)
-    except Exception as e:
-        logger.warning("Could not load device public keys from file: %s", e)
-
-
-def _save_device_keys_to_file() -> None:
-    """Persist in-memory device public keys to file (dev fallback)."""
-    try:
-        _DEVICE_KEYS_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with open(_DEVICE_KEYS_FILE, "w", encoding="utf-8") as f:
-            json.dump(_memory_store["device_public_keys"], f, indent=2)
-    except Exception as e:
-        logger.warning("Could not save device public keys to file: %s", e)
-
-
-def _load_device_auth_events_from_file() -> None:
-    """Load device auth events from file into _memory_store (dev fallback)."""
-    if not _DEVICE_AUTH_EVENTS_FILE.exists():
-        return
-    try:
-        with open(_DEVICE_AUTH_EVENTS_FILE, encoding="utf-8") as f:
-            data = json.load(f)
-        if isinstance(data, list):
-            _memory_store["device_auth_events"] = data
-            logger.info("Loaded %d device auth event(s) from %s", len(data), _DEVICE_AUTH_EVENTS_FILE)
-    except Exception as e:
-        logger.warning("Could not load device auth events from file: %s", e)
-
-
-def _save_device_auth_events_to_file() -> None:
-    """Persist in-memory device auth events to file (dev fallback)."""
-    try:
-        _DEVICE_AUTH_EVENTS_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with open(_DEVICE_AUTH_EVENTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(_memory_store["device_auth_events"], f, indent=2)
-    except Exception as e:
-        logger.warning("Could not save device auth events to file: %s", e)
-
-
-# Hardcoded for local/PoC – backend/ folder
-_BACKEND_DIR = Path(__file__).resolve().parent.parent
-_FIRESTORE_PROJECT_ID = "vernal-seeker-303517"
-_FIRESTORE_CREDENTIALS_FILENAME = "vernal-seeker-303517-73b020321a85.json"
-
-
-def _get_client():
-    """Lazy-init Firestore client. Uses hardcoded project + key file in backend/."""
-    import os
-    try:
-        from google.cloud import firestore
-    except ImportError as e:
-        logger.warning("Firestore not available (install google-cloud-firestore): %s", e)
-        return None
-    project_id = os.environ.get("FIRESTORE_PROJECT_ID") or _FIRESTORE_PROJECT_ID
-    creds_path = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
-    if not creds_path or not os.path.isfile(os.path.expanduser(creds_path)):
-        creds_path = str(_BACKEND_DIR / _FIRESTORE_CREDENTIALS_FILENAME)
-    if not os.path.isfile(creds_path):
-        logger.warning("Firestore credentials file not found at %s", creds_path)
-        return None
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.path.abspath(creds_path)
-    try:
-        client = firestore.Client(project=project_id)
-        logger.info("Firestore connected (project=%s)", project_id)
-        return client
-    except Exception as e:
-        logger.warning("Firestore client failed, using in-memory store: %s", e)
-        return None
-
-
-_client = None
-
-
-def get_firestore_client():
-    """Return Firestore client or None if not configured."""
-    global _client
-    if _client is None:
-        _client = _get_client()
-    return _client
+# Called with the customer_id (None if unknown) after any FIDO2 credential write, e.g. to drop parsed-credential
+# caches. Process-wide: every router has its own FirestoreClient.
+_fido2_credential_listeners: list[Callable[[Optional[str]], None]] = []
+
+
+def on_fido2_credentials_changed(callback: Callable[[Optional[str]], None]) -> None:
+    _fido2_credential_listeners.append(callback)
+
+
+def _fido2_credentials_changed(customer_id: Optional[str]) -> None:
+    for callback in _fido2_credential_listeners:
+        try:
+            callback(customer_id)
+        except Exception:
+            logger.exception("FIDO2 credential listener failed")
 
 
 class FirestoreClient:
-    """CRUD for customers and accounts. Falls back to in-memory dict if Firestore not configured."""
-
-    def __init__(self):
-        self._db = get_firestore_client()
-        self._use_memory = self._db is None
-        if self._use_memory:
-            logger.warning("Firestore not configured; using in-memory store.")
-            _load_fido2_from_file()
-            _load_device_keys_from_file()
-            _load_device_auth_events_from_file()
-
-    def _customers_ref(self):
-        if self._db:
-            return self._db.collection(COLLECTION_CUSTOMERS)
-        return None
-
-    def _customer_doc(self, customer_id: str):
-        if self._db:
-            return self._db.collection(COLLECTION_CUSTOMERS).document(customer_id)
-        return None
+    """CRUD for customers and accounts on the configured storage backend (STORAGE_BACKEND; Firestore by default,
+    falling back to the in-memory store if Firestore is not configured)."""
+
+    def __init__(self, backend: Optional[StorageBackend] = None, audit_writer: Optional[AuditWriter] = None):
+        self._backend = backend or get_storage_backend()
+        # Audit records go through the shared async writer for the default backend (AUDIT_WRITER=sync disables it);
+        # an explicitly passed backend writes them inline unless a writer is given too.
+        self._audit = audit_writer or (get_audit_writer() if backend is None else None)
+
+    @property
+    def backend(self) -> StorageBackend:
+        return self._backend
 
     def _now(self) -> str:
         return datetime.utcnow().isoformat() + "Z"
 
+    def _serialized(self, account_ids: list[str], fn: Callable[[], Any]) -> Any:
+        """Run fn() serialized per account unless the backend's writes are already atomic."""
+        if self._backend.atomic_transfers:
+            return fn()
+        return get_transfer_executor().run(account_ids, fn)
+
     # --- Customers ---
 
     def create_customer(
@@ -202,31 +85,14 @@ class FirestoreClient:
             "created_at": now,
             "updated_at": now,
         }
-        if self._db:
-            ref = self._customers_ref().document()
-            ref.set(data)
-            return ref.id
-        # In-memory
-        customer_id = str(uuid.uuid4())
-        _memory_store["customers"][customer_id] = {**data, "id": customer_id}
-        return customer_id
+        return self._backend.create_customer(data)
 
     def get_customer_by_username(self, username: str) -> Optional[dict]:
         """Get customer by username (unique per app). Returns None if not found."""
         key = (username or "").strip()
         if not key:
             return None
-        if self._db:
-            q = self._customers_ref().where("username", "==", key).limit(1).get()
-            for doc in q:
-                d = doc.to_dict()
-                d["id"] = doc.id
-                return d
-            return None
-        for c in _memory_store["customers"].values():
-            if (c.get("username") or "").strip() == key:
-                return c
-        return None
+        return self._backend.get_customer_by_username(key)
 
     def ensure_customer_for_username(self, username: str) -> tuple[str, bool]:
         """
@@ -244,20 +110,9 @@ class FirestoreClient:
 
     def update_customer_bvn_and_name(self, customer_id: str, bvn: str, name: str) -> bool:
         """Update customer's BVN and name (e.g. when completing KYC for a username-created customer)."""
-        now = self._now()
-        if self._db:
-            ref = self._customer_doc(customer_id)
-            if not ref.get().exists:
-                return False
-            ref.update({"bvn": bvn or "", "name": name or "", "updated_at": now})
-            return True
-        c = _memory_store["customers"].get(customer_id)
-        if not c:
-            return False
-        c["bvn"] = bvn or ""
-        c["name"] = name or ""
-        c["updated_at"] = now
-        return True
+        return self._backend.update_customer(
+            customer_id, {"bvn": bvn or "", "name": name or "", "updated_at": self._now()}
+        )
 
     def get_customer_limit(self, customer_id: str) -> Optional[float]:
         """Return current_limit_ngn or None if customer not found."""
@@ -269,80 +124,28 @@ class FirestoreClient:
     def update_customer_limit(self, customer_id: str, limit_ngn: float) -> bool:
         """Update current_limit_ngn. Clamps to [MIN_LIMIT_NGN, MAX_LIMIT_NGN]. Returns False if customer not found."""
         limit_ngn = max(MIN_LIMIT_NGN, min(MAX_LIMIT_NGN, limit_ngn))
-        now = self._now()
-        if self._db:
-            ref = self._customer_doc(customer_id)
-            if not ref.get().exists:
-                return False
-            ref.update({"current_limit_ngn": limit_ngn, "updated_at": now})
-            return True
-        c = _memory_store["customers"].get(customer_id)
-        if not c:
-            return False
-        c["current_limit_ngn"] = limit_ngn
-        c["updated_at"] = now
-        return True
+        return self._backend.update_customer(
+            customer_id, {"current_limit_ngn": limit_ngn, "updated_at": self._now()}
+        )
 
     def get_customer_by_id(self, customer_id: str) -> Optional[dict]:
         """Get customer by id. reference_image_base64 excluded from response in API layer."""
-        if self._db:
-            doc = self._customer_doc(customer_id).get()
-            if not doc.exists:
-                return None
-            d = doc.to_dict()
-            d["id"] = doc.id
-            return d
-        return _memory_store["customers"].get(customer_id)
+        return self._backend.get_customer_by_id(customer_id)
 
     def get_customer_by_bvn(self, bvn: str) -> Optional[dict]:
-        if self._db:
-            q = self._customers_ref().where("bvn", "==", bvn).limit(1).get()
-            for doc in q:
-                d = doc.to_dict()
-                d["id"] = doc.id
-                return d
-            return None
-        for c in _memory_store["customers"].values():
-            if c.get("bvn") == bvn:
-                return c
-        return None
+        return self._backend.get_customer_by_bvn(bvn)
 
     def update_customer_kyc_reference(self, customer_id: str, reference_image_base64: str) -> bool:
         """Store reference image and set kyc_completed=True."""
-        now = self._now()
-        if self._db:
-            ref = self._customer_doc(customer_id)
-            if not ref.get().exists:
-                return False
-            ref.update({
-                "kyc_completed": True,
-                "reference_image_base64": reference_image_base64,
-                "updated_at": now,
-            })
-            return True
-        c = _memory_store["customers"].get(customer_id)
-        if not c:
-            return False
-        c["kyc_completed"] = True
-        c["reference_image_base64"] = reference_image_base64
-        c["updated_at"] = now
-        return True
+        return self._backend.update_customer(customer_id, {
+            "kyc_completed": True,
+            "reference_image_base64": reference_image_base64,
+            "updated_at": self._now(),
+        })
 
     def set_kyc_completed(self, customer_id: str, completed: bool = True) -> bool:
         """Set kyc_completed flag without changing reference image (e.g. for mock data)."""
-        now = self._now()
-        if self._db:
-            ref = self._customer_doc(customer_id)
-            if not ref.get().exists:
-                return False
-            ref.update({"kyc_completed": completed, "updated_at": now})
-            return True
-        c = _memory_store["customers"].get(customer_id)
-        if not c:
-            return False
-        c["kyc_completed"] = completed
-        c["updated_at"] = now
-        return True
+        return self._backend.update_customer(customer_id, {"kyc_completed": completed, "updated_at": self._now()})
 
     def get_customer_reference_image(self, customer_id: str) -> Optional[bytes]:
         """Return reference image bytes for face verification. None if not found."""
@@ -389,53 +192,30 @@ class FirestoreClient:
             "created_at": now,
             "updated_at": now,
         }
-        if self._db:
-            doc_id = _fido2_doc_id(credential_id_b64)
-            ref = self._db.collection(COLLECTION_FIDO2_CREDENTIALS).document(doc_id)
-            ref.set(data)
-        else:
-            _memory_store["fido2_credentials"][credential_id_b64] = {**data, "id": credential_id_b64}
-            _save_fido2_to_file()
+        self._backend.add_fido2_credential(data)
+        _fido2_credentials_changed(customer_id)
 
     def get_fido2_credentials(self, customer_id: str) -> list[dict]:
         """Return all stored FIDO2 credentials for a customer (includes credential_id_client when set)."""
-        def _row(data: dict) -> dict:
-            return {
+        return [
+            {
                 "credential_id_b64": data.get("credential_id_b64"),
                 "credential_data_b64": data.get("credential_data_b64"),
                 "sign_count": data.get("sign_count", 0),
                 "credential_id_client": data.get("credential_id_client"),
             }
-        if self._db:
-            q = (
-                self._db.collection(COLLECTION_FIDO2_CREDENTIALS)
-                .where("customer_id", "==", customer_id)
-                .get()
-            )
-            return [_row(doc.to_dict()) for doc in q]
-        return [
-            _row(v)
-            for v in _memory_store["fido2_credentials"].values()
-            if v.get("customer_id") == customer_id
+            for data in self._backend.get_fido2_credentials(customer_id)
         ]
 
-    def update_fido2_sign_count(self, credential_id_b64: str, sign_count: int) -> bool:
-        """Update sign_count for a credential (after successful assertion)."""
-        now = self._now()
-        if self._db:
-            doc_id = _fido2_doc_id(credential_id_b64)
-            ref = self._db.collection(COLLECTION_FIDO2_CREDENTIALS).document(doc_id)
-            doc = ref.get()
-            if not doc.exists:
-                return False
-            ref.update({"sign_count": sign_count, "updated_at": now})
-            return True
-        rec = _memory_store["fido2_credentials"].get(credential_id_b64)
-        if not rec:
-            return False
-        rec["sign_count"] = sign_count
-        rec["updated_at"] = now
-        return True
+    def update_fido2_sign_count(
+        self, credential_id_b64: str, sign_count: int, customer_id: Optional[str] = None
+    ) -> bool:
+        """Update sign_count for a credential (after successful assertion). Pass customer_id when known so only
+        that customer's cached credentials are dropped."""
+        updated = self._backend.update_fido2_sign_count(credential_id_b64, sign_count, self._now())
+        if updated:
+            _fido2_credentials_changed(customer_id)
+        return updated
 
     # --- Device public keys (Ed25519, for device-bound biometric auth) ---
 
@@ -449,22 +229,11 @@ class FirestoreClient:
             "created_at": now,
             "updated_at": now,
         }
-        if self._db:
-            ref = self._db.collection(COLLECTION_DEVICE_PUBLIC_KEYS).document(customer_id)
-            ref.set(data)
-        else:
-            _memory_store["device_public_keys"][customer_id] = data
-            _save_device_keys_to_file()
+        self._backend.set_device_public_key(data)
 
     def get_device_public_key(self, customer_id: str) -> Optional[dict]:
         """Return stored device public key for customer, or None."""
-        if self._db:
-            ref = self._db.collection(COLLECTION_DEVICE_PUBLIC_KEYS).document(customer_id)
-            doc = ref.get()
-            if not doc.exists:
-                return None
-            return doc.to_dict()
-        return _memory_store["device_public_keys"].get(customer_id)
+        return self._backend.get_device_public_key(customer_id)
 
     def add_device_auth_event(
         self,
@@ -478,14 +247,13 @@ class FirestoreClient:
         state_id: Optional[str] = None,
     ) -> None:
         """Append a device-auth event (login or transaction) for audit. Stores challenge, signature, device name."""
-        now = self._now()
         data = {
             "customer_id": customer_id,
             "event_type": event_type,
             "challenge_b64": challenge_b64,
             "signature_b64": signature_b64,
             "device_name": device_name or "",
-            "created_at": now,
+            "created_at": self._now(),
         }
         if amount_ngn is not None:
             data["amount_ngn"] = amount_ngn
@@ -493,83 +261,81 @@ class FirestoreClient:
             data["beneficiary_account_number"] = beneficiary_account_number
         if state_id is not None:
             data["state_id"] = state_id
-        if self._db:
-            ref = self._db.collection(COLLECTION_DEVICE_AUTH_EVENTS).document()
-            ref.set(data)
+        if self._audit is not None:
+            self._audit.submit("device_auth_events", data)
         else:
-            data["id"] = str(uuid.uuid4())
-            _memory_store["device_auth_events"].append(data)
-            _save_device_auth_events_to_file()
+            self._backend.add_device_auth_event(data)
 
-    # --- Accounts (subcollection under customer) ---
+    # --- Accounts ---
 
     def add_account(self, customer_id: str, account_number: str, account_type: str = "current", balance_ngn: float = 0.0) -> Optional[str]:
+        """Create an account; a non-zero starting balance is posted as an "opening" ledger entry."""
         now = self._now()
         data = {
             "account_number": account_number,
             "account_type": account_type,
-            "balance_ngn": balance_ngn,
+            "balance_ngn": 0.0,
             "status": "active",
             "created_at": now,
             "updated_at": now,
+            "ledger_seq": 0,
+            "ledger_updated_at": None,
         }
-        if self._db:
-            ref = self._customer_doc(customer_id).collection(SUBCOLLECTION_ACCOUNTS).document()
-            ref.set(data)
-            return ref.id
-        acc_id = str(uuid.uuid4())
-        _memory_store["accounts"][acc_id] = {**data, "id": acc_id, "customer_id": customer_id}
-        return acc_id
+        account_id = self._backend.add_account(customer_id, data)
+        if balance_ngn:
+            self._backend.post_ledger_entries([new_entry(account_id, customer_id, balance_ngn, "opening", now)])
+        return account_id
 
     def get_accounts(self, customer_id: str) -> list:
-        if self._db:
-            docs = self._customer_doc(customer_id).collection(SUBCOLLECTION_ACCOUNTS).get()
-            return [{"id": d.id, **d.to_dict()} for d in docs]
-        return [a for a in _memory_store["accounts"].values() if a.get("customer_id") == customer_id]
+        return self._backend.get_accounts(customer_id)
 
     def update_balance(self, customer_id: str, account_id: str, balance_ngn: float) -> bool:
-        now = self._now()
-        if self._db:
-            ref = self._customer_doc(customer_id).collection(SUBCOLLECTION_ACCOUNTS).document(account_id)
-            if not ref.get().exists:
+        """Set the balance by posting an "adjustment" entry for the difference. Returns False if account not found."""
+
+        def run() -> bool:
+            account = next((a for a in self._backend.get_accounts(customer_id) if a["id"] == account_id), None)
+            if not account:
                 return False
-            ref.update({"balance_ngn": balance_ngn, "updated_at": now})
+            delta = balance_ngn - (account.get("balance_ngn") or 0.0)
+            if delta:
+                self._backend.post_ledger_entries([new_entry(account_id, customer_id, delta, "adjustment", self._now())])
             return True
-        for a in _memory_store["accounts"].values():
-            if a.get("customer_id") == customer_id and a.get("id") == account_id:
-                a["balance_ngn"] = balance_ngn
-                a["updated_at"] = now
-                return True
-        return False
 
-    def get_account_by_account_number(self, account_number: str) -> Optional[dict]:
-        """Find account by account_number (any customer). Returns dict with id, customer_id, account_number, balance_ngn, etc.
-        Uses customer iteration to avoid requiring a Firestore collection group index.
+        return self._serialized([account_id], run)
+
+    def get_account_statement(
+        self, customer_id: str, account_id: str, limit: Optional[int] = None, cursor: Optional[str] = None
+    ) -> Optional[dict]:
+        """
+        One page of an account's ledger, newest first: { account_id, balance_ngn, entries, next_cursor }.
+        Each entry carries balance_after_ngn, so this is also the balance history. next_cursor is None on the last page.
+        Returns None if the account does not belong to the customer; raises ValueError on a malformed cursor.
         """
-        if self._db:
-            for customer_doc in self._customers_ref().stream():
-                customer_id = customer_doc.id
-                accounts = self.get_accounts(customer_id)
-                for acc in accounts:
-                    if acc.get("account_number") == account_number:
-                        return {**acc, "customer_id": customer_id}
+        account = next((a for a in self._backend.get_accounts(customer_id) if a["id"] == account_id), None)
+        if not account:
             return None
-        for a in _memory_store["accounts"].values():
-            if a.get("account_number") == account_number:
-                return dict(a)
-        return None
+        before = decode_cursor(cursor) if cursor else None
+        page_size = clamp_page_size(limit)
+        entries = self._backend.get_ledger_entries(account_id, page_size + 1, before)
+        has_more = len(entries) > page_size
+        entries = entries[:page_size]
+        return {
+            "account_id": account_id,
+            "balance_ngn": account.get("balance_ngn", 0.0),
+            "entries": entries,
+            "next_cursor": encode_cursor(entries[-1]) if has_more else None,
+        }
+
+    def get_account_by_account_number(self, account_number: str) -> Optional[dict]:
+        """Find account by account_number (any customer). Returns dict with id, customer_id, account_number, balance_ngn, etc."""
+        return self._backend.get_account_by_account_number(account_number)
 
     def add_audit_log(self, entry: dict[str, Any]) -> str:
         """Append an audit log entry. Returns document/record id."""
-        now = self._now()
-        record = {**entry, "timestamp": entry.get("timestamp") or now}
-        if self._db:
-            ref = self._db.collection(COLLECTION_AUDIT_LOGS).document()
-            ref.set(record)
-            return ref.id
-        log_id = str(uuid.uuid4())
-        _memory_store["audit_logs"][log_id] = {**record, "id": log_id}
-        return log_id
+        record = {**entry, "timestamp": entry.get("timestamp") or self._now()}
+        if self._audit is not None:
+            return self._audit.submit("audit_logs", record)
+        return self._backend.add_audit_log(record)
 
     def execute_transfer(
         self,
@@ -581,74 +347,61 @@ class FirestoreClient:
         client_ip: Optional[str] = None,
     ) -> str:
         """
-        Debit sender account, credit beneficiary account, write audit log.
+        Post the debit/credit ledger entries for sender and beneficiary accounts, write audit log.
         Both sender and beneficiary must be KYC verified.
         Returns transaction_id (audit log id).
         """
         if amount_ngn <= 0:
             raise ValueError("Amount must be positive")
-        sender_cust = self.get_customer_by_id(sender_customer_id)
-        if not sender_cust:
-            raise ValueError("Sender customer not found")
-        if not sender_cust.get("kyc_completed"):
-            raise ValueError("Sender must be KYC verified to transfer")
-        sender_accounts = self.get_accounts(sender_customer_id)
-        sender_acc = next((a for a in sender_accounts if a["id"] == sender_account_id), None)
-        if not sender_acc:
-            raise ValueError("Sender account not found")
-        sender_balance = sender_acc.get("balance_ngn", 0.0)
-        if sender_balance < amount_ngn:
-            raise ValueError("Insufficient balance")
-        limit = self.get_customer_limit(sender_customer_id) or DEFAULT_LIMIT_NGN
-        if amount_ngn > limit:
-            raise ValueError("Amount exceeds your transfer limit")
-        beneficiary = self.get_account_by_account_number(beneficiary_account_number)
-        if not beneficiary:
-            raise ValueError("Beneficiary account not found")
-        beneficiary_customer_id = beneficiary["customer_id"]
-        beneficiary_cust = self.get_customer_by_id(beneficiary_customer_id)
-        if not beneficiary_cust or not beneficiary_cust.get("kyc_completed"):
-            raise ValueError("Beneficiary must be KYC verified to receive transfers")
-        if beneficiary_customer_id == sender_customer_id and beneficiary.get("id") == sender_account_id:
-            raise ValueError("Cannot transfer to the same account")
-        beneficiary_balance = beneficiary.get("balance_ngn", 0.0)
-        new_sender_balance = sender_balance - amount_ngn
-        new_beneficiary_balance = beneficiary_balance + amount_ngn
-        transaction_id = str(uuid.uuid4())
-        now = self._now()
-        audit_entry = {
-            "transaction_id": transaction_id,
-            "user_id": audit_payload.get("user_id", ""),
-            "device_id": audit_payload.get("device_id", ""),
-            "public_key_id": audit_payload.get("public_key_id", ""),
-            "nonce": audit_payload.get("nonce", ""),
-            "transaction_hash": audit_payload.get("transaction_hash", ""),
-            "digital_signature": audit_payload.get("digital_signature", ""),
-            "biometric_modality": audit_payload.get("biometric_modality", "FACE"),
-            "timestamp": now,
-            "risk_score": audit_payload.get("risk_score"),
-            "ip_address": client_ip or audit_payload.get("ip_address", ""),
-            "sender_customer_id": sender_customer_id,
-            "beneficiary_customer_id": beneficiary_customer_id,
-            "amount_ngn": amount_ngn,
-        }
-        self.update_balance(sender_customer_id, sender_account_id, new_sender_balance)
-        self.update_balance(beneficiary_customer_id, beneficiary["id"], new_beneficiary_balance)
-        self.add_audit_log(audit_entry)
-        return transaction_id
+
+        def build_audit_entry(transaction_id: str, beneficiary_customer_id: str, now: str) -> dict[str, Any]:
+            return {
+                "transaction_id": transaction_id,
+                "user_id": audit_payload.get("user_id", ""),
+                "device_id": audit_payload.get("device_id", ""),
+                "public_key_id": audit_payload.get("public_key_id", ""),
+                "nonce": audit_payload.get("nonce", ""),
+                "transaction_hash": audit_payload.get("transaction_hash", ""),
+                "digital_signature": audit_payload.get("digital_signature", ""),
+                "biometric_modality": audit_payload.get("biometric_modality", "FACE"),
+                "timestamp": now,
+                "risk_score": audit_payload.get("risk_score"),
+                "ip_address": client_ip or audit_payload.get("ip_address", ""),
+                "sender_customer_id": sender_customer_id,
+                "beneficiary_customer_id": beneficiary_customer_id,
+                "amount_ngn": amount_ngn,
+            }
+
+        def run(beneficiary: Optional[dict] = None) -> str:
+            return self._backend.execute_transfer(
+                sender_customer_id,
+                sender_account_id,
+                beneficiary_account_number,
+                amount_ngn,
+                DEFAULT_LIMIT_NGN,
+                build_audit_entry,
+                self._now(),
+                audit_sink=self.add_audit_log if self._audit is not None else None,
+                beneficiary=beneficiary,
+            )
+
+        if self._backend.atomic_transfers:
+            return run()
+        # Serialize with other postings on either account (balance check + posting is not atomic here). This only
+        # orders transfers within this process; on Firestore, postings from other workers or instances are
+        # serialized by the ledger transaction, which re-checks the balance (FirestoreStore.post_ledger_entries).
+        # The beneficiary is looked up once here and passed on ({} = not found).
+        beneficiary = self._backend.get_account_by_account_number(beneficiary_account_number) or {}
+        account_ids = [sender_account_id] + ([beneficiary["id"]] if beneficiary else [])
+        return self._serialized(account_ids, lambda: run(beneficiary))
 
     def seed_mock_customers_if_empty(self) -> int:
         """
         If no customers exist, create mock KYC-verified customers with accounts and balances.
         Returns number of customers created (0 if already had data).
         """
-        if self._db:
-            existing = self._customers_ref().limit(1).get()
-            if len(list(existing)) > 0:
-                return 0
-        else:
-            if _memory_store["customers"]:
-                return 0
+        if self._backend.has_customers():
+            return 0
         mock_customers = [
             {"bvn": "11111111111", "name": "Alice Demo", "account_number": "1111222233", "balance_ngn": 1_000_000},
             {"bvn": "22222222222", "name": "Bob Demo", "account_number": "2222333344", "balance_ngn": 500_000},
@@ -0,0 +1,262 @@
+"""
+Firestore storage backend.
+Uses Application Default Credentials on Cloud Run; set GOOGLE_APPLICATION_CREDENTIALS for local dev.
+Set FIRESTORE_EMULATOR_HOST (e.g. localhost:8080) to run against the local Firestore emulator; no credentials needed.
+"""
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Any, Optional
+
+from app.db.backend import AuditRecord, StorageBackend
+from app.db.ledger import Cursor, apply_entries, group_by_account
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_CUSTOMERS = "customers"
+SUBCOLLECTION_ACCOUNTS = "accounts"
+COLLECTION_AUDIT_LOGS = "audit_logs"
+COLLECTION_FIDO2_CREDENTIALS = "fido2_credentials"
+COLLECTION_DEVICE_PUBLIC_KEYS = "device_public_keys"
+COLLECTION_DEVICE_AUTH_EVENTS = "device_auth_events"
+COLLECTION_LEDGER_ENTRIES = "ledger_entries"
+
+# Max writes per Firestore batch commit
+FIRESTORE_BATCH_LIMIT = 500
+# Ledger postings whose entry ids were taken by a concurrent posting are re-read and retried this often
+LEDGER_POST_ATTEMPTS = 5
+
+# Hardcoded for local/PoC – backend/ folder
+_BACKEND_DIR = Path(__file__).resolve().parent.parent
+_FIRESTORE_PROJECT_ID = "vernal-seeker-303517"
+_FIRESTORE_CREDENTIALS_FILENAME = "vernal-seeker-303517-73b020321a85.json"
+
+
+def _fido2_doc_id(credential_id_b64: str) -> str:
+    """Firestore document IDs cannot contain '/' or '.'; standard base64 does. Use a safe hash."""
+    return hashlib.sha256(credential_id_b64.encode()).hexdigest()
+
+
+def _get_client():
+    """Lazy-init Firestore client. Uses hardcoded project + key file in backend/, or the emulator if configured."""
+    try:
+        from google.cloud import firestore
+    except ImportError as e:
+        logger.warning("Firestore not available (install google-cloud-firestore): %s", e)
+        return None
+    project_id = os.environ.get("FIRESTORE_PROJECT_ID") or _FIRESTORE_PROJECT_ID
+    if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        # The client library routes to the emulator and skips auth when this env var is set
+        client = firestore.Client(project=project_id)
+        logger.info("Firestore emulator at %s (project=%s)", os.environ["FIRESTORE_EMULATOR_HOST"], project_id)
+        return client
+    creds_path = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
+    if not creds_path or not os.path.isfile(os.path.expanduser(creds_path)):
+        creds_path = str(_BACKEND_DIR / _FIRESTORE_CREDENTIALS_FILENAME)
+    if not os.path.isfile(creds_path):
+        logger.warning("Firestore credentials file not found at %s", creds_path)
+        return None
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.path.abspath(creds_path)
+    try:
+        client = firestore.Client(project=project_id)
+        logger.info("Firestore connected (project=%s)", project_id)
+        return client
+    except Exception as e:
+        logger.warning("Firestore client failed, using in-memory store: %s", e)
+        return None
+
+
+_client = None
+
+
+def get_firestore_client():
+    """Return Firestore client or None if not configured."""
+    global _client
+    if _client is None:
+        _client = _get_client()
+    return _client
+
+
+class FirestoreStore(StorageBackend):
+    """Customers (with accounts subcollection), audit logs, FIDO2 credentials and device-auth data in Firestore."""
+
+    name = "firestore"
+
+    def __init__(self, client):
+        self._db = client
+
+    def _customers_ref(self):
+        return self._db.collection(COLLECTION_CUSTOMERS)
+
+    def _customer_doc(self, customer_id: str):
+        return self._db.collection(COLLECTION_CUSTOMERS).document(customer_id)
+
+    def _first(self, query) -> Optional[dict]:
+        for doc in query.limit(1).get():
+            d = doc.to_dict()
+            d["id"] = doc.id
+            return d
+        return None
+
+    # --- Customers ---
+
+    def create_customer(self, data: dict) -> str:
+        ref = self._customers_ref().document()
+        ref.set(data)
+        return ref.id
+
+    def get_customer_by_id(self, customer_id: str) -> Optional[dict]:
+        doc = self._customer_doc(customer_id).get()
+        if not doc.exists:
+            return None
+        d = doc.to_dict()
+        d["id"] = doc.id
+        return d
+
+    def get_customer_by_bvn(self, bvn: str) -> Optional[dict]:
+        return self._first(self._customers_ref().where("bvn", "==", bvn))
+
+    def get_customer_by_username(self, username: str) -> Optional[dict]:
+        return self._first(self._customers_ref().where("username", "==", username))
+
+    def update_customer(self, customer_id: str, fields: dict[str, Any]) -> bool:
+        ref = self._customer_doc(customer_id)
+        if not ref.get().exists:
+            return False
+        ref.update(fields)
+        return True
+
+    def has_customers(self) -> bool:
+        return len(list(self._customers_ref().limit(1).get())) > 0
+
+    # --- FIDO2 credentials ---
+
+    def add_fido2_credential(self, data: dict) -> None:
+        doc_id = _fido2_doc_id(data["credential_id_b64"])
+        self._db.collection(COLLECTION_FIDO2_CREDENTIALS).document(doc_id).set(data)
+
+    def get_fido2_credentials(self, customer_id: str) -> list[dict]:
+        q = (
+            self._db.collection(COLLECTION_FIDO2_CREDENTIALS)
+            .where("customer_id", "==", customer_id)
+            .get()
+        )
+        return [doc.to_dict() for doc in q]
+
+    def update_fido2_sign_count(self, credential_id_b64: str, sign_count: int, now: str) -> bool:
+        ref = self._db.collection(COLLECTION_FIDO2_CREDENTIALS).document(_fido2_doc_id(credential_id_b64))
+        if not ref.get().exists:
+            return False
+        ref.update({"sign_count": sign_count, "updated_at": now})
+        return True
+
+    # --- Device public keys / events ---
+
+    def set_device_public_key(self, data: dict) -> None:
+        self._db.collection(COLLECTION_DEVICE_PUBLIC_KEYS).document(data["customer_id"]).set(data)
+
+    def get_device_public_key(self, customer_id: str) -> Optional[dict]:
+        doc = self._db.collection(COLLECTION_DEVICE_PUBLIC_KEYS).document(customer_id).get()
+        if not doc.exists:
+            return None
+        return doc.to_dict()
+
+    def add_device_auth_event(self, data: dict) -> str:
+        ref = self._db.collection(COLLECTION_DEVICE_AUTH_EVENTS).document()
+        ref.set(data)
+        return ref.id
+
+    # --- Accounts (subcollection under customer) ---
+
+    def add_account(self, customer_id: str, data: dict) -> str:
+        ref = self._customer_doc(customer_id).collection(SUBCOLLECTION_ACCOUNTS).document()
+        ref.set(data)
+        return ref.id
+
+    def get_accounts(self, customer_id: str) -> list[dict]:
+        docs = self._customer_doc(customer_id).collection(SUBCOLLECTION_ACCOUNTS).get()
+        return [{"id": d.id, "customer_id": customer_id, **d.to_dict()} for d in docs]
+
+    def get_account_by_account_number(self, account_number: str) -> Optional[dict]:
+        """Uses customer iteration to avoid requiring a Firestore collection group index."""
+        for customer_doc in self._customers_ref().stream():
+            for acc in self.get_accounts(customer_doc.id):
+                if acc.get("account_number") == account_number:
+                    return acc
+        return None
+
+    # --- Ledger ---
+
+    def post_ledger_entries(self, entries: list[dict]) -> list[dict]:
+        """
+        Read the balance snapshots, check them and write the entries and new snapshots in one Firestore
+        transaction, so postings from other processes or instances cannot interleave. A debit that would take
+        the balance below zero raises "Insufficient balance". Entries are created, never overwritten: if a
+        concurrent posting took the same (account, seq) id, the transaction is re-run on fresh snapshots.
+        """
+        from google.api_core.exceptions import AlreadyExists
+        from google.cloud import firestore
+
+        grouped = group_by_account(entries)
+
+        @firestore.transactional
+        def post(transaction) -> list[dict]:
+            accounts = []
+            for account_id, account_entries in grouped.items():  # all reads before any write
+                customer_id = account_entries[0]["customer_id"]
+                ref = self._customer_doc(customer_id).collection(SUBCOLLECTION_ACCOUNTS).document(account_id)
+                doc = ref.get(transaction=transaction)
+                if not doc.exists:
+                    raise ValueError("Account not found")
+                accounts.append((ref, {"id": account_id, "customer_id": customer_id, **doc.to_dict()}, account_entries))
+            stored: list[dict] = []
+            for ref, account, account_entries in accounts:
+                posted, snapshot = apply_entries(account, account_entries)
+                if snapshot["balance_ngn"] < 0 and any(e["entry_type"] == "debit" for e in account_entries):
+                    raise ValueError("Insufficient balance")
+                for entry in posted:
+                    transaction.create(self._db.collection(COLLECTION_LEDGER_ENTRIES).document(entry["id"]), entry)
+                transaction.update(ref, snapshot)
+                stored.extend(posted)
+            return stored
+
+        attempt = 1
+        while True:
+            try:
+                return post(self._db.transaction())
+            except AlreadyExists:
+                if attempt >= LEDGER_POST_ATTEMPTS:
+                    raise
+                attempt += 1
+                logger.warning("Ledger entry id already taken, re-posting on fresh snapshots")
+
+    def get_ledger_entries(self, account_id: str, limit: int, before: Optional[Cursor] = None) -> list[dict]:
+        """Needs the composite index ledger_entries (account_id ASC, timestamp DESC, seq DESC)."""
+        from google.cloud import firestore
+
+        query = (
+            self._db.collection(COLLECTION_LEDGER_ENTRIES)
+            .where("account_id", "==", account_id)
+            .order_by("timestamp", direction=firestore.Query.DESCENDING)
+            .order_by("seq", direction=firestore.Query.DESCENDING)
+        )
+        if before:
+            query = query.start_after({"timestamp": before[0], "seq": before[1]})
+        return [d.to_dict() for d in query.limit(limit).stream()]
+
+    # --- Audit ---
+
+    def add_audit_log(self, record: dict[str, Any]) -> str:
+        ref = self._db.collection(COLLECTION_AUDIT_LOGS).document()
+        ref.set(record)
+        return ref.id
+
+    def write_audit_batch(self, records: list[AuditRecord]) -> None:
+        """Batched set() of up to FIRESTORE_BATCH_LIMIT documents per commit (idempotent per document id)."""
+        for start in range(0, len(records), FIRESTORE_BATCH_LIMIT):
+            batch = self._db.batch()
+            for collection, record_id, record in records[start:start + FIRESTORE_BATCH_LIMIT]:
+                batch.set(self._db.collection(collection).document(record_id), record)
+            batch.commit()
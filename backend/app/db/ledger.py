@@ -0,0 +1,130 @@
+"""
+Double-entry ledger: entry shapes and posting arithmetic shared by the storage backends.
+
+Every balance change is an append-only entry in ledger_entries (signed amount_ngn: credits positive, debits
+negative). The account record's balance_ngn is the materialized balance snapshot: posting adds the entry amounts to
+it (never overwrites it) and advances ledger_seq, in the same write as the entries. A transfer posts a balanced
+pair (debit sender, credit beneficiary) under one transaction_id.
+
+Entries carry a per-account sequence number and running balance (balance_after_ngn), so statements and balance
+history are one index range read on (account_id, timestamp, seq), newest first, paged with an opaque cursor.
+
+Accounts created before the ledger existed have no ledger_seq; their first posting is preceded by an "opening"
+entry carrying the stored balance forward, so the entries of every account sum to its balance.
+"""
+
+import base64
+from typing import Any, Optional
+
+ENTRY_TYPES = ("opening", "debit", "credit", "adjustment")
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# (timestamp, seq) of the last entry on the previous page
+Cursor = tuple[str, int]
+
+
+def new_entry(
+    account_id: str,
+    customer_id: str,
+    amount_ngn: float,
+    entry_type: str,
+    now: str,
+    transaction_id: Optional[str] = None,
+    counterparty_account_id: Optional[str] = None,
+) -> dict[str, Any]:
+    """Unposted entry; seq, balance_after_ngn and id are assigned by apply_entries()."""
+    if entry_type not in ENTRY_TYPES:
+        raise ValueError(f"Unknown ledger entry type {entry_type!r}")
+    return {
+        "account_id": account_id,
+        "customer_id": customer_id,
+        "entry_type": entry_type,
+        "amount_ngn": amount_ngn,
+        "transaction_id": transaction_id,
+        "counterparty_account_id": counterparty_account_id,
+        "timestamp": now,
+    }
+
+
+def transfer_entries(
+    transaction_id: str,
+    sender_customer_id: str,
+    sender_account_id: str,
+    beneficiary_customer_id: str,
+    beneficiary_account_id: str,
+    amount_ngn: float,
+    now: str,
+) -> list[dict[str, Any]]:
+    """Balanced debit/credit pair for one transfer."""
+    return [
+        new_entry(sender_account_id, sender_customer_id, -amount_ngn, "debit", now,
+                  transaction_id, beneficiary_account_id),
+        new_entry(beneficiary_account_id, beneficiary_customer_id, amount_ngn, "credit", now,
+                  transaction_id, sender_account_id),
+    ]
+
+
+def entry_id(account_id: str, seq: int) -> str:
+    """Deterministic id: re-posting the same (account, seq) overwrites instead of duplicating."""
+    return f"{account_id}-{seq:010d}"
+
+
+def group_by_account(entries: list[dict]) -> dict[str, list[dict]]:
+    grouped: dict[str, list[dict]] = {}
+    for entry in entries:
+        grouped.setdefault(entry["account_id"], []).append(entry)
+    return grouped
+
+
+def apply_entries(account: dict, entries: list[dict]) -> tuple[list[dict], dict[str, Any]]:
+    """Post entries (all for this account) against its snapshot.
+
+    Returns (entries to store, account fields to write). Entries get seq, balance_after_ngn and id; timestamps are
+    kept non-decreasing per account so (timestamp, seq) order equals posting order.
+    """
+    balance = account.get("balance_ngn") or 0.0
+    seq = account.get("ledger_seq")
+    last_at = account.get("ledger_updated_at") or ""
+    posted: list[dict] = []
+    if seq is None:
+        seq = 0
+        if balance:
+            opening_at = min(account.get("created_at") or entries[0]["timestamp"], entries[0]["timestamp"])
+            opening = new_entry(account["id"], account["customer_id"], balance, "opening", opening_at)
+            seq = 1
+            posted.append({**opening, "seq": seq, "balance_after_ngn": balance, "id": entry_id(account["id"], seq)})
+            last_at = opening_at
+    for entry in entries:
+        seq += 1
+        balance += entry["amount_ngn"]
+        last_at = max(last_at, entry["timestamp"])
+        posted.append({
+            **entry,
+            "timestamp": last_at,
+            "seq": seq,
+            "balance_after_ngn": balance,
+            "id": entry_id(account["id"], seq),
+        })
+    snapshot = {"balance_ngn": balance, "ledger_seq": seq, "ledger_updated_at": last_at, "updated_at": last_at}
+    return posted, snapshot
+
+
+def clamp_page_size(limit: Optional[int]) -> int:
+    return max(1, min(MAX_PAGE_SIZE, limit or DEFAULT_PAGE_SIZE))
+
+
+def encode_cursor(entry: dict) -> str:
+    raw = f"{entry['timestamp']}|{entry['seq']}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        timestamp, seq = raw.rsplit("|", 1)
+        return timestamp, int(seq)
+    except Exception:
+        raise ValueError("Invalid cursor")
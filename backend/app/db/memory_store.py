@@ -0,0 +1,325 @@
+"""
+In-memory storage backend (dev / tests, and fallback when Firestore is not configured).
+
+The process-wide instance (MemoryStore.persistent()) persists every write to an append-only WAL under backend/data/
+so data survives restarts; see app.db.memory_wal. Instances built with MemoryStore() are purely in-memory.
+"""
+
+import atexit
+import bisect
+import json
+import logging
+import uuid
+from pathlib import Path
+from typing import Any, Optional
+
+from app.db.backend import AuditRecord, StorageBackend
+from app.db.ledger import Cursor, apply_entries, group_by_account
+from app.db.memory_wal import MemoryWAL
+
+logger = logging.getLogger(__name__)
+
+_DATA_DIR = Path(__file__).resolve().parent.parent.parent / "data"
+
+# Legacy whole-file JSON persistence (pre-WAL); imported once into the WAL on first start.
+_FIDO2_FILE = _DATA_DIR / "fido2_credentials.json"
+_DEVICE_KEYS_FILE = _DATA_DIR / "device_public_keys.json"
+_DEVICE_AUTH_EVENTS_FILE = _DATA_DIR / "device_auth_events.json"
+
+
+def empty_store() -> dict:
+    return {
+        "customers": {},
+        "accounts": {},
+        "audit_logs": {},
+        "fido2_credentials": {},
+        "device_public_keys": {},
+        "device_auth_events": [],
+        "ledger_entries": [],
+    }
+
+
+class _Index:
+    """Secondary hash index: field value -> record ids (insertion-ordered, so lookups return the oldest match like a scan)."""
+
+    def __init__(self):
+        self._ids: dict[Any, dict[str, None]] = {}
+
+    def add(self, value: Any, record_id: str) -> None:
+        if value is None:
+            return
+        self._ids.setdefault(value, {})[record_id] = None
+
+    def remove(self, value: Any, record_id: str) -> None:
+        ids = self._ids.get(value)
+        if ids is None:
+            return
+        ids.pop(record_id, None)
+        if not ids:
+            del self._ids[value]
+
+    def get(self, value: Any) -> list[str]:
+        return list(self._ids.get(value, ()))
+
+    def first(self, value: Any) -> Optional[str]:
+        ids = self._ids.get(value)
+        return next(iter(ids)) if ids else None
+
+    def clear(self) -> None:
+        self._ids.clear()
+
+
+def _username_key(record: dict) -> Optional[str]:
+    return (record.get("username") or "").strip() or None
+
+
+class _NullWAL:
+    """WAL stand-in for non-persistent stores."""
+
+    def put(self, collection: str, key: str, value: dict) -> None:
+        pass
+
+    def patch(self, collection: str, key: str, fields: dict[str, Any]) -> None:
+        pass
+
+    def append(self, collection: str, value: dict) -> None:
+        pass
+
+
+class MemoryStore(StorageBackend):
+    """Dict-backed storage. Records are returned by reference (callers must not mutate them).
+
+    Hash indexes on bvn, username, account customer_id/account_number and credential customer_id are kept
+    consistent on every write and rebuilt after loading, so lookups never scan a collection. Ledger entries are
+    indexed per account in (timestamp, seq) order, so a statement page is a bisect and a slice.
+    """
+
+    name = "memory"
+
+    def __init__(self, wal: Optional[MemoryWAL] = None):
+        self._data = empty_store()
+        self._wal = wal or _NullWAL()
+        self._customers_by_bvn = _Index()
+        self._customers_by_username = _Index()
+        self._accounts_by_customer = _Index()
+        self._accounts_by_number = _Index()
+        self._fido2_by_customer = _Index()
+        self._ledger_by_account: dict[str, list[dict]] = {}
+        self._ledger_keys: dict[str, list[tuple[str, int]]] = {}
+        self._device_auth_event_ids: set[str] = set()
+        if wal is not None:
+            self._load(wal)
+        self._rebuild_indexes()
+
+    def _rebuild_indexes(self) -> None:
+        for index in (
+            self._customers_by_bvn,
+            self._customers_by_username,
+            self._accounts_by_customer,
+            self._accounts_by_number,
+            self._fido2_by_customer,
+        ):
+            index.clear()
+        for customer_id, c in self._data["customers"].items():
+            self._index_customer(customer_id, c)
+        for acc_id, a in self._data["accounts"].items():
+            self._accounts_by_customer.add(a.get("customer_id"), acc_id)
+            self._accounts_by_number.add(a.get("account_number"), acc_id)
+        for cred_id, cred in self._data["fido2_credentials"].items():
+            self._fido2_by_customer.add(cred.get("customer_id"), cred_id)
+        self._device_auth_event_ids = {e.get("id") for e in self._data["device_auth_events"]}
+        self._ledger_by_account.clear()
+        self._ledger_keys.clear()
+        for entry in sorted(self._data["ledger_entries"], key=lambda e: (e["timestamp"], e["seq"])):
+            self._index_ledger_entry(entry)
+
+    def _index_ledger_entry(self, entry: dict) -> None:
+        self._ledger_by_account.setdefault(entry["account_id"], []).append(entry)
+        self._ledger_keys.setdefault(entry["account_id"], []).append((entry["timestamp"], entry["seq"]))
+
+    def _index_customer(self, customer_id: str, c: dict) -> None:
+        self._customers_by_bvn.add(c.get("bvn"), customer_id)
+        self._customers_by_username.add(_username_key(c), customer_id)
+
+    def _unindex_customer(self, customer_id: str, c: dict) -> None:
+        self._customers_by_bvn.remove(c.get("bvn"), customer_id)
+        self._customers_by_username.remove(_username_key(c), customer_id)
+
+    @classmethod
+    def persistent(cls, data_dir: Path = _DATA_DIR) -> "MemoryStore":
+        """Store backed by the WAL in data_dir (flushed and closed at interpreter exit)."""
+        wal = MemoryWAL(data_dir)
+        store = cls(wal)
+        atexit.register(wal.close)
+        return store
+
+    def _load_legacy_file(self, path: Path, collection: str, expected: type) -> None:
+        """Load a legacy JSON dump into the given collection."""
+        if not path.exists():
+            return
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, expected):
+                if expected is list:
+                    self._data[collection] = data
+                else:
+                    self._data[collection].update(data)
+                logger.info("Imported %d %s record(s) from %s", len(data), collection, path)
+        except Exception as e:
+            logger.warning("Could not load %s from file: %s", collection, e)
+
+    def _load(self, wal: MemoryWAL) -> None:
+        """Load from the WAL. Imports legacy JSON files if no WAL exists yet."""
+        if wal.exists():
+            wal.load(self._data)
+            return
+        self._load_legacy_file(_FIDO2_FILE, "fido2_credentials", dict)
+        self._load_legacy_file(_DEVICE_KEYS_FILE, "device_public_keys", dict)
+        self._load_legacy_file(_DEVICE_AUTH_EVENTS_FILE, "device_auth_events", list)
+        wal.load(self._data)
+        if any(self._data.values()):
+            wal.compact()
+
+    # --- Customers ---
+
+    def create_customer(self, data: dict) -> str:
+        customer_id = str(uuid.uuid4())
+        self._data["customers"][customer_id] = {**data, "id": customer_id}
+        self._index_customer(customer_id, data)
+        self._wal.put("customers", customer_id, self._data["customers"][customer_id])
+        return customer_id
+
+    def get_customer_by_id(self, customer_id: str) -> Optional[dict]:
+        return self._data["customers"].get(customer_id)
+
+    def get_customer_by_bvn(self, bvn: str) -> Optional[dict]:
+        customer_id = self._customers_by_bvn.first(bvn)
+        return self._data["customers"].get(customer_id) if customer_id else None
+
+    def get_customer_by_username(self, username: str) -> Optional[dict]:
+        customer_id = self._customers_by_username.first(username)
+        return self._data["customers"].get(customer_id) if customer_id else None
+
+    def update_customer(self, customer_id: str, fields: dict[str, Any]) -> bool:
+        c = self._data["customers"].get(customer_id)
+        if not c:
+            return False
+        reindex = "bvn" in fields or "username" in fields
+        if reindex:
+            self._unindex_customer(customer_id, c)
+        c.update(fields)
+        if reindex:
+            self._index_customer(customer_id, c)
+        self._wal.patch("customers", customer_id, fields)
+        return True
+
+    def has_customers(self) -> bool:
+        return bool(self._data["customers"])
+
+    # --- FIDO2 credentials ---
+
+    def add_fido2_credential(self, data: dict) -> None:
+        credential_id_b64 = data["credential_id_b64"]
+        previous = self._data["fido2_credentials"].get(credential_id_b64)
+        if previous is not None:
+            self._fido2_by_customer.remove(previous.get("customer_id"), credential_id_b64)
+        self._fido2_by_customer.add(data.get("customer_id"), credential_id_b64)
+        self._data["fido2_credentials"][credential_id_b64] = {**data, "id": credential_id_b64}
+        self._wal.put("fido2_credentials", credential_id_b64, self._data["fido2_credentials"][credential_id_b64])
+
+    def get_fido2_credentials(self, customer_id: str) -> list[dict]:
+        creds = self._data["fido2_credentials"]
+        return [creds[cred_id] for cred_id in self._fido2_by_customer.get(customer_id)]
+
+    def update_fido2_sign_count(self, credential_id_b64: str, sign_count: int, now: str) -> bool:
+        rec = self._data["fido2_credentials"].get(credential_id_b64)
+        if not rec:
+            return False
+        fields = {"sign_count": sign_count, "updated_at": now}
+        rec.update(fields)
+        self._wal.patch("fido2_credentials", credential_id_b64, fields)
+        return True
+
+    # --- Device public keys / events ---
+
+    def set_device_public_key(self, data: dict) -> None:
+        self._data["device_public_keys"][data["customer_id"]] = data
+        self._wal.put("device_public_keys", data["customer_id"], data)
+
+    def get_device_public_key(self, customer_id: str) -> Optional[dict]:
+        return self._data["device_public_keys"].get(customer_id)
+
+    def add_device_auth_event(self, data: dict) -> str:
+        event_id = str(uuid.uuid4())
+        record = {**data, "id": event_id}
+        self._data["device_auth_events"].append(record)
+        self._device_auth_event_ids.add(event_id)
+        self._wal.append("device_auth_events", record)
+        return event_id
+
+    # --- Accounts ---
+
+    def add_account(self, customer_id: str, data: dict) -> str:
+        acc_id = str(uuid.uuid4())
+        self._data["accounts"][acc_id] = {**data, "id": acc_id, "customer_id": customer_id}
+        self._accounts_by_customer.add(customer_id, acc_id)
+        self._accounts_by_number.add(data.get("account_number"), acc_id)
+        self._wal.put("accounts", acc_id, self._data["accounts"][acc_id])
+        return acc_id
+
+    def get_accounts(self, customer_id: str) -> list[dict]:
+        accounts = self._data["accounts"]
+        return [accounts[acc_id] for acc_id in self._accounts_by_customer.get(customer_id)]
+
+    def get_account_by_account_number(self, account_number: str) -> Optional[dict]:
+        acc_id = self._accounts_by_number.first(account_number)
+        return dict(self._data["accounts"][acc_id]) if acc_id else None
+
+    # --- Ledger ---
+
+    def post_ledger_entries(self, entries: list[dict]) -> list[dict]:
+        grouped = group_by_account(entries)
+        accounts = {}
+        for account_id, account_entries in grouped.items():
+            a = self._data["accounts"].get(account_id)
+            if not a or a.get("customer_id") != account_entries[0]["customer_id"]:
+                raise ValueError("Account not found")
+            accounts[account_id] = a
+        stored: list[dict] = []
+        for account_id, account_entries in grouped.items():
+            posted, snapshot = apply_entries(accounts[account_id], account_entries)
+            for entry in posted:
+                self._data["ledger_entries"].append(entry)
+                self._index_ledger_entry(entry)
+                self._wal.append("ledger_entries", entry)
+            accounts[account_id].update(snapshot)
+            self._wal.patch("accounts", account_id, snapshot)
+            stored.extend(posted)
+        return stored
+
+    def get_ledger_entries(self, account_id: str, limit: int, before: Optional[Cursor] = None) -> list[dict]:
+        entries = self._ledger_by_account.get(account_id, [])
+        end = bisect.bisect_left(self._ledger_keys[account_id], before) if before and entries else len(entries)
+        return entries[max(0, end - limit):end][::-1]
+
+    # --- Audit ---
+
+    def add_audit_log(self, record: dict[str, Any]) -> str:
+        log_id = str(uuid.uuid4())
+        self._data["audit_logs"][log_id] = {**record, "id": log_id}
+        self._wal.put("audit_logs", log_id, self._data["audit_logs"][log_id])
+        return log_id
+
+    def write_audit_batch(self, records: list[AuditRecord]) -> None:
+        for collection, record_id, record in records:
+            stored = {**record, "id": record_id}
+            if collection == "device_auth_events":
+                if record_id in self._device_auth_event_ids:
+                    continue  # replayed spool batch that already reached the store
+                self._device_auth_event_ids.add(record_id)
+                self._data["device_auth_events"].append(stored)
+                self._wal.append("device_auth_events", stored)
+            else:
+                self._data["audit_logs"][record_id] = stored
+                self._wal.put("audit_logs", record_id, stored)
@@ -0,0 +1,203 @@
+"""
+Append-only persistence for the in-memory store (dev / no-Firestore mode).
+
+Every mutation is appended as one JSON line to a write-ahead log. Writes are flushed immediately and
+fsync'd in batches (every FSYNC_EVERY records or FSYNC_INTERVAL_SEC, whichever comes first). After
+COMPACT_EVERY records the whole store is written to a snapshot and the log is truncated.
+On startup the snapshot is loaded and the log replayed on top of it.
+
+Record shapes:
+    {"op": "put", "c": <collection>, "k": <key>, "v": <record>}
+    {"op": "patch", "c": <collection>, "k": <key>, "v": <fields>}
+    {"op": "append", "c": <collection>, "v": <record>}     (list collections, e.g. device_auth_events)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+FSYNC_EVERY = 64
+FSYNC_INTERVAL_SEC = 1.0
+COMPACT_EVERY = 10_000
+
+
+def apply_record(store: dict, rec: dict) -> None:
+    """Apply one log record to store in place."""
+    op = rec.get("op")
+    coll = rec.get("c")
+    if coll not in store:
+        return
+    if op == "put":
+        store[coll][rec["k"]] = rec["v"]
+    elif op == "patch":
+        target = store[coll].get(rec["k"])
+        if target is not None:
+            target.update(rec["v"])
+    elif op == "append":
+        store[coll].append(rec["v"])
+
+
+class MemoryWAL:
+    """Write-ahead log + snapshot for a dict-of-collections store. Thread-safe."""
+
+    def __init__(
+        self,
+        data_dir: Path,
+        name: str = "memory_store",
+        fsync_every: int = FSYNC_EVERY,
+        fsync_interval_sec: float = FSYNC_INTERVAL_SEC,
+        compact_every: int = COMPACT_EVERY,
+    ):
+        self.data_dir = Path(data_dir)
+        self.snapshot_path = self.data_dir / f"{name}.snapshot.json"
+        self.wal_path = self.data_dir / f"{name}.wal.jsonl"
+        self.fsync_every = fsync_every
+        self.fsync_interval_sec = fsync_interval_sec
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._fh = None
+        self._store: Optional[dict] = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._records_since_compact = 0
+
+    def exists(self) -> bool:
+        return self.snapshot_path.exists() or self.wal_path.exists()
+
+    def load(self, store: dict) -> int:
+        """Load snapshot and replay the log into store (in place). Returns number of log records replayed."""
+        self._store = store
+        if self.snapshot_path.exists():
+            try:
+                with open(self.snapshot_path, encoding="utf-8") as f:
+                    snap = json.load(f)
+                for coll, value in snap.items():
+                    if coll in store:
+                        store[coll] = value
+            except Exception as e:
+                logger.warning("Could not load memory store snapshot %s: %s", self.snapshot_path, e)
+        replayed = 0
+        if self.wal_path.exists():
+            with open(self.wal_path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        apply_record(store, json.loads(line))
+                    except ValueError:
+                        # Torn final write after a crash; everything before it is intact
+                        logger.warning("Skipping corrupt WAL record in %s", self.wal_path)
+                        continue
+                    replayed += 1
+        self._records_since_compact = replayed
+        logger.info(
+            "Memory store loaded from %s (%d WAL record(s) replayed)",
+            self.data_dir, replayed,
+        )
+        return replayed
+
+    def _open(self):
+        if self._fh is None:
+            self.data_dir.mkdir(parents=True, exist_ok=True)
+            self._fh = open(self.wal_path, "a", encoding="utf-8")
+        return self._fh
+
+    def _sync_locked(self) -> None:
+        if self._fh is not None and self._unsynced:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _write(self, rec: dict) -> None:
+        line = json.dumps(rec, separators=(",", ":"), default=str)
+        with self._lock:
+            try:
+                fh = self._open()
+                fh.write(line + "\n")
+                fh.flush()
+                self._unsynced += 1
+                self._records_since_compact += 1
+                if (
+                    self._unsynced >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval_sec
+                ):
+                    self._sync_locked()
+            except Exception as e:
+                logger.warning("Could not append to memory store WAL: %s", e)
+                return
+            if self._store is not None and self._records_since_compact >= self.compact_every:
+                try:
+                    self._compact_locked()
+                except Exception as e:
+                    # Back off a full interval instead of retrying the O(n) dump on every following write
+                    self._records_since_compact = 0
+                    logger.warning(
+                        "Memory store compaction failed, retrying after %d more records: %s",
+                        self.compact_every, e,
+                    )
+
+    def put(self, collection: str, key: str, value: dict) -> None:
+        self._write({"op": "put", "c": collection, "k": key, "v": value})
+
+    def patch(self, collection: str, key: str, fields: dict[str, Any]) -> None:
+        self._write({"op": "patch", "c": collection, "k": key, "v": fields})
+
+    def append(self, collection: str, value: dict) -> None:
+        self._write({"op": "append", "c": collection, "v": value})
+
+    def _copy_store(self) -> dict:
+        """
+        Copy of the store that is safe to serialise while request threads keep writing to it: the store has no
+        lock of its own, but dict()/list() copies are atomic under the GIL, and records are only replaced or
+        updated at the top level.
+        """
+        snapshot = {}
+        for coll, value in dict(self._store).items():
+            if isinstance(value, list):
+                snapshot[coll] = [dict(r) for r in list(value)]
+            else:
+                snapshot[coll] = {k: dict(r) for k, r in dict(value).items()}
+        return snapshot
+
+    def _compact_locked(self) -> None:
+        """Write a full snapshot atomically, then truncate the log."""
+        snapshot = self._copy_store()
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.snapshot_path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"), default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        with open(self.wal_path, "w", encoding="utf-8"):
+            pass
+        self._unsynced = 0
+        self._records_since_compact = 0
+        logger.info("Memory store compacted into %s", self.snapshot_path)
+
+    def compact(self) -> None:
+        with self._lock:
+            if self._store is not None:
+                self._compact_locked()
+
+    def sync(self) -> None:
+        with self._lock:
+            self._sync_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            self._sync_locked()
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
@@ -0,0 +1,449 @@
+"""
+Embedded SQLite storage backend (single-node deployments without Firestore).
+
+Enable with STORAGE_BACKEND=sqlite; the database file defaults to backend/data/app.db (override with SQLITE_PATH).
+Runs in WAL mode with a small pool of connections, indexes on every lookup field, and executes transfers
+(ledger entries, balance snapshots and audit row) as one multi-statement transaction.
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+from app.db.backend import AuditEntryBuilder, AuditRecord, StorageBackend
+from app.db.ledger import Cursor, apply_entries, group_by_account, transfer_entries
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_PATH = Path(__file__).resolve().parent.parent.parent / "data" / "app.db"
+POOL_SIZE = 8
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS customers (
+    id TEXT PRIMARY KEY,
+    bvn TEXT NOT NULL DEFAULT '',
+    name TEXT,
+    email TEXT,
+    phone TEXT,
+    username TEXT,
+    kyc_completed INTEGER NOT NULL DEFAULT 0,
+    reference_image_base64 TEXT,
+    current_limit_ngn REAL,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_customers_bvn ON customers(bvn);
+CREATE INDEX IF NOT EXISTS idx_customers_username ON customers(username);
+
+CREATE TABLE IF NOT EXISTS accounts (
+    id TEXT PRIMARY KEY,
+    customer_id TEXT NOT NULL,
+    account_number TEXT NOT NULL,
+    account_type TEXT,
+    balance_ngn REAL NOT NULL DEFAULT 0,
+    status TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    ledger_seq INTEGER,
+    ledger_updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_accounts_customer_id ON accounts(customer_id);
+CREATE INDEX IF NOT EXISTS idx_accounts_account_number ON accounts(account_number);
+
+CREATE TABLE IF NOT EXISTS ledger_entries (
+    id TEXT PRIMARY KEY,
+    account_id TEXT NOT NULL,
+    customer_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    entry_type TEXT NOT NULL,
+    amount_ngn REAL NOT NULL,
+    balance_after_ngn REAL NOT NULL,
+    transaction_id TEXT,
+    counterparty_account_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_ledger_account_time ON ledger_entries(account_id, timestamp, seq);
+
+CREATE TABLE IF NOT EXISTS audit_logs (
+    id TEXT PRIMARY KEY,
+    timestamp TEXT,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS fido2_credentials (
+    credential_id_b64 TEXT PRIMARY KEY,
+    customer_id TEXT NOT NULL,
+    credential_data_b64 TEXT,
+    sign_count INTEGER NOT NULL DEFAULT 0,
+    credential_id_client TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_fido2_customer_id ON fido2_credentials(customer_id);
+
+CREATE TABLE IF NOT EXISTS device_public_keys (
+    customer_id TEXT PRIMARY KEY,
+    public_key_b64 TEXT NOT NULL,
+    algorithm TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS device_auth_events (
+    id TEXT PRIMARY KEY,
+    customer_id TEXT NOT NULL,
+    event_type TEXT,
+    created_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_device_auth_events_customer_id ON device_auth_events(customer_id);
+"""
+
+_CUSTOMER_FIELDS = (
+    "bvn", "name", "email", "phone", "username", "kyc_completed",
+    "reference_image_base64", "current_limit_ngn", "created_at", "updated_at",
+)
+_ACCOUNT_FIELDS = (
+    "account_number", "account_type", "balance_ngn", "status", "created_at", "updated_at",
+    "ledger_seq", "ledger_updated_at",
+)
+_LEDGER_FIELDS = (
+    "id", "account_id", "customer_id", "seq", "timestamp", "entry_type", "amount_ngn", "balance_after_ngn",
+    "transaction_id", "counterparty_account_id",
+)
+# Columns added after the first release: (table, column, type); added to existing databases on startup
+_MIGRATIONS = (
+    ("accounts", "ledger_seq", "INTEGER"),
+    ("accounts", "ledger_updated_at", "TEXT"),
+)
+
+
+def _customer_row(row: sqlite3.Row) -> dict:
+    d = dict(row)
+    d["kyc_completed"] = bool(d.get("kyc_completed"))
+    return d
+
+
+class _ConnectionPool:
+    """Fixed-size pool of SQLite connections shared across threads (FastAPI runs sync work in a threadpool)."""
+
+    def __init__(self, path: str, size: int):
+        self._path = path
+        self._pool: queue.LifoQueue = queue.LifoQueue(maxsize=size)
+        self._size = size
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: autocommit per statement; multi-statement work uses explicit BEGIN.
+        conn = sqlite3.connect(self._path, isolation_level=None, check_same_thread=False, timeout=10.0)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self._size
+                if can_create:
+                    self._created += 1
+            conn = self._connect() if can_create else self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+
+class SQLiteStore(StorageBackend):
+    """StorageBackend on SQLite. execute_transfer runs as a single transaction."""
+
+    name = "sqlite"
+    atomic_transfers = True
+
+    def __init__(self, path: Optional[str] = None, pool_size: int = POOL_SIZE):
+        self.path = str(path or os.environ.get("SQLITE_PATH") or _DEFAULT_PATH)
+        if self.path == ":memory:":
+            # every connection to ":memory:" is a separate empty database; one connection keeps them all on one
+            pool_size = 1
+        else:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._pool = _ConnectionPool(self.path, pool_size)
+        with self._pool.connection() as conn:
+            self._migrate(conn)
+            conn.executescript(_SCHEMA)
+        logger.info("SQLite store ready at %s", self.path)
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        """Add columns missing from databases created by an older schema (CREATE TABLE IF NOT EXISTS skips them)."""
+        for table, column, col_type in _MIGRATIONS:
+            existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if existing and column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error). Takes the write lock up front so read-check-write is atomic."""
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _query_one(self, sql: str, params: tuple = ()) -> Optional[sqlite3.Row]:
+        with self._pool.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def _query_all(self, sql: str, params: tuple = ()) -> list[sqlite3.Row]:
+        with self._pool.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _execute(self, sql: str, params: tuple = ()) -> int:
+        """Run one write statement. Returns rowcount."""
+        with self._pool.connection() as conn:
+            return conn.execute(sql, params).rowcount
+
+    # --- Customers ---
+
+    def create_customer(self, data: dict) -> str:
+        customer_id = str(uuid.uuid4())
+        values = [data.get(f) for f in _CUSTOMER_FIELDS]
+        self._execute(
+            f"INSERT INTO customers (id, {', '.join(_CUSTOMER_FIELDS)}) VALUES (?{', ?' * len(_CUSTOMER_FIELDS)})",
+            (customer_id, *values),
+        )
+        return customer_id
+
+    def has_customers(self) -> bool:
+        return self._query_one("SELECT 1 FROM customers LIMIT 1") is not None
+
+    def get_customer_by_id(self, customer_id: str) -> Optional[dict]:
+        row = self._query_one("SELECT * FROM customers WHERE id = ?", (customer_id,))
+        return _customer_row(row) if row else None
+
+    def get_customer_by_username(self, username: str) -> Optional[dict]:
+        row = self._query_one("SELECT * FROM customers WHERE username = ? LIMIT 1", (username,))
+        return _customer_row(row) if row else None
+
+    def get_customer_by_bvn(self, bvn: str) -> Optional[dict]:
+        row = self._query_one("SELECT * FROM customers WHERE bvn = ? LIMIT 1", (bvn,))
+        return _customer_row(row) if row else None
+
+    def update_customer(self, customer_id: str, fields: dict[str, Any]) -> bool:
+        """Update the given customer columns. Returns False if customer not found."""
+        cols = [k for k in fields if k in _CUSTOMER_FIELDS]
+        if not cols:
+            return False
+        assignments = ", ".join(f"{c} = ?" for c in cols)
+        params = tuple(fields[c] for c in cols) + (customer_id,)
+        return self._execute(f"UPDATE customers SET {assignments} WHERE id = ?", params) > 0
+
+    # --- FIDO2 credentials ---
+
+    def add_fido2_credential(self, data: dict) -> None:
+        self._execute(
+            """INSERT OR REPLACE INTO fido2_credentials
+               (credential_id_b64, customer_id, credential_data_b64, sign_count, credential_id_client, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (
+                data["credential_id_b64"], data["customer_id"], data["credential_data_b64"], data["sign_count"],
+                data["credential_id_client"], data["created_at"], data["updated_at"],
+            ),
+        )
+
+    def get_fido2_credentials(self, customer_id: str) -> list[dict]:
+        rows = self._query_all("SELECT * FROM fido2_credentials WHERE customer_id = ?", (customer_id,))
+        return [dict(r) for r in rows]
+
+    def update_fido2_sign_count(self, credential_id_b64: str, sign_count: int, now: str) -> bool:
+        return self._execute(
+            "UPDATE fido2_credentials SET sign_count = ?, updated_at = ? WHERE credential_id_b64 = ?",
+            (sign_count, now, credential_id_b64),
+        ) > 0
+
+    # --- Device public keys / events ---
+
+    def set_device_public_key(self, data: dict) -> None:
+        self._execute(
+            """INSERT OR REPLACE INTO device_public_keys (customer_id, public_key_b64, algorithm, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?)""",
+            (data["customer_id"], data["public_key_b64"], data["algorithm"], data["created_at"], data["updated_at"]),
+        )
+
+    def get_device_public_key(self, customer_id: str) -> Optional[dict]:
+        row = self._query_one("SELECT * FROM device_public_keys WHERE customer_id = ?", (customer_id,))
+        return dict(row) if row else None
+
+    def add_device_auth_event(self, data: dict) -> str:
+        event_id = str(uuid.uuid4())
+        self._execute(
+            "INSERT INTO device_auth_events (id, customer_id, event_type, created_at, data) VALUES (?, ?, ?, ?, ?)",
+            (event_id, data["customer_id"], data["event_type"], data["created_at"], json.dumps(data)),
+        )
+        return event_id
+
+    # --- Accounts ---
+
+    def add_account(self, customer_id: str, data: dict) -> str:
+        acc_id = str(uuid.uuid4())
+        values = [data.get(f) for f in _ACCOUNT_FIELDS]
+        self._execute(
+            f"INSERT INTO accounts (id, customer_id, {', '.join(_ACCOUNT_FIELDS)}) VALUES (?, ?{', ?' * len(_ACCOUNT_FIELDS)})",
+            (acc_id, customer_id, *values),
+        )
+        return acc_id
+
+    def get_accounts(self, customer_id: str) -> list[dict]:
+        rows = self._query_all("SELECT * FROM accounts WHERE customer_id = ? ORDER BY created_at, id", (customer_id,))
+        return [dict(r) for r in rows]
+
+    def get_account_by_account_number(self, account_number: str) -> Optional[dict]:
+        row = self._query_one("SELECT * FROM accounts WHERE account_number = ? LIMIT 1", (account_number,))
+        return dict(row) if row else None
+
+    # --- Ledger ---
+
+    @staticmethod
+    def _post(conn: sqlite3.Connection, entries: list[dict]) -> list[dict]:
+        """Insert entries and update the balance snapshots on an open transaction."""
+        stored: list[dict] = []
+        for account_id, account_entries in group_by_account(entries).items():
+            row = conn.execute(
+                "SELECT * FROM accounts WHERE id = ? AND customer_id = ?", (account_id, account_entries[0]["customer_id"])
+            ).fetchone()
+            if not row:
+                raise ValueError("Account not found")
+            posted, snapshot = apply_entries(dict(row), account_entries)
+            conn.executemany(
+                f"INSERT INTO ledger_entries ({', '.join(_LEDGER_FIELDS)}) VALUES (?{', ?' * (len(_LEDGER_FIELDS) - 1)})",
+                [tuple(e[f] for f in _LEDGER_FIELDS) for e in posted],
+            )
+            conn.execute(
+                "UPDATE accounts SET balance_ngn = ?, ledger_seq = ?, ledger_updated_at = ?, updated_at = ? WHERE id = ?",
+                (snapshot["balance_ngn"], snapshot["ledger_seq"], snapshot["ledger_updated_at"],
+                 snapshot["updated_at"], account_id),
+            )
+            stored.extend(posted)
+        return stored
+
+    def post_ledger_entries(self, entries: list[dict]) -> list[dict]:
+        with self._transaction() as conn:
+            return self._post(conn, entries)
+
+    def get_ledger_entries(self, account_id: str, limit: int, before: Optional[Cursor] = None) -> list[dict]:
+        if before:
+            rows = self._query_all(
+                "SELECT * FROM ledger_entries WHERE account_id = ? AND (timestamp, seq) < (?, ?) "
+                "ORDER BY timestamp DESC, seq DESC LIMIT ?",
+                (account_id, before[0], before[1], limit),
+            )
+        else:
+            rows = self._query_all(
+                "SELECT * FROM ledger_entries WHERE account_id = ? ORDER BY timestamp DESC, seq DESC LIMIT ?",
+                (account_id, limit),
+            )
+        return [dict(r) for r in rows]
+
+    # --- Audit ---
+
+    def add_audit_log(self, record: dict[str, Any]) -> str:
+        log_id = str(uuid.uuid4())
+        self._execute(
+            "INSERT INTO audit_logs (id, timestamp, data) VALUES (?, ?, ?)",
+            (log_id, record.get("timestamp"), json.dumps(record, default=str)),
+        )
+        return log_id
+
+    def write_audit_batch(self, records: list[AuditRecord]) -> None:
+        """All records in one transaction; INSERT OR IGNORE makes a replayed batch a no-op."""
+        logs = [
+            (record_id, record.get("timestamp"), json.dumps(record, default=str))
+            for collection, record_id, record in records
+            if collection == "audit_logs"
+        ]
+        events = [
+            (record_id, record["customer_id"], record.get("event_type"), record.get("created_at"), json.dumps(record))
+            for collection, record_id, record in records
+            if collection == "device_auth_events"
+        ]
+        with self._transaction() as conn:
+            if logs:
+                conn.executemany("INSERT OR IGNORE INTO audit_logs (id, timestamp, data) VALUES (?, ?, ?)", logs)
+            if events:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO device_auth_events (id, customer_id, event_type, created_at, data) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    events,
+                )
+
+    def execute_transfer(
+        self,
+        sender_customer_id: str,
+        sender_account_id: str,
+        beneficiary_account_number: str,
+        amount_ngn: float,
+        limit_default: float,
+        build_audit_entry: AuditEntryBuilder,
+        now: str,
+        audit_sink: Optional[Callable[[dict], Any]] = None,
+        beneficiary: Optional[dict] = None,
+    ) -> str:
+        """Validate, post the ledger entries and write the audit log in one transaction. Raises ValueError like FirestoreClient.
+        audit_sink and beneficiary are ignored: the audit row commits atomically with the balances, and the
+        beneficiary is read (by index) inside the transaction."""
+        with self._transaction() as conn:
+            sender_cust = conn.execute("SELECT * FROM customers WHERE id = ?", (sender_customer_id,)).fetchone()
+            if not sender_cust:
+                raise ValueError("Sender customer not found")
+            if not sender_cust["kyc_completed"]:
+                raise ValueError("Sender must be KYC verified to transfer")
+            sender_acc = conn.execute(
+                "SELECT * FROM accounts WHERE id = ? AND customer_id = ?", (sender_account_id, sender_customer_id)
+            ).fetchone()
+            if not sender_acc:
+                raise ValueError("Sender account not found")
+            if (sender_acc["balance_ngn"] or 0.0) < amount_ngn:
+                raise ValueError("Insufficient balance")
+            limit = sender_cust["current_limit_ngn"] or limit_default
+            if amount_ngn > limit:
+                raise ValueError("Amount exceeds your transfer limit")
+            beneficiary = conn.execute(
+                "SELECT * FROM accounts WHERE account_number = ? LIMIT 1", (beneficiary_account_number,)
+            ).fetchone()
+            if not beneficiary:
+                raise ValueError("Beneficiary account not found")
+            beneficiary_customer_id = beneficiary["customer_id"]
+            beneficiary_cust = conn.execute(
+                "SELECT kyc_completed FROM customers WHERE id = ?", (beneficiary_customer_id,)
+            ).fetchone()
+            if not beneficiary_cust or not beneficiary_cust["kyc_completed"]:
+                raise ValueError("Beneficiary must be KYC verified to receive transfers")
+            if beneficiary_customer_id == sender_customer_id and beneficiary["id"] == sender_account_id:
+                raise ValueError("Cannot transfer to the same account")
+            transaction_id = str(uuid.uuid4())
+            audit_entry = build_audit_entry(transaction_id, beneficiary_customer_id, now)
+            self._post(conn, transfer_entries(
+                transaction_id, sender_customer_id, sender_account_id, beneficiary_customer_id, beneficiary["id"],
+                amount_ngn, now,
+            ))
+            conn.execute(
+                "INSERT INTO audit_logs (id, timestamp, data) VALUES (?, ?, ?)",
+                (str(uuid.uuid4()), now, json.dumps(audit_entry, default=str)),
+            )
+        return transaction_id
+
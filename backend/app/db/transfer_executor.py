@@ -0,0 +1,92 @@
+"""
+Per-account serialized execution of transfers (in-process).
+
+Backends without transactional transfers read balances, check them and write them back, so two concurrent
+transfers touching the same account could both pass the balance check. ShardedTransferExecutor hashes account ids
+onto a fixed number of shards, each a single worker thread with a FIFO queue. A transfer runs on the shards of
+both its accounts: it is queued on the lower shard, whose worker then queues it on the higher shard and waits
+for it there. Waits only go from lower to higher shards, so there is no deadlock; transfers on disjoint shards run
+in parallel and same-account transfers run one at a time in arrival order.
+
+This serializes within one process only; backends with atomic transfers (SQLite) bypass it.
+Shard count: TRANSFER_SHARDS env var (default 16).
+"""
+
+import os
+import threading
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Optional
+
+DEFAULT_SHARDS = 16
+
+
+class ShardedTransferExecutor:
+    def __init__(self, shards: int = DEFAULT_SHARDS):
+        self._workers = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"transfer-shard-{i}") for i in range(shards)
+        ]
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.executed = 0
+
+    def shard_of(self, key: str) -> int:
+        return zlib.crc32(key.encode("utf-8")) % len(self._workers)
+
+    def _chain(self, shards: list[int], fn: Callable[[], Any]) -> Future:
+        if len(shards) == 1:
+            return self._workers[shards[0]].submit(fn)
+        rest = shards[1:]
+        return self._workers[shards[0]].submit(lambda: self._chain(rest, fn).result())
+
+    def submit(self, keys: Iterable[str], fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """Run fn(*args, **kwargs) serialized with every other submission sharing a shard with any of keys."""
+        shards = sorted({self.shard_of(k) for k in keys})
+        if not shards:
+            raise ValueError("At least one account key is required")
+
+        def task() -> Any:
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+                    self.executed += 1
+
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return self._chain(shards, task)
+
+    def run(self, keys: Iterable[str], fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """submit() and wait; exceptions from fn propagate."""
+        return self.submit(keys, fn, *args, **kwargs).result()
+
+    def shutdown(self) -> None:
+        for worker in self._workers:
+            worker.shutdown(wait=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "shards": len(self._workers),
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "executed": self.executed,
+        }
+
+
+_executor: Optional[ShardedTransferExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_transfer_executor() -> ShardedTransferExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ShardedTransferExecutor(int(os.environ.get("TRANSFER_SHARDS") or DEFAULT_SHARDS))
+        return _executor
+
+
+def transfer_executor_stats() -> Optional[dict[str, Any]]:
+    return _executor.stats() if _executor is not None else None
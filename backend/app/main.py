@@ -4,6 +4,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 import uvicorn
+import asyncio
 import logging
 import time
 import socket
@@ -41,7 +42,19 @@ async def lifespan(app: FastAPI):
             logger.info("Seeded %d mock customers (Alice, Bob, Carol) with accounts for transfer testing.", created)
     except Exception as e:
         logger.warning("Seed mock data skipped or failed: %s", e)
+    # Build the shared FIDO2 server up front so the first passkey request doesn't pay for it
+    try:
+        fido2.get_fido2_server()
+    except Exception as e:
+        logger.warning("FIDO2 server not initialised: %s", getattr(e, "detail", e))
+    # Expire abandoned FIDO2 / device-auth flow state in the background
+    from app.services.state_store import run_periodic_sweep
+    sweeper = asyncio.create_task(run_periodic_sweep())
     yield
+    sweeper.cancel()
+    # Drain queued audit records to storage (anything not written in time is spooled to disk)
+    from app.db.audit_writer import shutdown_audit_writer
+    shutdown_audit_writer()
 
 # Configure logging with timestamp and level
 import sys
@@ -184,11 +197,19 @@ async def warmup_models():
 async def health_check():
     """Health check endpoint"""
     try:
+        from app.db.audit_writer import audit_writer_stats
+        from app.db.transfer_executor import transfer_executor_stats
+        from app.services.loader import spoof_model_stats
+        from app.services.state_store import all_stats
         # Check if services are initialized
         return {
             "status": "healthy",
             "face_verification": "ready",
-            "spoof_detection": "ready"
+            "spoof_detection": "ready",
+            "state_stores": all_stats(),
+            "audit_writer": audit_writer_stats(),
+            "transfer_executor": transfer_executor_stats(),
+            "spoof_models": spoof_model_stats(),
         }
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
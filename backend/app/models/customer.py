@@ -22,6 +22,26 @@ class AccountResponse(AccountBase):
     updated_at: Optional[str] = None
 
 
+class LedgerEntryResponse(BaseModel):
+    """One ledger entry: amount_ngn is signed (credit > 0, debit < 0)."""
+    id: str
+    seq: int
+    timestamp: str
+    entry_type: str
+    amount_ngn: float
+    balance_after_ngn: float
+    transaction_id: Optional[str] = None
+    counterparty_account_id: Optional[str] = None
+
+
+class AccountStatementResponse(BaseModel):
+    """One page of an account statement, newest first. Pass next_cursor back as ?cursor= for the next page."""
+    account_id: str
+    balance_ngn: float
+    entries: list[LedgerEntryResponse]
+    next_cursor: Optional[str] = None
+
+
 class CustomerBase(BaseModel):
     bvn: str
     name: str
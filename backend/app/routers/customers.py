@@ -1,7 +1,9 @@
 """Customer and account CRUD API."""
 
 import logging
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
 
 from app.db.firestore_client import FirestoreClient
 from app.models.customer import (
@@ -10,6 +12,7 @@ from app.models.customer import (
     CustomerKycStatus,
     UpdateLimitBody,
     AccountResponse,
+    AccountStatementResponse,
     EnsureByUsernameBody,
     EnsureByUsernameResponse,
 )
@@ -107,6 +110,23 @@ async def get_customer_accounts(customer_id: str):
     ]
 
 
+@router.get("/{customer_id}/accounts/{account_id}/statement", response_model=AccountStatementResponse)
+async def get_account_statement(
+    customer_id: str,
+    account_id: str,
+    limit: int = Query(default=50, ge=1, le=200),
+    cursor: Optional[str] = None,
+):
+    """Ledger entries for an account, newest first, with the running balance after each entry."""
+    try:
+        statement = db.get_account_statement(customer_id, account_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if statement is None:
+        raise HTTPException(status_code=404, detail="Account not found")
+    return statement
+
+
 @router.get("/{customer_id}/kyc-status", response_model=CustomerKycStatus)
 async def get_kyc_status(customer_id: str):
     """Get KYC status and current limit for a customer."""
@@ -10,23 +10,24 @@ import hashlib
 import logging
 import secrets
 import uuid
-from typing import Any
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from app.config import get_settings
 from app.db.firestore_client import FirestoreClient
 from app.routers.fido2 import set_transaction_authorized, store_transaction_state
+from app.services.device_keys import get_customer_key, invalidate_customer_key, verify_customer_signature
+from app.services.state_store import create_challenge_state
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/device-auth", tags=["device-auth"])
 db = FirestoreClient()
 
-# One-time login challenges: customer_id -> { "challenge_raw_b64", "challenge_bytes" } (clear after verify or TTL)
-_challenge_store: dict[str, dict[str, Any]] = {}
-
-# Ed25519: public key 32 bytes, signature 64 bytes
-CHALLENGE_BYTES = 32
+# One-time login challenges: challenge -> { "customer_id" } (consumed by verify, or expired after TTL)
+_challenge_store = create_challenge_state(
+    "device_auth_challenges", get_settings().auth_state_ttl_seconds, get_settings().auth_state_max_entries
+)
 
 
 def _b64_decode(s: str) -> bytes:
@@ -44,25 +45,6 @@ def _b64_encode(b: bytes) -> str:
     return base64.urlsafe_b64encode(b).rstrip(b"=").decode("ascii")
 
 
-def _verify_ed25519(public_key_b64: str, message: bytes, signature_b64: str) -> bool:
-    try:
-        from cryptography.exceptions import InvalidSignature
-        from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
-
-        pk_bytes = _b64_decode(public_key_b64)
-        sig_bytes = _b64_decode(signature_b64)
-        if len(pk_bytes) != 32 or len(sig_bytes) != 64:
-            return False
-        key = Ed25519PublicKey.from_public_bytes(pk_bytes)
-        key.verify(sig_bytes, message)
-        return True
-    except InvalidSignature:
-        return False
-    except Exception as e:
-        logger.warning("Ed25519 verify error: %s", e)
-        return False
-
-
 # --- Request/response models ---
 
 
@@ -110,6 +92,7 @@ async def register(body: RegisterBody):
         logger.warning("[device-auth] register invalid key: %s", e)
         raise HTTPException(status_code=400, detail=f"Invalid public key encoding: {e}")
     db.set_device_public_key(body.customer_id, pk_b64, algorithm="ed25519")
+    invalidate_customer_key(body.customer_id)
     out = {"registered": True, "customer_id": body.customer_id}
     logger.info("[device-auth] register response: %s", out)
     return out
@@ -119,13 +102,11 @@ async def register(body: RegisterBody):
 async def challenge(body: ChallengeBody):
     """Return a one-time challenge for the client to sign (after local biometrics). Used for login."""
     logger.info("[device-auth] challenge request: customer_id=%s", body.customer_id)
-    key_doc = db.get_device_public_key(body.customer_id)
-    if not key_doc:
+    if get_customer_key(body.customer_id, db.get_device_public_key) is None:
         logger.warning("[device-auth] challenge: no device key for customer_id=%s", body.customer_id)
         raise HTTPException(status_code=400, detail="No device key registered for this customer")
-    challenge_bytes = secrets.token_bytes(CHALLENGE_BYTES)
+    challenge_bytes = _challenge_store.issue({"customer_id": body.customer_id})
     challenge_b64 = _b64_encode(challenge_bytes)
-    _challenge_store[body.customer_id] = {"challenge_raw_b64": challenge_b64, "challenge_bytes": challenge_bytes}
     out = {"challenge": challenge_b64}
     logger.info("[device-auth] challenge response: challenge_len=%d", len(challenge_b64))
     return out
@@ -138,16 +119,18 @@ async def verify(body: VerifyBody):
         "[device-auth] verify request: customer_id=%s challenge_len=%d signature_len=%d",
         body.customer_id, len(body.challenge or ""), len(body.signature or ""),
     )
-    if body.customer_id not in _challenge_store:
+    try:
+        message = _b64_decode(body.challenge)
+    except Exception:
+        message = b""
+    stored = _challenge_store.take(message) if message else None
+    if stored is None or stored.get("customer_id") != body.customer_id:
         logger.warning("[device-auth] verify: no challenge for customer_id=%s", body.customer_id)
         raise HTTPException(status_code=400, detail="No challenge for this customer or challenge expired")
-    key_doc = db.get_device_public_key(body.customer_id)
-    if not key_doc:
-        _challenge_store.pop(body.customer_id, None)
+    verified = verify_customer_signature(body.customer_id, message, body.signature, db.get_device_public_key)
+    if verified is None:
         raise HTTPException(status_code=400, detail="No device key registered")
-    stored = _challenge_store.pop(body.customer_id)
-    message = stored["challenge_bytes"]
-    if not _verify_ed25519(key_doc["public_key_b64"], message, body.signature):
+    if not verified:
         logger.warning("[device-auth] verify: signature verification failed for customer_id=%s", body.customer_id)
         raise HTTPException(status_code=401, detail="Signature verification failed")
     try:
@@ -172,15 +155,13 @@ async def transaction_challenge(body: TransactionChallengeBody):
         "[device-auth] transaction-challenge request: customer_id=%s amount_ngn=%s beneficiary=%s",
         body.customer_id, body.amount_ngn, body.beneficiary_account_number,
     )
-    key_doc = db.get_device_public_key(body.customer_id)
-    if not key_doc:
+    if get_customer_key(body.customer_id, db.get_device_public_key) is None:
         logger.warning("[device-auth] transaction-challenge: no device key for customer_id=%s", body.customer_id)
         raise HTTPException(status_code=400, detail="No device key registered for this customer")
     nonce = secrets.token_hex(16)
     ts = str(uuid.uuid4())
     challenge_raw = f"{body.amount_ngn}|{body.beneficiary_account_number}|{nonce}|{ts}"
     challenge_hash = hashlib.sha256(challenge_raw.encode()).digest()
-    state_id = secrets.token_urlsafe(24)
     pending = {
         "customer_id": body.customer_id,
         "amount_ngn": body.amount_ngn,
@@ -189,7 +170,7 @@ async def transaction_challenge(body: TransactionChallengeBody):
         "nonce": nonce,
         "transaction_hash": challenge_raw,
     }
-    store_transaction_state(state_id, pending)
+    state_id = store_transaction_state(pending)
     out = {
         "state_id": state_id,
         "challenge": _b64_encode(challenge_hash),
@@ -213,11 +194,11 @@ async def transaction_verify(body: TransactionVerifyBody):
         logger.warning("[device-auth] transaction-verify: no pending state_id=%s", body.state_id)
         raise HTTPException(status_code=400, detail="Invalid or expired state_id; call transaction-challenge again")
     customer_id = pending["customer_id"]
-    key_doc = db.get_device_public_key(customer_id)
-    if not key_doc:
-        raise HTTPException(status_code=400, detail="No device key registered")
     message = pending["challenge"]  # bytes (sha256 hash)
-    if not _verify_ed25519(key_doc["public_key_b64"], message, body.signature):
+    verified = verify_customer_signature(customer_id, message, body.signature, db.get_device_public_key)
+    if verified is None:
+        raise HTTPException(status_code=400, detail="No device key registered")
+    if not verified:
         logger.warning("[device-auth] transaction-verify: signature failed state_id=%s", body.state_id)
         raise HTTPException(status_code=401, detail="Transaction signature verification failed")
     challenge_b64 = _b64_encode(pending["challenge"])
@@ -10,7 +10,9 @@ KYC flow remains for limits and device registration; this flow is for auth and t
 
 import base64
 import hashlib
+import json
 import logging
+from functools import lru_cache
 import os
 import secrets
 import uuid
@@ -19,7 +21,8 @@ from typing import Any
 from fastapi import APIRouter, HTTPException
 
 from app.config import get_settings
-from app.db.firestore_client import FirestoreClient
+from app.db.firestore_client import FirestoreClient, on_fido2_credentials_changed
+from app.services.state_store import LocalStateStore, create_challenge_state, create_transaction_state
 from app.models.fido2 import (
     Fido2AuthenticateCompleteBody,
     Fido2CustomerBody,
@@ -32,10 +35,24 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/fido2", tags=["fido2"])
 db = FirestoreClient()
 
-# In-memory session state (in production use Redis or signed cookies)
-_registration_state: dict[str, Any] = {}
-_auth_state: dict[str, Any] = {}
-_transaction_state: dict[str, dict[str, Any]] = {}
+# Session state between begin/complete calls (TTL-bounded, local/redis/token; see app.services.state_store).
+# Registration/login state is keyed by the WebAuthn challenge, which the client echoes back in clientDataJSON.
+_settings = get_settings()
+_registration_state = create_challenge_state(
+    "fido2_registration", _settings.auth_state_ttl_seconds, _settings.auth_state_max_entries
+)
+_auth_state = create_challenge_state("fido2_auth", _settings.auth_state_ttl_seconds, _settings.auth_state_max_entries)
+# Pending transfers: in token mode the state_id is the sealed transaction itself (no lookup to issue a challenge).
+_transaction_state = create_transaction_state(
+    "transactions", _settings.transaction_state_ttl_seconds, _settings.auth_state_max_entries
+)
+
+# Parsed credentials per customer: customer_id -> { "credentials": [AttestedCredentialData], "id_client_map" }.
+# Per process; dropped on every credential write through FirestoreClient (see on_fido2_credentials_changed below),
+# and refreshed on TTL or when an assertion names an unknown credential (e.g. registered via another worker).
+_credential_cache = LocalStateStore(
+    "fido2_credential_cache", _settings.fido2_credential_cache_ttl_seconds, _settings.auth_state_max_entries
+)
 
 
 def consume_authorized_transaction(state_id: str) -> dict[str, Any] | None:
@@ -43,24 +60,17 @@ def consume_authorized_transaction(state_id: str) -> dict[str, Any] | None:
     If state_id exists and is authorized, return the pending transaction dict and remove it.
     Used by POST /api/transactions/transfer when client sends state_id (FIDO2 or device-auth flow).
     """
-    if state_id not in _transaction_state:
-        return None
-    pending = _transaction_state[state_id]
-    if not pending.get("authorized"):
-        return None
-    del _transaction_state[state_id]
-    return pending
+    return _transaction_state.consume(state_id)
 
 
-def store_transaction_state(state_id: str, pending: dict[str, Any]) -> None:
-    """Store pending transaction state (used by device-auth transaction-challenge)."""
-    _transaction_state[state_id] = pending
+def store_transaction_state(pending: dict[str, Any]) -> str:
+    """Store pending transaction state and return its state_id (used by device-auth transaction-challenge)."""
+    return _transaction_state.create(pending)
 
 
 def set_transaction_authorized(state_id: str) -> None:
     """Mark a pending transaction as authorized (used by device-auth transaction-verify)."""
-    if state_id in _transaction_state:
-        _transaction_state[state_id]["authorized"] = True
+    _transaction_state.authorize(state_id)
 
 
 def get_pending_transaction(state_id: str) -> dict[str, Any] | None:
@@ -79,15 +89,29 @@ def _b64url_decode(s: str) -> bytes:
     return base64.urlsafe_b64decode(s)
 
 
-def _get_fido2_server():
+def _client_data_challenge(client_data: Any) -> bytes | None:
+    """Challenge bytes from clientDataJSON (raw bytes or base64url string), or None if unreadable."""
     try:
-        from fido2.server import Fido2Server
-        from fido2.webauthn import PublicKeyCredentialRpEntity
-    except ImportError as e:
-        raise HTTPException(status_code=503, detail=f"FIDO2 not available: {e}. Install with: pip install fido2")
-    settings = get_settings()
-    rp = PublicKeyCredentialRpEntity(id=settings.fido2_rp_id, name=settings.fido2_rp_name)
-    if settings.fido2_allow_any_origin:
+        if isinstance(client_data, str):
+            client_data = _b64url_decode(client_data)
+        return _b64url_decode(json.loads(client_data)["challenge"])
+    except Exception:
+        return None
+
+
+def _fido2_state(challenge: bytes) -> dict[str, Any]:
+    """python-fido2 begin/complete state for a challenge we issued (same shape as Fido2Server returns)."""
+    return {"challenge": _b64url_encode(challenge), "user_verification": "required"}
+
+
+@lru_cache(maxsize=4)
+def _build_fido2_server(rp_id: str, rp_name: str, allow_any_origin: bool):
+    """One Fido2Server per RP configuration (the server is stateless between calls, so it is shared)."""
+    from fido2.server import Fido2Server
+    from fido2.webauthn import PublicKeyCredentialRpEntity
+
+    rp = PublicKeyCredentialRpEntity(id=rp_id, name=rp_name)
+    if allow_any_origin:
         # Dev-only: bypass strict origin checking so we can test from mobile apps
         # even when origins (android:apk-key-hash:..., https://ngrok-host, etc.)
         # don't exactly match the rp.id / expected origin.
@@ -99,6 +123,15 @@ def _get_fido2_server():
     return Fido2Server(rp)
 
 
+def get_fido2_server():
+    """Shared Fido2Server for the configured RP (built at startup; see app.main lifespan)."""
+    settings = get_settings()
+    try:
+        return _build_fido2_server(settings.fido2_rp_id, settings.fido2_rp_name, settings.fido2_allow_any_origin)
+    except ImportError as e:
+        raise HTTPException(status_code=503, detail=f"FIDO2 not available: {e}. Install with: pip install fido2")
+
+
 def _get_opt(options: Any, key: str) -> Any:
     """Get value from options (dict-like or object). Supports both camelCase and snake_case."""
     if hasattr(options, "get") and callable(getattr(options, "get")):
@@ -202,12 +235,18 @@ def _webauthn_options_to_client(
     return out
 
 
-def _load_credentials_for_customer(customer_id: str) -> list:
-    """Load AttestedCredentialData list from DB for use with fido2 server."""
+def _load_customer_credentials(customer_id: str, credential_id: bytes | None = None) -> dict[str, Any]:
+    """Cached { "credentials", "id_client_map" } for a customer. Reloads from DB on miss, or when credential_id
+    (from an assertion) is not among the cached credentials."""
+    cached = _credential_cache.get(customer_id)
+    if cached is not None and (
+        credential_id is None or any(c.credential_id == credential_id for c in cached["credentials"])
+    ):
+        return cached
     try:
         from fido2.webauthn import AttestedCredentialData
     except ImportError:
-        return []
+        return {"credentials": [], "id_client_map": {}}
     rows = db.get_fido2_credentials(customer_id)
     creds = []
     for row in rows:
@@ -220,7 +259,27 @@ def _load_credentials_for_customer(customer_id: str) -> list:
             creds.append(att_cred)
         except Exception as e:
             logger.warning("Skip invalid credential for %s: %s", customer_id, e)
-    return creds
+    # credential_id_b64 -> client rawId so allowCredentials uses exact ID device expects
+    id_client_map = {r["credential_id_b64"]: r["credential_id_client"] for r in rows if r.get("credential_id_client")}
+    entry = {"credentials": creds, "id_client_map": id_client_map}
+    _credential_cache.set(customer_id, entry)
+    return entry
+
+
+def _load_credentials_for_customer(customer_id: str, credential_id: bytes | None = None) -> list:
+    """AttestedCredentialData list for use with fido2 server (cached; see _load_customer_credentials)."""
+    return _load_customer_credentials(customer_id, credential_id)["credentials"]
+
+
+def invalidate_credential_cache(customer_id: str | None) -> None:
+    """Drop cached credentials after a credential is added or its sign count changes (all of them if None)."""
+    if customer_id is None:
+        _credential_cache.clear()
+    else:
+        _credential_cache.pop(customer_id)
+
+
+on_fido2_credentials_changed(invalidate_credential_cache)
 
 
 # --- Registration ---
@@ -236,20 +295,21 @@ async def register_begin(body: Fido2CustomerBody):
     cust = db.get_customer_by_id(customer_id)
     if not cust:
         raise HTTPException(status_code=404, detail="Customer not found")
-    server = _get_fido2_server()
+    server = get_fido2_server()
     user_id = os.urandom(16)
     user = {"id": user_id, "name": customer_id, "displayName": cust.get("name") or customer_id}
     existing = _load_credentials_for_customer(customer_id)
+    challenge = _registration_state.issue({"customer_id": customer_id})
     try:
-        registration_data, state = server.register_begin(
+        registration_data, _ = server.register_begin(
             user,
             credentials=existing,
             user_verification="required",
+            challenge=challenge,
         )
     except Exception as e:
         logger.exception("register_begin failed")
         raise HTTPException(status_code=400, detail=str(e))
-    _registration_state[customer_id] = {"state": state, "user_id": user_id}
     return _webauthn_options_to_client(registration_data)
 
 
@@ -258,16 +318,17 @@ async def register_complete(customer_id: str, body: Fido2RegisterCompleteBody):
     """
     Complete registration: verify attestation and store credential.
     """
-    if customer_id not in _registration_state:
+    # Client sends PublicKeyCredential: { id, rawId, response: { clientDataJSON, attestationObject }, type }
+    cred = body.credential
+    response = cred.get("response") or {}
+    client_data_json = response.get("clientDataJSON")
+    challenge = _client_data_challenge(client_data_json) if client_data_json else None
+    stored = _registration_state.take(challenge) if challenge else None
+    if stored is None or stored.get("customer_id") != customer_id:
         raise HTTPException(status_code=400, detail="No registration in progress; call register/begin first")
-    server = _get_fido2_server()
-    state = _registration_state[customer_id]["state"]
+    server = get_fido2_server()
+    state = _fido2_state(challenge)
     try:
-        from fido2.webauthn import AttestedCredentialData
-        # Client sends PublicKeyCredential: { id, rawId, response: { clientDataJSON, attestationObject }, type }
-        cred = body.credential
-        response = cred.get("response") or {}
-        client_data_json = response.get("clientDataJSON")
         attestation_obj = response.get("attestationObject")
         if not client_data_json or not attestation_obj:
             raise HTTPException(status_code=400, detail="Missing clientDataJSON or attestationObject")
@@ -279,8 +340,6 @@ async def register_complete(customer_id: str, body: Fido2RegisterCompleteBody):
     except Exception as e:
         logger.exception("register_complete failed")
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        _registration_state.pop(customer_id, None)
 
     credential_id_bytes = auth_data.credential_data.credential_id
     credential_data_bytes = bytes(auth_data.credential_data)
@@ -306,39 +365,38 @@ async def register_complete(customer_id: str, body: Fido2RegisterCompleteBody):
 async def authenticate_begin(body: Fido2CustomerBody):
     """Start FIDO2 authentication. Returns challenge options for getAssertion."""
     customer_id = body.customer_id
-    creds = _load_credentials_for_customer(customer_id)
+    loaded = _load_customer_credentials(customer_id)
+    creds = loaded["credentials"]
     if not creds:
         raise HTTPException(status_code=400, detail="No passkey registered; complete registration first")
-    server = _get_fido2_server()
+    server = get_fido2_server()
+    challenge = _auth_state.issue({"customer_id": customer_id})
     try:
-        auth_data, state = server.authenticate_begin(creds, user_verification="required")
+        auth_data, _ = server.authenticate_begin(creds, user_verification="required", challenge=challenge)
     except Exception as e:
         logger.exception("authenticate_begin failed")
         raise HTTPException(status_code=400, detail=str(e))
-    _auth_state[customer_id] = {"state": state, "credentials": creds}
-    # Build map: credential_id_b64 -> client rawId so allowCredentials uses exact ID device expects
-    rows = db.get_fido2_credentials(customer_id)
-    id_client_map = {r["credential_id_b64"]: r["credential_id_client"] for r in rows if r.get("credential_id_client")}
     return _webauthn_options_to_client(
-        auth_data, omit_allow_credentials=False, credential_id_client_map=id_client_map
+        auth_data, omit_allow_credentials=False, credential_id_client_map=loaded["id_client_map"]
     )
 
 
 @router.post("/authenticate/complete/{customer_id}")
 async def authenticate_complete(customer_id: str, body: Fido2AuthenticateCompleteBody):
     """Complete login: verify assertion."""
-    if customer_id not in _auth_state:
+    assertion = body.assertion
+    challenge = _client_data_challenge(assertion.get("clientDataJSON"))
+    stored = _auth_state.take(challenge) if challenge else None
+    if stored is None or stored.get("customer_id") != customer_id:
         raise HTTPException(status_code=400, detail="No authentication in progress; call authenticate/begin first")
-    server = _get_fido2_server()
-    stored = _auth_state[customer_id]
-    state = stored["state"]
-    creds = stored["credentials"]
+    server = get_fido2_server()
+    state = _fido2_state(challenge)
     try:
-        assertion = body.assertion
         # Client sends assertion with authenticatorData, clientDataJSON, signature, etc.
         credential_id = assertion.get("credentialId") or assertion.get("rawId")
         if isinstance(credential_id, str):
             credential_id = _b64url_decode(credential_id)
+        creds = _load_credentials_for_customer(customer_id, credential_id)
         client_data = assertion.get("clientDataJSON")
         if isinstance(client_data, str):
             client_data = _b64url_decode(client_data)
@@ -354,8 +412,6 @@ async def authenticate_complete(customer_id: str, body: Fido2AuthenticateComplet
     except Exception as e:
         logger.exception("authenticate_complete failed")
         raise HTTPException(status_code=401, detail=str(e))
-    finally:
-        _auth_state.pop(customer_id, None)
     return {"authenticated": True}
 
 
@@ -379,15 +435,14 @@ async def transaction_initiate(body: Fido2TransactionInitiateBody):
     ts = str(uuid.uuid4())
     challenge_raw = f"{body.amount_ngn}|{body.beneficiary_account_number}|{nonce}|{ts}"
     challenge = hashlib.sha256(challenge_raw.encode()).digest()
-    state_id = secrets.token_urlsafe(24)
-    _transaction_state[state_id] = {
+    state_id = store_transaction_state({
         "customer_id": customer_id,
         "amount_ngn": body.amount_ngn,
         "beneficiary_account_number": body.beneficiary_account_number,
         "challenge": challenge,
         "nonce": nonce,
         "transaction_hash": challenge_raw,
-    }
+    })
     return {
         "state_id": state_id,
         "challenge": _b64url_encode(challenge),
@@ -404,9 +459,9 @@ async def transaction_authorize(body: Fido2TransactionAuthorizeBody):
     the same params and includes the verified assertion in the audit payload.
     """
     state_id = body.state_id
-    if state_id not in _transaction_state:
+    pending = _transaction_state.get(state_id)
+    if pending is None:
         raise HTTPException(status_code=400, detail="Invalid or expired state_id; call transaction/initiate again")
-    pending = _transaction_state[state_id]
     if (
         pending["customer_id"] != body.sender_customer_id
         or pending["amount_ngn"] != body.amount_ngn
@@ -415,7 +470,7 @@ async def transaction_authorize(body: Fido2TransactionAuthorizeBody):
         raise HTTPException(status_code=400, detail="Transaction params do not match initiate")
     challenge = pending["challenge"]
     # Verify assertion: client signed the challenge with their passkey
-    server = _get_fido2_server()
+    server = get_fido2_server()
     creds = _load_credentials_for_customer(body.sender_customer_id)
     if not creds:
         raise HTTPException(status_code=400, detail="No credentials")
@@ -433,14 +488,16 @@ async def transaction_authorize(body: Fido2TransactionAuthorizeBody):
         signature = assertion.get("signature")
         if isinstance(signature, str):
             signature = _b64url_decode(signature)
-        # We need to run authenticate_begin to get state, then authenticate_complete with the assertion
-        auth_options, state = server.authenticate_begin(creds, user_verification="required")
-        server.authenticate_complete(state, creds, credential_id, client_data, auth_data, signature)
+        creds = _load_credentials_for_customer(body.sender_customer_id, credential_id)
+        # Verify against the challenge issued by transaction/initiate (no extra begin round)
+        server.authenticate_complete(
+            _fido2_state(challenge), creds, credential_id, client_data, auth_data, signature
+        )
     except Exception as e:
         logger.exception("transaction_authorize verify failed")
         raise HTTPException(status_code=401, detail=f"Assertion verification failed: {e}")
 
-    pending["authorized"] = True
+    set_transaction_authorized(state_id)
     return {
         "authorized": True,
         "state_id": state_id,
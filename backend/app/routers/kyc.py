@@ -3,7 +3,10 @@
 import base64
 import io
 import logging
+from typing import Optional
+
 from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 
 from app.db.firestore_client import FirestoreClient
 from app.models.response import VerificationResponse
@@ -16,8 +19,46 @@ FIRESTORE_MAX_BYTES = 1_048_576
 REFERENCE_IMAGE_MAX_B64_BYTES = FIRESTORE_MAX_BYTES - 10_000  # safety margin
 
 
+# Longest side for stored reference images; plenty for face matching and keeps encodes cheap.
+REFERENCE_IMAGE_MAX_DIM = 1024
+REFERENCE_IMAGE_MIN_DIM = 400
+JPEG_QUALITY_MAX = 90
+JPEG_QUALITY_MIN = 25
+
+
+def _b64_len(raw_len: int) -> int:
+    """Length of the padded base64 encoding of raw_len bytes."""
+    return 4 * ((raw_len + 2) // 3)
+
+
+def _encode_jpeg(img, quality: int) -> bytes:
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality)
+    return out.getvalue()
+
+
+def _fit_jpeg_quality(img, max_raw_len: int) -> Optional[bytes]:
+    """Binary-search the highest JPEG quality whose output fits max_raw_len bytes. None if even the lowest does not."""
+    lo, hi = JPEG_QUALITY_MIN, JPEG_QUALITY_MAX
+    best = None
+    while lo <= hi:
+        quality = (lo + hi) // 2
+        data = _encode_jpeg(img, quality)
+        if len(data) <= max_raw_len:
+            best = data
+            lo = quality + 1
+        else:
+            hi = quality - 1
+    return best
+
+
 def _compress_reference_image(image_bytes: bytes, max_b64_len: int = REFERENCE_IMAGE_MAX_B64_BYTES) -> str:
-    """Resize/compress image so base64 fits in Firestore. Returns base64 string."""
+    """Resize/compress image so base64 fits in Firestore. Returns base64 string.
+
+    Resizes once to REFERENCE_IMAGE_MAX_DIM, then binary-searches JPEG quality against the raw byte
+    budget (base64 length is derived arithmetically, so only the chosen output is base64-encoded).
+    CPU-bound; call through _compress_reference_image_async from request handlers.
+    """
     try:
         from PIL import Image
     except ImportError:
@@ -29,35 +70,30 @@ def _compress_reference_image(image_bytes: bytes, max_b64_len: int = REFERENCE_I
             status_code=400,
             detail=f"Reference image too large for storage ({len(b64)} bytes). Install Pillow for automatic compression.",
         )
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    quality = 85
-    out = io.BytesIO()
+    # Largest raw size whose base64 encoding still fits max_b64_len
+    max_raw_len = (max_b64_len // 4) * 3
+    img = Image.open(io.BytesIO(image_bytes))
+    img.draft("RGB", (REFERENCE_IMAGE_MAX_DIM, REFERENCE_IMAGE_MAX_DIM))  # cheap DCT downscale for JPEG input
+    img = img.convert("RGB")
+    if max(img.size) > REFERENCE_IMAGE_MAX_DIM:
+        img.thumbnail((REFERENCE_IMAGE_MAX_DIM, REFERENCE_IMAGE_MAX_DIM), Image.Resampling.LANCZOS)
     while True:
-        out.seek(0)
-        out.truncate()
-        img.save(out, format="JPEG", quality=quality, optimize=True)
-        raw_len = out.tell()
-        b64 = base64.b64encode(out.getvalue()).decode("utf-8")
-        if len(b64) <= max_b64_len:
-            logger.info("Reference image compressed to %d bytes (base64 len %d)", raw_len, len(b64))
-            return b64
-        # Reduce size: shrink dimensions then lower quality
-        if quality > 40:
-            quality -= 10
-            continue
+        data = _fit_jpeg_quality(img, max_raw_len)
+        if data is not None:
+            logger.info(
+                "Reference image compressed to %d bytes (base64 len %d, size %dx%d)",
+                len(data), _b64_len(len(data)), img.size[0], img.size[1],
+            )
+            return base64.b64encode(data).decode("utf-8")
         w, h = img.size
-        if w <= 400 and h <= 400:
-            # Already small; last resort: lower quality more
-            quality = max(25, quality - 15)
-            out.seek(0)
-            out.truncate()
-            img.save(out, format="JPEG", quality=quality, optimize=True)
-            b64 = base64.b64encode(out.getvalue()).decode("utf-8")
-            if len(b64) <= max_b64_len:
-                return b64
+        if w <= REFERENCE_IMAGE_MIN_DIM and h <= REFERENCE_IMAGE_MIN_DIM:
             raise HTTPException(status_code=400, detail="Reference image too large even after compression.")
-        img = img.resize((w // 2, h // 2), Image.Resampling.LANCZOS)
-        quality = 85
+        img = img.resize((max(1, w // 2), max(1, h // 2)), Image.Resampling.LANCZOS)
+
+
+async def _compress_reference_image_async(image_bytes: bytes) -> str:
+    """Run _compress_reference_image in a worker thread so JPEG encoding does not block the event loop."""
+    return await run_in_threadpool(_compress_reference_image, image_bytes)
 
 
 router = APIRouter(prefix="/api/kyc", tags=["kyc"])
@@ -108,7 +144,7 @@ async def kyc_onboard(
         # Update BVN and name when completing KYC for a username-created customer
         db.update_customer_bvn_and_name(customer_id_val, bvn, name or cust.get("name") or "Customer")
     # Compress so base64 fits Firestore 1 MiB limit, then store
-    b64 = _compress_reference_image(image_bytes)
+    b64 = await _compress_reference_image_async(image_bytes)
     ok = db.update_customer_kyc_reference(customer_id_val, b64)
     if not ok:
         raise HTTPException(status_code=404, detail="Customer not found")
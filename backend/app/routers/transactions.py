@@ -1,27 +1,73 @@
 """Transfer and audit API (AccessMore-style: KYC-verified customers, audit log)."""
 
 import logging
-from fastapi import APIRouter, HTTPException, Request
+from typing import Optional
 
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import get_settings
 from app.db.firestore_client import FirestoreClient
 from app.models.transaction import TransferRequest, TransferResponse
 from app.routers.fido2 import consume_authorized_transaction
+from app.services.idempotency import MAX_KEY_LENGTH, IdempotencyStore, request_fingerprint
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/transactions", tags=["transactions"])
 db = FirestoreClient()
 
+# Transfer errors a retry of the same request would get again; everything else (balance, limit, KYC, unknown
+# beneficiary, expired authorization) can change, so it is not replayed from the idempotency store.
+_DETERMINISTIC_ERRORS = frozenset({
+    "Amount must be positive",
+    "Cannot transfer to the same account",
+    "Transfer params do not match authorized transaction",
+})
+
+# Outcomes of transfers sent with an Idempotency-Key (see app.services.idempotency)
+_idempotency = IdempotencyStore(
+    "transfer_idempotency",
+    get_settings().idempotency_ttl_seconds,
+    get_settings().idempotency_max_entries,
+    cacheable_error=lambda e: e.status_code == 400 and e.detail in _DETERMINISTIC_ERRORS,
+)
+
 
 @router.post("/transfer", response_model=TransferResponse)
-async def transfer(request: Request, body: TransferRequest):
+async def transfer(
+    request: Request,
+    response: Response,
+    body: TransferRequest,
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key"),
+):
     """
     Transfer amount from sender (KYC-verified) to beneficiary account (KYC-verified).
     When using FIDO2: call /api/fido2/transaction/initiate, sign challenge with passkey,
     then /api/fido2/transaction/authorize, then POST here with state_id in body.
     Debits sender's primary account, credits beneficiary; writes audit log.
+
+    Send an Idempotency-Key header to make retries safe: a repeat with the same key and body returns the
+    original response (header Idempotent-Replayed: true) instead of transferring again.
     """
     client_ip = request.client.host if request.client else None
 
+    async def execute() -> dict:
+        # Off the event loop: the transfer may wait behind others on the same account
+        return (await run_in_threadpool(_execute_transfer, body, client_ip)).model_dump()
+
+    if not idempotency_key:
+        return await execute()
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key longer than {MAX_KEY_LENGTH} characters")
+    result, replayed = await _idempotency.run(
+        f"{body.sender_customer_id}:{idempotency_key}", request_fingerprint(body.model_dump()), execute
+    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+def _execute_transfer(body: TransferRequest, client_ip: Optional[str]) -> TransferResponse:
     if body.state_id:
         pending = consume_authorized_transaction(body.state_id)
         if not pending:
@@ -0,0 +1,184 @@
+"""
+Ed25519 device keys: parsed public-key cache and signature verification (single and batch).
+
+Loaded Ed25519PublicKey objects are cached per customer so /verify and /transaction-verify skip the storage read and
+key parsing. The cache is per process with a short TTL. Each entry is tagged with the customer's key version from the
+shared state backend (create_state_store), which invalidate_customer_key bumps after set_device_public_key, so a
+replaced key stops verifying on every worker at once. Without a shared backend the version store is per process and,
+like the other auth state, refuses to start with more than one worker.
+
+verify_batch() checks many (public_key, message, signature) triples in one call, spreading large batches across a
+process pool (e.g. for replaying stored device-auth events).
+"""
+
+import atexit
+import base64
+import logging
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional, Sequence
+
+from app.services.state_store import LocalStateStore, StateBackend, create_state_store
+
+logger = logging.getLogger(__name__)
+
+# Batches smaller than this are verified inline (pool dispatch costs more than it saves)
+BATCH_INLINE_THRESHOLD = 256
+
+_key_cache: Optional[LocalStateStore] = None
+_key_versions: Optional[StateBackend] = None
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+
+def _b64_decode(s: str) -> bytes:
+    """Decode base64 (standard or url-safe)."""
+    pad = 4 - len(s) % 4
+    if pad != 4:
+        s += "=" * pad
+    try:
+        return base64.urlsafe_b64decode(s)
+    except Exception:
+        return base64.b64decode(s)
+
+
+def load_public_key(public_key_b64: str) -> Optional[Any]:
+    """Ed25519PublicKey from base64, or None if malformed."""
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+
+    try:
+        pk_bytes = _b64_decode(public_key_b64)
+        if len(pk_bytes) != 32:
+            return None
+        return Ed25519PublicKey.from_public_bytes(pk_bytes)
+    except Exception as e:
+        logger.warning("Ed25519 public key load error: %s", e)
+        return None
+
+
+def verify_signature(public_key: Any, message: bytes, signature_b64: str) -> bool:
+    """Verify with a loaded Ed25519PublicKey."""
+    from cryptography.exceptions import InvalidSignature
+
+    try:
+        sig_bytes = _b64_decode(signature_b64)
+        if len(sig_bytes) != 64:
+            return False
+        public_key.verify(sig_bytes, message)
+        return True
+    except InvalidSignature:
+        return False
+    except Exception as e:
+        logger.warning("Ed25519 verify error: %s", e)
+        return False
+
+
+# --- Per-customer key cache ---
+
+
+def _cache() -> LocalStateStore:
+    global _key_cache, _key_versions
+    if _key_cache is None:
+        from app.config import get_settings
+
+        settings = get_settings()
+        # same TTL as the cache, so no cached entry outlives the version written after its key changed
+        _key_versions = create_state_store(
+            "device_key_versions", settings.device_key_cache_ttl_seconds, settings.auth_state_max_entries
+        )
+        _key_cache = LocalStateStore(
+            "device_key_cache", settings.device_key_cache_ttl_seconds, settings.auth_state_max_entries
+        )
+    return _key_cache
+
+
+def _key_version(customer_id: str) -> Optional[str]:
+    entry = _key_versions.get(customer_id)
+    return entry["v"] if entry else None
+
+
+def get_customer_key(customer_id: str, load_key_doc: Callable[[str], Optional[dict]], refresh: bool = False) -> Optional[Any]:
+    """Cached Ed25519PublicKey for a customer; load_key_doc(customer_id) is the storage read on miss or when the
+    shared key version no longer matches the cached entry."""
+    cache = _cache()
+    # read before the storage load, so a key replaced during the load leaves the entry tagged with the old version
+    version = _key_version(customer_id)
+    if not refresh:
+        cached = cache.get(customer_id)
+        if cached is not None and cached["version"] == version:
+            return cached["key"]
+    key_doc = load_key_doc(customer_id)
+    if not key_doc:
+        cache.pop(customer_id)
+        return None
+    key = load_public_key(key_doc["public_key_b64"])
+    if key is not None:
+        cache.set(customer_id, {"key": key, "version": version})
+    return key
+
+
+def invalidate_customer_key(customer_id: str) -> None:
+    """Drop the cached key here and bump the shared key version so other workers reload it
+    (call after set_device_public_key)."""
+    _cache().pop(customer_id)
+    _key_versions.set(customer_id, {"v": secrets.token_hex(8)})
+
+
+def verify_customer_signature(
+    customer_id: str, message: bytes, signature_b64: str, load_key_doc: Callable[[str], Optional[dict]]
+) -> Optional[bool]:
+    """Verify against the customer's device key. None if no key is registered.
+    A failure with a cached key is retried once with a fresh read, in case the key was replaced elsewhere."""
+    key = get_customer_key(customer_id, load_key_doc)
+    if key is None:
+        return None
+    if verify_signature(key, message, signature_b64):
+        return True
+    fresh = get_customer_key(customer_id, load_key_doc, refresh=True)
+    if fresh is None:
+        return None
+    if fresh.public_bytes_raw() == key.public_bytes_raw():
+        return False
+    return verify_signature(fresh, message, signature_b64)
+
+
+# --- Batch verification ---
+
+
+def _verify_chunk(items: Sequence[tuple[str, bytes, str]]) -> list[bool]:
+    """Verify (public_key_b64, message, signature_b64) triples; each distinct key is parsed once."""
+    keys: dict[str, Any] = {}
+    results = []
+    for public_key_b64, message, signature_b64 in items:
+        if public_key_b64 not in keys:
+            keys[public_key_b64] = load_public_key(public_key_b64)
+        key = keys[public_key_b64]
+        results.append(key is not None and verify_signature(key, message, signature_b64))
+    return results
+
+
+def _get_pool(max_workers: Optional[int]) -> tuple[ProcessPoolExecutor, int]:
+    global _pool, _pool_workers
+    if _pool is None:
+        _pool_workers = max_workers or os.cpu_count() or 1
+        _pool = ProcessPoolExecutor(max_workers=_pool_workers)
+        atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+    return _pool, _pool_workers
+
+
+def verify_batch(items: Sequence[tuple[str, bytes, str]], max_workers: Optional[int] = None) -> list[bool]:
+    """Verify many (public_key_b64, message, signature_b64) triples; results are in input order.
+
+    Small batches run inline; larger ones are split into one chunk per worker on a shared process pool.
+    """
+    items = list(items)
+    if len(items) < BATCH_INLINE_THRESHOLD:
+        return _verify_chunk(items)
+    pool, workers = _get_pool(max_workers)
+    size = -(-len(items) // workers)
+    chunks = [items[i:i + size] for i in range(0, len(items), size)]
+    results: list[bool] = []
+    for chunk_result in pool.map(_verify_chunk, chunks):
+        results.extend(chunk_result)
+    return results
@@ -0,0 +1,121 @@
+"""
+Idempotency-Key support: remember the outcome of a request so client retries get the original response instead
+of executing again.
+
+Outcomes are kept in a TTL'd keyed store (local or Redis, per AUTH_STATE_BACKEND; see app.services.state_store).
+Only success bodies and the 4xx errors the caller marks as deterministic are stored. An error that depends on
+state (e.g. insufficient balance) is not, so a retry with the same key after a top-up runs again. Concurrent requests
+with the same key are coalesced: within a worker they await the first execution; across workers a lock entry,
+refreshed while the first request runs, makes later requests wait for the stored outcome (409 if it does not appear
+in time). A key reused with a different request body is rejected with 422. Keys are scoped by the caller (e.g.
+sender customer id) so clients cannot collide with each other.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+
+from app.services.state_store import StateBackend, create_state_store
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+LOCK_TTL_SEC = 30.0
+LOCK_REFRESH_SEC = LOCK_TTL_SEC / 3
+WAIT_POLL_SEC = 0.05
+
+
+def request_fingerprint(payload: Any) -> str:
+    """Stable hash of a JSON-serializable request payload."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Outcome store + in-flight coalescing for one endpoint."""
+
+    def __init__(
+        self,
+        name: str,
+        ttl_seconds: float,
+        max_entries: int,
+        wait_timeout: float = LOCK_TTL_SEC,
+        cacheable_error: Optional[Callable[[HTTPException], bool]] = None,
+    ):
+        """cacheable_error(e) -> True for 4xx errors that a retry of the same request would get again."""
+        self.name = name
+        self._cacheable_error = cacheable_error or (lambda e: False)
+        self._results: StateBackend = create_state_store(name, ttl_seconds, max_entries)
+        self._locks: StateBackend = create_state_store(f"{name}_locks", LOCK_TTL_SEC, max_entries)
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._wait_timeout = wait_timeout
+
+    @staticmethod
+    def _replay(stored: dict, fingerprint: str) -> dict:
+        if stored.get("fingerprint") != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        if stored["status_code"] >= 400:
+            raise HTTPException(status_code=stored["status_code"], detail=stored["body"])
+        return stored["body"]
+
+    async def _wait_for_other_worker(self, key: str, fingerprint: str) -> dict:
+        deadline = time.monotonic() + self._wait_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(WAIT_POLL_SEC)
+            stored = self._results.get(key)
+            if stored is not None:
+                return self._replay(stored, fingerprint)
+            if self._locks.get(key) is None:
+                break  # owner finished without a stored outcome (uncached error / crash); let the client retry
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+
+    async def run(self, key: str, fingerprint: str, execute: Callable[[], Awaitable[dict]]) -> tuple[dict, bool]:
+        """Run execute() at most once per key. Returns (response body, replayed)."""
+        stored = self._results.get(key)
+        if stored is not None:
+            return self._replay(stored, fingerprint), True
+        pending = self._inflight.get(key)
+        if pending is not None:
+            try:
+                stored = await asyncio.shield(pending)
+            except Exception:
+                raise HTTPException(status_code=409, detail="The original request with this Idempotency-Key failed; retry")
+            return self._replay(stored, fingerprint), True
+        lock = {"fingerprint": fingerprint}
+        if not self._locks.add(key, lock):
+            return await self._wait_for_other_worker(key, fingerprint), True
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        # The first request can run longer than LOCK_TTL_SEC (e.g. queued behind other transfers on the account)
+        refresh = asyncio.create_task(self._refresh_lock(key, lock))
+        try:
+            try:
+                body = await execute()
+                stored = {"fingerprint": fingerprint, "status_code": 200, "body": body}
+            except HTTPException as e:
+                if e.status_code >= 500 or not self._cacheable_error(e):
+                    raise
+                stored = {"fingerprint": fingerprint, "status_code": e.status_code, "body": e.detail}
+            self._results.set(key, stored)
+            future.set_result(stored)
+        except BaseException:
+            # Outcome not recorded (state-dependent error, 5xx, crash, cancellation): waiters get 409 and the key
+            # stays reusable
+            future.set_exception(RuntimeError("idempotent request failed"))
+            future.exception()  # mark retrieved when nobody was waiting
+            raise
+        finally:
+            refresh.cancel()
+            self._inflight.pop(key, None)
+            self._locks.pop(key)
+        return self._replay(stored, fingerprint), False
+
+    async def _refresh_lock(self, key: str, lock: dict) -> None:
+        while True:
+            await asyncio.sleep(LOCK_REFRESH_SEC)
+            self._locks.set(key, lock)
@@ -18,3 +18,10 @@ def get_spoof_detection_service():
         from app.services.spoof_detection import SpoofDetectionService
         _spoof_detection_service = SpoofDetectionService()
     return _spoof_detection_service
+
+
+def spoof_model_stats():
+    """Resident spoof model set, or None until the service has been loaded."""
+    if _spoof_detection_service is None:
+        return None
+    return _spoof_detection_service.model_stats()
@@ -0,0 +1,163 @@
+"""
+Minimal Redis-protocol (RESP2) client for shared auth flow state.
+
+Only the handful of commands the state store needs (GET, SET with PX/KEEPTTL, GETDEL, DEL, PING). Connections are
+pooled and reused across threads. Works with Redis >= 6.2, Valkey, KeyDB, or the local stand-in in
+scripts/redis_stand_in.py.
+"""
+
+import logging
+import queue
+import socket
+from contextlib import contextmanager
+from typing import Iterator, Optional, Union
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = 16
+
+Reply = Union[None, int, bytes, list, "RespError"]
+
+
+class RespError(Exception):
+    """Error reply from the server (-ERR ...)."""
+
+
+class _Connection:
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def send(self, *args: Union[str, bytes, int]) -> None:
+        parts = [b"*%d\r\n" % len(args)]
+        for a in args:
+            if isinstance(a, str):
+                a = a.encode("utf-8")
+            elif isinstance(a, int):
+                a = str(a).encode("ascii")
+            parts.append(b"$%d\r\n%s\r\n" % (len(a), a))
+        self.sock.sendall(b"".join(parts))
+
+    def read(self) -> Reply:
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest
+        if kind == b"-":
+            raise RespError(rest.decode("utf-8", "replace"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(rest)
+            if count < 0:
+                return None
+            return [self._read_element() for _ in range(count)]
+        raise ConnectionError(f"Unexpected RESP reply: {line!r}")
+
+    def _read_element(self) -> Reply:
+        # an error inside an array (e.g. from EXEC) is returned in place, so the rest of the array is still read
+        try:
+            return self.read()
+        except RespError as e:
+            return e
+
+    def close(self) -> None:
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RespClient:
+    """Thread-safe pooled client. URL form: redis://[:password@]host[:port][/db]."""
+
+    def __init__(self, url: str, pool_size: int = POOL_SIZE, timeout: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int((parsed.path or "/0").lstrip("/") or 0)
+        self.timeout = timeout
+        self._pool: queue.LifoQueue = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self) -> _Connection:
+        conn = _Connection(self.host, self.port, self.timeout)
+        if self.password:
+            conn.send("AUTH", self.password)
+            conn.read()
+        if self.db:
+            conn.send("SELECT", self.db)
+            conn.read()
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[_Connection]:
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        reusable = False
+        try:
+            yield conn
+            reusable = True
+        except RespError:
+            reusable = True  # the error reply was read in full, so the connection is still in sync
+            raise
+        finally:
+            # anything else (socket errors, a half-read reply) drops the connection instead of returning it
+            if reusable:
+                try:
+                    self._pool.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+            else:
+                conn.close()
+
+    def execute(self, *args: Union[str, bytes, int]) -> Reply:
+        with self._connection() as conn:
+            conn.send(*args)
+            return conn.read()
+
+    def ping(self) -> bool:
+        return self.execute("PING") == b"PONG"
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.execute("GET", key)
+
+    def set(
+        self,
+        key: str,
+        value: bytes,
+        px: Optional[int] = None,
+        keepttl: bool = False,
+        nx: bool = False,
+        xx: bool = False,
+    ) -> bool:
+        """SET with optional expiry (PX ms or KEEPTTL) and condition (NX / XX). Returns False if the condition failed."""
+        args: list = ["SET", key, value]
+        if px is not None:
+            args += ["PX", px]
+        elif keepttl:
+            args.append("KEEPTTL")
+        if nx:
+            args.append("NX")
+        elif xx:
+            args.append("XX")
+        return self.execute(*args) is not None
+
+    def getdel(self, key: str) -> Optional[bytes]:
+        return self.execute("GETDEL", key)
+
+    def delete(self, key: str) -> int:
+        return self.execute("DEL", key)
@@ -0,0 +1,100 @@
+"""
+Authenticated encryption of small JSON payloads into opaque tokens (stateless auth flow state).
+
+Tokens are AES-256-GCM: version byte + 12-byte nonce + ciphertext/tag. The payload carries its own expiry, and
+`purpose` is bound as associated data so a token minted for one flow is rejected by every other flow.
+All workers/instances must share AUTH_STATE_SECRET to open each other's tokens.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import secrets
+import time
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+_VERSION = b"\x01"
+_NONCE_BYTES = 12
+
+
+def _json_default(o: Any) -> Any:
+    if isinstance(o, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(bytes(o)).decode("ascii")}
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def _json_hook(d: dict) -> Any:
+    if len(d) == 1 and "__bytes__" in d:
+        return base64.b64decode(d["__bytes__"])
+    return d
+
+
+def dumps(value: Any) -> bytes:
+    """Compact JSON with bytes support (shared by sealed tokens and the Redis state backend)."""
+    return json.dumps(value, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    return json.loads(data, object_hook=_json_hook)
+
+
+class Sealer:
+    """Seal/unseal dict payloads with an expiry. Invalid, tampered, foreign-purpose or expired tokens unseal to None."""
+
+    def __init__(self, secret: Optional[str] = None):
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        if not secret:
+            logger.warning(
+                "AUTH_STATE_SECRET not set; using a random per-process key. "
+                "Sealed tokens will not be accepted by other workers or after restart."
+            )
+            secret = secrets.token_hex(32)
+        self._aead = AESGCM(hashlib.sha256(secret.encode("utf-8")).digest())
+
+    def seal(self, payload: dict, ttl_seconds: float, purpose: str) -> bytes:
+        body = dumps({"v": payload, "exp": time.time() + ttl_seconds})
+        nonce = os.urandom(_NONCE_BYTES)
+        return _VERSION + nonce + self._aead.encrypt(nonce, body, purpose.encode("utf-8"))
+
+    def unseal(self, token: bytes, purpose: str) -> Optional[tuple[dict, float]]:
+        """Return (payload, expires_at_epoch) or None."""
+        from cryptography.exceptions import InvalidTag
+
+        if len(token) <= 1 + _NONCE_BYTES or token[:1] != _VERSION:
+            return None
+        nonce, ciphertext = token[1:1 + _NONCE_BYTES], token[1 + _NONCE_BYTES:]
+        try:
+            body = loads(self._aead.decrypt(nonce, ciphertext, purpose.encode("utf-8")))
+        except (InvalidTag, ValueError):
+            return None
+        expires_at = float(body.get("exp", 0))
+        if expires_at <= time.time():
+            return None
+        return body.get("v"), expires_at
+
+
+_sealer: Optional[Sealer] = None
+
+
+def get_sealer() -> Sealer:
+    """
+    Process-wide Sealer keyed from settings.auth_state_secret. Without a secret each worker would seal with its own
+    random key and reject the other workers' tokens, so that is only allowed with a single worker.
+    """
+    global _sealer
+    if _sealer is None:
+        from app.config import get_settings
+
+        settings = get_settings()
+        if not settings.auth_state_secret and settings.workers > 1:
+            raise ValueError(
+                f"AUTH_STATE_BACKEND=token with WORKERS={settings.workers} requires AUTH_STATE_SECRET "
+                "(shared by every worker)"
+            )
+        _sealer = Sealer(settings.auth_state_secret)
+    return _sealer
@@ -4,9 +4,26 @@ from PIL import Image
 import io
 import logging
 import os
+import time
+from typing import Optional
+
+from app.services.spoof_models import ModelSet, ModelSetWatcher, load_model_set, watch_interval
 
 logger = logging.getLogger(__name__)
 
+
+def _add_timing(timings: Optional[dict], stage: str, start: float) -> None:
+    """Accumulate the time since start (perf_counter) under stage, if the caller collects timings."""
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def _torch_threads() -> Optional[int]:
+    """SPOOF_TORCH_THREADS: intra-op threads for the anti-spoof models (default: torch's choice, all cores)."""
+    value = os.environ.get("SPOOF_TORCH_THREADS")
+    return int(value) if value else None
+
+
 # Try to import Silent-Face-Anti-Spoofing
 # We need to add the repo root (not src) to the path so "from src.xxx" works
 SILENT_FACE_REPO_PATH = None
@@ -54,7 +71,6 @@ try:
         # Now try to import
         from src.anti_spoof_predict import AntiSpoofPredict
         from src.generate_patches import CropImage
-        from src.utility import parse_model_name
         
         SILENT_FACE_AVAILABLE = True
         logger.info(f"✅ Silent-Face-Anti-Spoofing successfully imported from: {SILENT_FACE_REPO_PATH}")
@@ -107,6 +123,8 @@ class SpoofDetectionService:
         
         self.model_dir = model_dir
         self.repo_base = repo_base
+        self.models: Optional[ModelSet] = None
+        self._watcher: Optional[ModelSetWatcher] = None
         self.use_silent_face = SILENT_FACE_AVAILABLE and model_dir is not None and repo_base is not None
         
         if self.use_silent_face:
@@ -149,7 +167,7 @@ class SpoofDetectionService:
                     # Initialize Anti-Spoof model
                     # Model files should be in model_dir (download from GitHub repo)
                     self.device_id = 0  # 0 for CPU, use GPU if available
-                    self.model = AntiSpoofPredict(self.device_id)
+                    self.model = AntiSpoofPredict(self.device_id, num_threads=_torch_threads())
                     self.image_cropper = CropImage()
                     logger.info("✅ AntiSpoofPredict initialized successfully")
                 finally:
@@ -164,11 +182,23 @@ class SpoofDetectionService:
                     )
                     self.use_silent_face = False
                 else:
-                    # List available models
-                    model_files = [f for f in os.listdir(model_dir) if f.endswith('.pth')]
+                    # Load the resident model set (manifest + fusion config) and watch it for changes
+                    self.models = load_model_set(model_dir, self.model, fusion_fallback=True)
                     logger.info(f"✅ SpoofDetectionService initialized with Silent-Face-Anti-Spoofing")
                     logger.info(f"Model directory: {model_dir}")
-                    logger.info(f"Available models: {model_files}")
+                    logger.info(
+                        f"Loaded models: {self.models.names} (manifest v{self.models.version}, "
+                        f"fusion {self.models.fusion.label})"
+                    )
+                    interval = watch_interval()
+                    if interval > 0:
+                        self._watcher = ModelSetWatcher(
+                            model_dir,
+                            load=lambda: load_model_set(self.model_dir, self.model),
+                            on_swap=self._swap_models,
+                            fingerprint=self.models.fingerprint,
+                            interval=interval,
+                        )
             except Exception as e:
                 logger.error(f"Failed to initialize Silent-Face-Anti-Spoofing: {str(e)}", exc_info=True)
                 self.use_silent_face = False
@@ -202,110 +232,145 @@ class SpoofDetectionService:
                 "reason": f"Detection error: {str(e)}"
             }
     
+    def _swap_models(self, model_set: ModelSet) -> None:
+        # A single reference assignment: requests already running keep the set they started with
+        self.models = model_set
+        logger.info(
+            f"Swapped in spoof models {model_set.names} (manifest v{model_set.version}, "
+            f"fusion {model_set.fusion.label})"
+        )
+
+    def model_stats(self) -> dict:
+        """Resident model set and reload state, for /health."""
+        if self.models is None:
+            return {"method": "basic_heuristics"}
+        stats = {
+            "models": self.models.names,
+            "manifest_version": self.models.version,
+            "fusion": self.models.fusion.label,
+            "loaded_at": self.models.loaded_at,
+        }
+        if self._watcher is not None:
+            stats["reloads"] = self._watcher.reloads
+            stats["last_reload_error"] = self._watcher.last_error
+        return stats
+
+    def _detect_face(self, image: np.ndarray, timings: Optional[dict] = None) -> list:
+        """Face bounding box [x, y, w, h] of a decoded BGR image."""
+        start = time.perf_counter()
+        image_bbox = self.model.get_bbox(image)
+        _add_timing(timings, "detect", start)
+        return image_bbox
+
+    def _predict_models(
+        self,
+        image: np.ndarray,
+        image_bbox: list,
+        model_set: ModelSet,
+        timings: Optional[dict] = None,
+    ) -> dict[str, np.ndarray]:
+        """
+        Run each model of model_set on its own crop of the face. Returns {model_name: softmax output (1x3)}.
+        Per-stage durations are accumulated into timings ("crop:<model>", "predict:<model>") when given.
+        """
+        results = {}
+        for resident in model_set.models:
+            spec = resident.spec
+
+            # Crop image according to model requirements
+            start = time.perf_counter()
+            param = {
+                "org_img": image,
+                "bbox": image_bbox,
+                "scale": spec.scale,
+                "out_w": spec.w_input,
+                "out_h": spec.h_input,
+                "crop": True,
+            }
+            if spec.scale is None:
+                param["crop"] = False
+
+            img_cropped = self.image_cropper.crop(**param)
+            _add_timing(timings, f"crop:{spec.file}", start)
+
+            # Run prediction
+            start = time.perf_counter()
+            results[spec.file] = self.model.predict_model(img_cropped, resident.model)
+            _add_timing(timings, f"predict:{spec.file}", start)
+        return results
+
+    def _decide(self, prediction: np.ndarray, confidence_threshold: float, model_set: ModelSet) -> dict:
+        """Turn the fused (1x3) prediction into the detect_spoof result."""
+        # Get final result (label 1 = real, 0 or 2 = fake/spoof)
+        label = np.argmax(prediction)
+        value = prediction[0][label]
+        confidence = float(value)
+
+        # Apply confidence threshold: even if label is "real" (1),
+        # we need high confidence to trust it
+        # label 1 = real face, label 0 or 2 = fake
+        is_real = (label == 1) and (confidence >= confidence_threshold)
+
+        logger.info(
+            f"Final spoof detection: label={label}, raw_confidence={confidence:.4f}, "
+            f"threshold={confidence_threshold:.2f}, is_real={is_real}, "
+            f"prediction={prediction[0]}"
+        )
+
+        if not is_real:
+            if label == 1:
+                # Label says "real" but confidence too low
+                reason = f"Uncertain result: label indicates real face but confidence ({confidence:.2%}) below threshold ({confidence_threshold:.2%})"
+            else:
+                reason = f"Detected as spoof (label={label}, score={confidence:.2%})"
+        else:
+            reason = f"Detected as real face (confidence={confidence:.2%})"
+
+        return {
+            "is_real": is_real,
+            "confidence": confidence,
+            "reason": reason,
+            "details": {
+                "label": int(label),
+                "prediction": prediction[0].tolist(),
+                "fusion": model_set.fusion.label,
+                "manifest_version": model_set.version,
+                "method": "silent_face_anti_spoofing"
+            }
+        }
+
     async def _detect_with_silent_face(
         self, 
         image_bytes: bytes, 
         confidence_threshold: float
     ) -> dict:
         """Use Silent-Face-Anti-Spoofing library for detection"""
-        import os
         try:
-            # Change to repo directory for relative paths (for detection model)
-            original_cwd = os.getcwd()
-            if hasattr(self, 'repo_base'):
-                os.chdir(self.repo_base)
+            # Snapshot of the resident models: a hot swap during this request doesn't affect it
+            model_set = self.models
+
+            # Convert bytes to OpenCV image
+            nparr = np.frombuffer(image_bytes, np.uint8)
+            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
             
-            try:
-                # Convert bytes to OpenCV image
-                nparr = np.frombuffer(image_bytes, np.uint8)
-                image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                
-                if image is None:
-                    raise ValueError("Failed to decode image")
-                
-                logger.info(f"Processing image: shape={image.shape}")
-                
-                # Get face bounding box
-                image_bbox = self.model.get_bbox(image)
-                logger.info(f"Face bbox detected: {image_bbox}")
-                
-                # Initialize prediction accumulator (for multi-model fusion)
-                prediction = np.zeros((1, 3))  # 3 classes: [fake, real, other]
-                
-                # Run prediction for each model in the directory
-                model_files = [f for f in os.listdir(self.model_dir) if f.endswith('.pth')]
-                
-                if not model_files:
-                    raise ValueError(f"No model files (.pth) found in {self.model_dir}")
-                
-                logger.info(f"Running prediction with {len(model_files)} models...")
-                
-                for model_name in model_files:
-                    from src.utility import parse_model_name
-                    h_input, w_input, model_type, scale = parse_model_name(model_name)
-                    
-                    # Crop image according to model requirements
-                    param = {
-                        "org_img": image,
-                        "bbox": image_bbox,
-                        "scale": scale,
-                        "out_w": w_input,
-                        "out_h": h_input,
-                        "crop": True,
-                    }
-                    if scale is None:
-                        param["crop"] = False
-                    
-                    img_cropped = self.image_cropper.crop(**param)
-                    
-                    # Run prediction
-                    model_path = os.path.join(self.model_dir, model_name)
-                    result = self.model.predict(img_cropped, model_path)
-                    prediction += result
-                    logger.info(f"Model {model_name} prediction: {result}")
-                
-                # Average the predictions
-                prediction = prediction / len(model_files)
-                
-                # Get final result (label 1 = real, 0 or 2 = fake/spoof)
-                label = np.argmax(prediction)
-                value = prediction[0][label]
-                confidence = float(value)
-                
-                # Apply confidence threshold: even if label is "real" (1), 
-                # we need high confidence to trust it
-                # label 1 = real face, label 0 or 2 = fake
-                is_real = (label == 1) and (confidence >= confidence_threshold)
-                
-                logger.info(
-                    f"Final spoof detection: label={label}, raw_confidence={confidence:.4f}, "
-                    f"threshold={confidence_threshold:.2f}, is_real={is_real}, "
-                    f"prediction={prediction[0]}"
-                )
-                
-                if not is_real:
-                    if label == 1:
-                        # Label says "real" but confidence too low
-                        reason = f"Uncertain result: label indicates real face but confidence ({confidence:.2%}) below threshold ({confidence_threshold:.2%})"
-                    else:
-                        reason = f"Detected as spoof (label={label}, score={confidence:.2%})"
-                else:
-                    reason = f"Detected as real face (confidence={confidence:.2%})"
-                
-                return {
-                    "is_real": is_real,
-                    "confidence": confidence,
-                    "reason": reason,
-                    "details": {
-                        "label": int(label),
-                        "prediction": prediction[0].tolist(),
-                        "method": "silent_face_anti_spoofing"
-                    }
-                }
+            if image is None:
+                raise ValueError("Failed to decode image")
+            
+            logger.info(f"Processing image: shape={image.shape}")
+            
+            # Get face bounding box
+            image_bbox = self._detect_face(image)
+            logger.info(f"Face bbox detected: {image_bbox}")
+            
+            # Run prediction for each model in the set
+            logger.info(f"Running prediction with {len(model_set.models)} models...")
+            results = self._predict_models(image, image_bbox, model_set)
+            for model_name, result in results.items():
+                logger.info(f"Model {model_name} prediction: {result}")
             
-            finally:
-                # Restore original directory
-                os.chdir(original_cwd)
+            # Fuse the predictions (3 classes: [fake, real, other]); equal-weight average by default
+            prediction = model_set.fusion.fuse(results)
+            return self._decide(prediction, confidence_threshold, model_set)
         
         except Exception as e:
             logger.error(f"Silent-Face detection failed: {str(e)}", exc_info=True)
@@ -0,0 +1,147 @@
+"""
+Score fusion for the anti-spoof ensemble.
+
+The fusion config is versioned next to the models as <model_dir>/fusion.json (written by
+scripts/fit_spoof_fusion.py, previous versions kept as fusion.v<N>.json):
+
+    {"version": 3, "method": "weighted",
+     "models": {"2.7_80x80_MiniFASNetV2.pth": {"weight": 0.6, "temperature": 1.4}, ...}}
+
+    {"version": 4, "method": "logistic", "intercept": -0.4,
+     "models": {"2.7_80x80_MiniFASNetV2.pth": {"coef": 1.8}, ...}}
+
+Only the listed models are run. Without a config every model is averaged with equal weight (the original behaviour).
+The models return softmax outputs, so log-probabilities stand in for logits: they differ by a per-sample shift,
+which neither softmax nor log-odds see.
+"""
+
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FUSION_FILE = "fusion.json"
+METHODS = ("weighted", "logistic")
+REAL = 1  # class index of a real face; 0 and 2 are spoof classes
+_EPS = 1e-6
+
+
+def _softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=-1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def log_odds(probs: np.ndarray) -> np.ndarray:
+    """log(p_real / (1 - p_real)) of softmax outputs (N x 3)."""
+    p = np.clip(probs[..., REAL], _EPS, 1 - _EPS)
+    return np.log(p) - np.log1p(-p)
+
+
+class ScoreFusion:
+    """
+    Combines per-model softmax outputs into one (N x 3) prediction.
+
+    - weighted: sum_m w_m * softmax(log p_m / T_m) / sum_m w_m
+    - logistic: P(real) = sigmoid(intercept + sum_m coef_m * log_odds(p_m)); the spoof mass is split between
+      classes 0 and 2 like the models' average
+    """
+
+    def __init__(self, method: str = "weighted", models: Optional[dict[str, dict]] = None,
+                 intercept: float = 0.0, version: int = 0):
+        if method not in METHODS:
+            raise ValueError(f"Unknown fusion method {method!r}; expected one of {METHODS}")
+        if models is not None and not models:
+            raise ValueError("Fusion config lists no models")
+        self.method = method
+        self.models = models  # None = every model in the directory, equal weight
+        self.intercept = intercept
+        self.version = version
+
+    @classmethod
+    def from_dict(cls, config: dict) -> "ScoreFusion":
+        method = config.get("method", "weighted")
+        models = {}
+        for name, params in config.get("models", {}).items():
+            if method == "weighted":
+                weight = float(params.get("weight", 1.0))
+                temperature = float(params.get("temperature", 1.0))
+                if weight < 0 or temperature <= 0:
+                    raise ValueError(f"Invalid weight/temperature for {name}: {params}")
+                if weight > 0:
+                    models[name] = {"weight": weight, "temperature": temperature}
+            else:
+                models[name] = {"coef": float(params["coef"])}
+        return cls(method, models, float(config.get("intercept", 0.0)), int(config.get("version", 0)))
+
+    def to_dict(self) -> dict:
+        config = {"version": self.version, "method": self.method, "models": self.models or {}}
+        if self.method == "logistic":
+            config["intercept"] = self.intercept
+        return config
+
+    @property
+    def model_files(self) -> Optional[list[str]]:
+        """Models to run, or None for all of them."""
+        return None if self.models is None else list(self.models)
+
+    @property
+    def label(self) -> str:
+        return "equal" if self.models is None else f"{self.method}-v{self.version}"
+
+    def fuse(self, outputs: dict[str, np.ndarray]) -> np.ndarray:
+        """outputs: {model_name: softmax output (N x 3)} covering model_files -> fused (N x 3)."""
+        names = list(outputs) if self.models is None else list(self.models)
+        probs = [np.asarray(outputs[n], dtype=np.float64) for n in names]
+        if self.method == "weighted":
+            total = np.zeros_like(probs[0])
+            weight_sum = 0.0
+            for name, p in zip(names, probs):
+                params = self.models[name] if self.models is not None else {"weight": 1.0, "temperature": 1.0}
+                if params["temperature"] != 1.0:
+                    p = _softmax(np.log(np.clip(p, _EPS, None)) / params["temperature"])
+                total += params["weight"] * p
+                weight_sum += params["weight"]
+            return total / weight_sum
+
+        z = self.intercept + sum(self.models[n]["coef"] * log_odds(p) for n, p in zip(names, probs))
+        p_real = 1.0 / (1.0 + np.exp(-z))
+        spoof = sum(probs) / len(probs)
+        spoof[..., REAL] = 0.0
+        spoof = spoof / np.clip(spoof.sum(axis=-1, keepdims=True), _EPS, None)
+        fused = spoof * (1.0 - p_real)[..., None]
+        fused[..., REAL] = p_real
+        return fused
+
+
+def load_fusion(model_dir: str) -> ScoreFusion:
+    """The fusion config in model_dir, or equal-weight averaging when there is none."""
+    path = Path(model_dir) / FUSION_FILE
+    if not path.exists():
+        return ScoreFusion()
+    with open(path) as f:
+        return ScoreFusion.from_dict(json.load(f))
+
+
+def save_fusion(model_dir: str, fusion: ScoreFusion) -> Path:
+    """Write fusion as the next version; the current fusion.json is kept as fusion.v<N>.json."""
+    path = Path(model_dir) / FUSION_FILE
+    version = 0
+    if path.exists():
+        with open(path) as f:
+            version = int(json.load(f).get("version", 0))
+        shutil.copyfile(path, path.with_name(f"fusion.v{version}.json"))
+    fusion.version = version + 1
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(fusion.to_dict(), f, indent=2)
+        f.write("\n")
+    os.replace(tmp, path)
+    logger.info(f"Wrote fusion config v{fusion.version} ({fusion.method}) to {path}")
+    return path
@@ -0,0 +1,256 @@
+"""
+Resident anti-spoof model set, described by a manifest and hot-swapped when it changes.
+
+<model_dir>/manifest.json (written by scripts/spoof_manifest.py):
+
+    {"version": 2,
+     "models": [{"file": "2.7_80x80_MiniFASNetV2.pth", "type": "MiniFASNetV2", "input": [80, 80],
+                 "scale": 2.7, "backend": "torch", "sha256": "..."}, ...]}
+
+input is [height, width]; a null scale resizes the whole image instead of cropping around the face. Without a
+manifest the set is derived from the .pth file names as before (no checksums). fusion.json (app.services.spoof_fusion)
+picks which of the models run and how their scores combine.
+
+A ModelSet is immutable: every model is checksummed and loaded before the set is published, and a request keeps the
+set it started with, so a swap never interrupts in-flight requests. ModelSetWatcher polls the manifest, fusion.json
+and the .pth files every SPOOF_MODEL_POLL_SEC seconds (default 5, 0 disables) and swaps in a new set when they change.
+A set that fails to load is logged and the current one stays until the files change again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from app.services.spoof_fusion import FUSION_FILE, ScoreFusion, load_fusion
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+BACKENDS = ("torch",)
+DEFAULT_POLL_SEC = 5.0
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    file: str
+    model_type: str
+    h_input: int
+    w_input: int
+    scale: Optional[float]
+    backend: str = "torch"
+    sha256: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, entry: dict) -> "ModelSpec":
+        h_input, w_input = entry["input"]
+        scale = entry.get("scale")
+        return cls(
+            file=entry["file"],
+            model_type=entry["type"],
+            h_input=int(h_input),
+            w_input=int(w_input),
+            scale=None if scale is None else float(scale),
+            backend=entry.get("backend", "torch"),
+            sha256=entry.get("sha256"),
+        )
+
+    @classmethod
+    def from_file_name(cls, file: str, sha256: Optional[str] = None) -> "ModelSpec":
+        """Spec encoded in a Silent-Face model file name, e.g. 2.7_80x80_MiniFASNetV2.pth."""
+        from src.utility import parse_model_name
+
+        h_input, w_input, model_type, scale = parse_model_name(file)
+        return cls(file, model_type, h_input, w_input, scale, sha256=sha256)
+
+    def to_dict(self) -> dict:
+        return {
+            "file": self.file,
+            "type": self.model_type,
+            "input": [self.h_input, self.w_input],
+            "scale": self.scale,
+            "backend": self.backend,
+            "sha256": self.sha256,
+        }
+
+
+@dataclass(frozen=True)
+class ResidentModel:
+    spec: ModelSpec
+    model: Any  # loaded network (AntiSpoofPredict.load_model)
+
+
+@dataclass(frozen=True)
+class ModelSet:
+    """Models to run for a request, in order, with the fusion that combines them."""
+
+    models: tuple[ResidentModel, ...]
+    fusion: ScoreFusion
+    version: int  # manifest version; 0 when derived from file names
+    fingerprint: tuple
+    loaded_at: float = field(default_factory=time.time)
+
+    @property
+    def names(self) -> list[str]:
+        return [m.spec.file for m in self.models]
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _model_files(model_dir: Path) -> list[str]:
+    return sorted(f for f in os.listdir(model_dir) if f.endswith(".pth"))
+
+
+def source_fingerprint(model_dir: str) -> tuple:
+    """(name, mtime_ns, size) of the manifest, fusion config and model files; changes when any of them does."""
+    model_dir = Path(model_dir)
+    entries = []
+    for name in [MANIFEST_FILE, FUSION_FILE] + _model_files(model_dir):
+        try:
+            st = (model_dir / name).stat()
+        except FileNotFoundError:
+            continue
+        entries.append((name, st.st_mtime_ns, st.st_size))
+    return tuple(entries)
+
+
+def read_manifest(model_dir: str) -> tuple[int, list[ModelSpec]]:
+    """(version, specs) from manifest.json, or (0, specs from the .pth file names) when there is none."""
+    path = Path(model_dir) / MANIFEST_FILE
+    if not path.exists():
+        return 0, [ModelSpec.from_file_name(f) for f in _model_files(Path(model_dir))]
+    with open(path) as f:
+        manifest = json.load(f)
+    specs = [ModelSpec.from_dict(entry) for entry in manifest.get("models", [])]
+    return int(manifest.get("version", 0)), specs
+
+
+def build_manifest(model_dir: str) -> dict:
+    """
+    Next manifest version for model_dir: every .pth file with a fresh checksum. Entries of the current manifest keep
+    their type, input, scale and backend; new files are described from their names.
+    """
+    version, current = read_manifest(model_dir)
+    by_file = {spec.file: spec for spec in current}
+    models = []
+    for name in _model_files(Path(model_dir)):
+        spec = by_file.get(name) or ModelSpec.from_file_name(name)
+        entry = spec.to_dict()
+        entry["sha256"] = file_sha256(Path(model_dir) / name)
+        models.append(entry)
+    return {"version": version + 1, "models": models}
+
+
+def write_manifest(model_dir: str, manifest: dict) -> Path:
+    path = Path(model_dir) / MANIFEST_FILE
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+    os.replace(tmp, path)
+    return path
+
+
+def load_model_set(model_dir: str, predictor, use_fusion: bool = True, fusion_fallback: bool = False) -> ModelSet:
+    """
+    Verify and load the manifest's models with predictor (AntiSpoofPredict). With use_fusion only the models named
+    in fusion.json are loaded; use_fusion=False loads every model with equal weights (offline evaluation).
+    fusion_fallback replaces an invalid fusion config by equal weights instead of failing.
+    """
+    fingerprint = source_fingerprint(model_dir)  # taken first, so a change during the load triggers another
+    version, specs = read_manifest(model_dir)
+    if not specs:
+        raise ValueError(f"No models in {model_dir}")
+
+    fusion = ScoreFusion()
+    if use_fusion:
+        try:
+            fusion = load_fusion(model_dir)
+            missing = [f for f in fusion.model_files or [] if f not in {s.file for s in specs}]
+            if missing:
+                raise ValueError(f"fusion config v{fusion.version} names models not in the manifest: {missing}")
+        except (ValueError, KeyError, TypeError) as e:
+            if not fusion_fallback:
+                raise
+            logger.error(f"Invalid fusion config in {model_dir}, using equal weights: {e}")
+            fusion = ScoreFusion()
+        if fusion.model_files is not None:
+            by_file = {s.file: s for s in specs}
+            specs = [by_file[f] for f in fusion.model_files]
+
+    models = []
+    for spec in specs:
+        if spec.backend not in BACKENDS:
+            raise ValueError(f"{spec.file}: unsupported backend {spec.backend!r}; expected one of {BACKENDS}")
+        path = Path(model_dir) / spec.file
+        if spec.sha256 and file_sha256(path) != spec.sha256:
+            raise ValueError(f"{spec.file}: checksum does not match the manifest")
+        model = predictor.load_model(str(path), spec.model_type, spec.h_input, spec.w_input)
+        models.append(ResidentModel(spec, model))
+    return ModelSet(tuple(models), fusion, version, fingerprint)
+
+
+class ModelSetWatcher:
+    """Polls model_dir and calls on_swap with a freshly loaded ModelSet when its files change."""
+
+    def __init__(
+        self,
+        model_dir: str,
+        load: Callable[[], ModelSet],
+        on_swap: Callable[[ModelSet], None],
+        fingerprint: tuple,
+        interval: float,
+    ):
+        self.model_dir = model_dir
+        self.interval = interval
+        self._load = load
+        self._on_swap = on_swap
+        self._seen = fingerprint  # last fingerprint loaded or rejected
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="spoof-model-watcher", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Spoof model watcher failed")
+
+    def check(self) -> bool:
+        """Reload if the files changed since the last (attempted) load. Returns True if a new set was swapped in."""
+        fingerprint = source_fingerprint(self.model_dir)
+        if fingerprint == self._seen:
+            return False
+        self._seen = fingerprint
+        try:
+            model_set = self._load()
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.error(f"Spoof model reload failed, keeping the current models: {self.last_error}")
+            return False
+        self._seen = model_set.fingerprint
+        self._on_swap(model_set)
+        self.reloads += 1
+        self.last_error = None
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def watch_interval() -> float:
+    return float(os.environ.get("SPOOF_MODEL_POLL_SEC") or DEFAULT_POLL_SEC)
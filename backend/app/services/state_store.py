@@ -0,0 +1,580 @@
+"""
+Short-lived auth flow state (FIDO2 registration/login/transaction state, device-auth challenges).
+
+Two shapes of state:
+
+- Keyed stores (StateBackend): key -> dict with a per-store TTL. LocalStateStore keeps entries in process memory
+  (bounded, oldest evicted); RedisStateStore keeps them in a Redis-protocol server so every worker/instance sees
+  the same state.
+- Challenge stores (ChallengeState): issue(value) returns the challenge the client signs, take(challenge) returns
+  the value once. KeyedChallengeState is a random challenge over a keyed store; SealedChallengeState makes the
+  challenge itself an encrypted, expiring token (app.services.sealing) so no server-side state is needed, with a
+  replay filter enforcing single use.
+- Transaction stores (TransactionState): pending transfer -> state_id, authorize, consume once. In token mode the
+  pending transaction is sealed into the state_id itself; only compact digests of authorized and consumed ids are
+  kept, so issuing a challenge touches no storage.
+
+AUTH_STATE_BACKEND selects local (default), redis or token; create_state_store() / create_challenge_state() /
+create_transaction_state() build the configured implementation. Every store registers itself so stats() can be reported under /health.
+"""
+
+import asyncio
+import base64
+import hashlib
+import logging
+import secrets
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.services.sealing import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+SWEEP_INTERVAL_SEC = 30.0
+CHALLENGE_BYTES = 32
+KEY_PREFIX = "accessmore:state"
+
+STATE_BACKENDS = ("local", "redis", "token")
+
+_registry: dict[str, Any] = {}
+
+
+def _b64url(b: bytes) -> str:
+    return base64.urlsafe_b64encode(b).rstrip(b"=").decode("ascii")
+
+
+def _b64url_decode(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+def _digest(token: bytes) -> str:
+    """Compact replay-filter key for a sealed token."""
+    return _b64url(hashlib.sha256(token).digest()[:16])
+
+
+class StateBackend(ABC):
+    """Keyed TTL store for JSON-serializable dicts (bytes values allowed). Values are copies; use update() to write back."""
+
+    name: str
+    ttl_seconds: float
+
+    @abstractmethod
+    def set(self, key: str, value: dict) -> None:
+        ...
+
+    @abstractmethod
+    def add(self, key: str, value: dict) -> bool:
+        """Set only if key is absent (or expired). Returns True if stored."""
+
+    @abstractmethod
+    def update(self, key: str, value: dict) -> bool:
+        """Replace a live entry keeping its expiry. Returns False if missing or expired."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def pop(self, key: str) -> Optional[dict]:
+        """Atomically remove and return a live entry (None if missing or expired)."""
+
+    def sweep(self) -> int:
+        """Drop expired entries (no-op where the server expires keys). Returns number removed."""
+        return 0
+
+    @abstractmethod
+    def stats(self) -> dict[str, Any]:
+        ...
+
+
+class LocalStateStore(StateBackend):
+    """In-process TTL + max-size store. Thread-safe. Only consistent within a single worker process."""
+
+    def __init__(self, name: str, ttl_seconds: float, max_entries: int, sweep_interval: float = SWEEP_INTERVAL_SEC):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        # key -> (expires_at, value); insertion order == expiry order since TTL is fixed per store
+        self._entries: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.expired = 0
+        self.evicted = 0
+        self.hits = 0
+        self.misses = 0
+        _registry[name] = self
+
+    def _sweep_locked(self, now: float) -> int:
+        removed = 0
+        while self._entries:
+            key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[key]
+            removed += 1
+        self.expired += removed
+        self._last_sweep = now
+        return removed
+
+    def _live_locked(self, key: str, now: float) -> Optional[tuple[float, dict]]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= now:
+            del self._entries[key]
+            self.expired += 1
+            return None
+        return entry
+
+    def _insert_locked(self, key: str, value: dict, now: float) -> None:
+        if now - self._last_sweep >= self.sweep_interval:
+            self._sweep_locked(now)
+        self._entries.pop(key, None)
+        while len(self._entries) >= self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+        self._entries[key] = (now + self.ttl_seconds, dict(value))
+
+    def set(self, key: str, value: dict) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._insert_locked(key, value, now)
+
+    def add(self, key: str, value: dict) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if self._live_locked(key, now) is not None:
+                return False
+            self._insert_locked(key, value, now)
+            return True
+
+    def update(self, key: str, value: dict) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live_locked(key, now)
+            if entry is None:
+                return False
+            self._entries[key] = (entry[0], dict(value))
+            return True
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live_locked(key, now)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(entry[1])
+
+    def pop(self, key: str) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live_locked(key, now)
+            if entry is None:
+                self.misses += 1
+                return None
+            del self._entries[key]
+            self.hits += 1
+            return entry[1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def sweep(self) -> int:
+        with self._lock:
+            return self._sweep_locked(time.monotonic())
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": "local",
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+class RedisStateStore(StateBackend):
+    """Shared store on a Redis-protocol server (SET PX / GETDEL). Expiry is enforced by the server."""
+
+    def __init__(self, name: str, ttl_seconds: float, client: Any):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self._client = client
+        self._prefix = f"{KEY_PREFIX}:{name}:"
+        self._ttl_ms = int(ttl_seconds * 1000)
+        self.hits = 0
+        self.misses = 0
+        _registry[name] = self
+
+    def _count(self, value: Optional[bytes]) -> Optional[dict]:
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return loads(value)
+
+    def set(self, key: str, value: dict) -> None:
+        self._client.set(self._prefix + key, dumps(value), px=self._ttl_ms)
+
+    def add(self, key: str, value: dict) -> bool:
+        return self._client.set(self._prefix + key, dumps(value), px=self._ttl_ms, nx=True)
+
+    def update(self, key: str, value: dict) -> bool:
+        return self._client.set(self._prefix + key, dumps(value), keepttl=True, xx=True)
+
+    def get(self, key: str) -> Optional[dict]:
+        return self._count(self._client.get(self._prefix + key))
+
+    def pop(self, key: str) -> Optional[dict]:
+        return self._count(self._client.getdel(self._prefix + key))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": "redis",
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class ChallengeState(ABC):
+    """Single-use state bound to the challenge the client signs."""
+
+    name: str
+
+    @abstractmethod
+    def issue(self, value: dict) -> bytes:
+        """Store value and return the challenge bytes to send to the client."""
+
+    @abstractmethod
+    def take(self, challenge: bytes) -> Optional[dict]:
+        """Return the value issued with this challenge and invalidate it (None if unknown, expired or used)."""
+
+    def sweep(self) -> int:
+        return 0
+
+    @abstractmethod
+    def stats(self) -> dict[str, Any]:
+        ...
+
+
+class KeyedChallengeState(ChallengeState):
+    """Random challenge; value held in a keyed store under the challenge."""
+
+    def __init__(self, name: str, store: StateBackend, challenge_bytes: int = CHALLENGE_BYTES):
+        self.name = name
+        self._store = store
+        self._challenge_bytes = challenge_bytes
+
+    def issue(self, value: dict) -> bytes:
+        challenge = secrets.token_bytes(self._challenge_bytes)
+        self._store.set(_b64url(challenge), value)
+        return challenge
+
+    def take(self, challenge: bytes) -> Optional[dict]:
+        return self._store.pop(_b64url(challenge))
+
+    def stats(self) -> dict[str, Any]:
+        return self._store.stats()
+
+
+class SealedChallengeState(ChallengeState):
+    """The challenge is the sealed value itself; the replay filter remembers consumed challenges until they expire."""
+
+    def __init__(self, name: str, ttl_seconds: float, sealer: Any, replay_filter: StateBackend):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self._sealer = sealer
+        self._seen = replay_filter
+        self.issued = 0
+        self.consumed = 0
+        self.rejected_invalid = 0
+        self.rejected_replay = 0
+        _registry[name] = self
+
+    def issue(self, value: dict) -> bytes:
+        self.issued += 1
+        return self._sealer.seal(value, self.ttl_seconds, purpose=self.name)
+
+    def take(self, challenge: bytes) -> Optional[dict]:
+        opened = self._sealer.unseal(challenge, purpose=self.name)
+        if opened is None:
+            self.rejected_invalid += 1
+            return None
+        value, _ = opened
+        if not self._seen.add(_digest(challenge), {}):
+            self.rejected_replay += 1
+            return None
+        self.consumed += 1
+        return value
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": "token",
+            "ttl_seconds": self.ttl_seconds,
+            "issued": self.issued,
+            "consumed": self.consumed,
+            "rejected_invalid": self.rejected_invalid,
+            "rejected_replay": self.rejected_replay,
+        }
+
+
+class TransactionState(ABC):
+    """Pending transfers between initiate, authorize (signature verified) and transfer."""
+
+    name: str
+
+    @abstractmethod
+    def create(self, pending: dict) -> str:
+        """Store a pending transaction; returns its state_id."""
+
+    @abstractmethod
+    def get(self, state_id: str) -> Optional[dict]:
+        """Live pending transaction (with "authorized" flag), or None if unknown, expired or consumed."""
+
+    @abstractmethod
+    def authorize(self, state_id: str) -> bool:
+        """Mark as authorized. Returns False if unknown, expired or consumed."""
+
+    @abstractmethod
+    def consume(self, state_id: str) -> Optional[dict]:
+        """Return an authorized pending transaction exactly once."""
+
+    @abstractmethod
+    def stats(self) -> dict[str, Any]:
+        ...
+
+
+class KeyedTransactionState(TransactionState):
+    """Random state_id; pending transaction held in a keyed store."""
+
+    def __init__(self, name: str, store: StateBackend):
+        self.name = name
+        self._store = store
+
+    def create(self, pending: dict) -> str:
+        state_id = secrets.token_urlsafe(24)
+        self._store.set(state_id, pending)
+        return state_id
+
+    def get(self, state_id: str) -> Optional[dict]:
+        return self._store.get(state_id)
+
+    def authorize(self, state_id: str) -> bool:
+        pending = self._store.get(state_id)
+        if pending is None:
+            return False
+        pending["authorized"] = True
+        return self._store.update(state_id, pending)
+
+    def consume(self, state_id: str) -> Optional[dict]:
+        pending = self._store.get(state_id)
+        if not pending or not pending.get("authorized"):
+            return None
+        # pop is atomic, so only one concurrent transfer gets the state
+        return self._store.pop(state_id)
+
+    def stats(self) -> dict[str, Any]:
+        return self._store.stats()
+
+
+class SealedTransactionState(TransactionState):
+    """state_id is the sealed pending transaction; authorized/consumed ids are tracked as digests until expiry."""
+
+    def __init__(self, name: str, ttl_seconds: float, sealer: Any, authorized: StateBackend, consumed: StateBackend):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self._sealer = sealer
+        self._authorized = authorized
+        self._consumed = consumed
+        self.issued = 0
+        self.consumed = 0
+        self.rejected_invalid = 0
+        self.rejected_replay = 0
+        _registry[name] = self
+
+    def _open(self, state_id: str) -> Optional[tuple[dict, str]]:
+        try:
+            token = _b64url_decode(state_id)
+        except ValueError:
+            token = b""
+        opened = self._sealer.unseal(token, purpose=self.name) if token else None
+        if opened is None:
+            self.rejected_invalid += 1
+            return None
+        digest = _digest(token)
+        if self._consumed.get(digest) is not None:
+            self.rejected_replay += 1
+            return None
+        return opened[0], digest
+
+    def create(self, pending: dict) -> str:
+        self.issued += 1
+        return _b64url(self._sealer.seal(pending, self.ttl_seconds, purpose=self.name))
+
+    def get(self, state_id: str) -> Optional[dict]:
+        opened = self._open(state_id)
+        if opened is None:
+            return None
+        pending, digest = opened
+        pending["authorized"] = self._authorized.get(digest) is not None
+        return pending
+
+    def authorize(self, state_id: str) -> bool:
+        opened = self._open(state_id)
+        if opened is None:
+            return False
+        self._authorized.set(opened[1], {})
+        return True
+
+    def consume(self, state_id: str) -> Optional[dict]:
+        opened = self._open(state_id)
+        if opened is None:
+            return None
+        pending, digest = opened
+        if self._authorized.get(digest) is None:
+            return None
+        if not self._consumed.add(digest, {}):
+            self.rejected_replay += 1
+            return None
+        self.consumed += 1
+        pending["authorized"] = True
+        return pending
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": "token",
+            "ttl_seconds": self.ttl_seconds,
+            "issued": self.issued,
+            "consumed": self.consumed,
+            "rejected_invalid": self.rejected_invalid,
+            "rejected_replay": self.rejected_replay,
+        }
+
+
+# --- Factories ---
+
+_redis_client: Any = None
+_redis_lock = threading.Lock()
+
+
+def get_redis_client() -> Any:
+    """Process-wide RespClient for settings.redis_url."""
+    global _redis_client
+    with _redis_lock:
+        if _redis_client is None:
+            from app.config import get_settings
+            from app.services.resp_client import RespClient
+
+            url = get_settings().redis_url
+            if not url:
+                raise ValueError("AUTH_STATE_BACKEND=redis requires REDIS_URL")
+            _redis_client = RespClient(url)
+        return _redis_client
+
+
+def _keyed_store(backend: str, name: str, ttl_seconds: float, max_entries: int) -> StateBackend:
+    if backend == "redis":
+        return RedisStateStore(name, ttl_seconds, get_redis_client())
+    _require_single_worker(name)
+    return LocalStateStore(name, ttl_seconds, max_entries)
+
+
+def _require_single_worker(name: str) -> None:
+    """
+    Per-process state is only correct with one worker: a flow started on one worker would be unknown to the
+    others, and a token replay filter would let the same token be consumed once per worker.
+    """
+    from app.config import get_settings
+
+    settings = get_settings()
+    if settings.workers > 1:
+        raise ValueError(
+            f"State store {name!r} would be per process, which is unsafe with WORKERS={settings.workers}: "
+            "set AUTH_STATE_BACKEND=redis, or AUTH_STATE_BACKEND=token with REDIS_URL, or run a single worker"
+        )
+
+
+def _configured_backend() -> str:
+    from app.config import get_settings
+
+    backend = get_settings().auth_state_backend
+    if backend not in STATE_BACKENDS:
+        raise ValueError(f"Unknown AUTH_STATE_BACKEND {backend!r}; expected one of {', '.join(STATE_BACKENDS)}")
+    return backend
+
+
+def _filter_store(name: str, ttl_seconds: float, max_entries: int) -> StateBackend:
+    """Replay filter for token mode: shared when Redis is available; otherwise per process (single worker only)."""
+    from app.config import get_settings
+
+    return _keyed_store("redis" if get_settings().redis_url else "local", name, ttl_seconds, max_entries)
+
+
+def create_state_store(name: str, ttl_seconds: float, max_entries: int, backend: Optional[str] = None) -> StateBackend:
+    """Keyed store on the configured backend. Token mode has no keyed form; it uses Redis when REDIS_URL is set."""
+    backend = backend or _configured_backend()
+    if backend == "token":
+        return _filter_store(name, ttl_seconds, max_entries)
+    return _keyed_store(backend, name, ttl_seconds, max_entries)
+
+
+def create_challenge_state(name: str, ttl_seconds: float, max_entries: int) -> ChallengeState:
+    """Challenge store on the configured backend (local / redis / token)."""
+    backend = _configured_backend()
+    if backend == "token":
+        from app.services.sealing import get_sealer
+
+        seen = _filter_store(f"{name}_seen", ttl_seconds, max_entries)
+        return SealedChallengeState(name, ttl_seconds, get_sealer(), seen)
+    return KeyedChallengeState(name, _keyed_store(backend, name, ttl_seconds, max_entries))
+
+
+def create_transaction_state(name: str, ttl_seconds: float, max_entries: int) -> TransactionState:
+    """Pending-transaction store on the configured backend (token mode seals the transaction into the state_id)."""
+    backend = _configured_backend()
+    if backend == "token":
+        from app.services.sealing import get_sealer
+
+        return SealedTransactionState(
+            name,
+            ttl_seconds,
+            get_sealer(),
+            authorized=_filter_store(f"{name}_authorized", ttl_seconds, max_entries),
+            consumed=_filter_store(f"{name}_consumed", ttl_seconds, max_entries),
+        )
+    return KeyedTransactionState(name, _keyed_store(backend, name, ttl_seconds, max_entries))
+
+
+def sweep_all() -> int:
+    return sum(store.sweep() for store in list(_registry.values()))
+
+
+def all_stats() -> dict[str, dict[str, Any]]:
+    stats: dict[str, dict[str, Any]] = {}
+    for name, store in list(_registry.items()):
+        try:
+            stats[name] = store.stats()
+        except Exception as e:
+            stats[name] = {"error": str(e)}
+    return stats
+
+
+async def run_periodic_sweep(interval: float = SWEEP_INTERVAL_SEC) -> None:
+    """Background task: sweep every registered store until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        removed = sweep_all()
+        if removed:
+            logger.info("State store sweep removed %d expired entr(ies)", removed)
@@ -15,11 +15,15 @@ if [ -f .env ]; then
   export GOOGLE_APPLICATION_CREDENTIALS
 fi
 
-# Prefer .venv then venv; fall back to python3. Use 1 worker so in-memory store is consistent (or set FIRESTORE_PROJECT_ID for persistence).
+# Prefer .venv then venv; fall back to python3.
+# WORKERS defaults to 1. More workers need shared state: AUTH_STATE_BACKEND=redis, or token with REDIS_URL (auth
+# flow state; the app refuses to start otherwise) and STORAGE_BACKEND=sqlite or Firestore (the in-memory store is
+# per process).
+export WORKERS="${WORKERS:-1}"
 if [ -x ./.venv/bin/python ]; then
-  exec ./.venv/bin/python -m uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers 1
+  exec ./.venv/bin/python -m uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers "$WORKERS"
 elif [ -x ./venv/bin/python ]; then
-  exec ./venv/bin/python -m uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers 1
+  exec ./venv/bin/python -m uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers "$WORKERS"
 else
-  exec python3 -m uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers 1
+  exec python3 -m uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers "$WORKERS"
 fi
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for storage backends.
+
+Replays a synthetic mix of the storage calls behind the main API flows against one backend and reports
+ops/sec with p50/p99 latency per flow:
+
+- onboard:  find-by-BVN, create customer, store KYC reference, add account  (POST /api/kyc/onboard)
+- verify:   fetch reference image                                            (POST /api/kyc/verify)
+- login:    device key lookup, FIDO2 credential lookup, device-auth event   (device-auth / FIDO2 login)
+- transfer: sender accounts + execute_transfer                               (POST /api/transactions/transfer)
+
+Run from backend:
+    python scripts/bench_storage.py --backend sqlite --customers 1000 --ops 20000 --threads 8
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python scripts/bench_storage.py --backend firestore --ops 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Run from backend so app is importable
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from app.db.firestore_client import FirestoreClient  # noqa: E402
+from storage_conformance import BACKEND_NAMES, build_backend  # noqa: E402
+
+DEFAULT_MIX = "onboard=1,verify=3,login=5,transfer=1"
+REFERENCE_IMAGE_B64 = base64.b64encode(b"\xff\xd8" + b"\x00" * 60_000).decode("ascii")
+
+
+class Population:
+    """Customers created up front (and by onboard ops), shared by all worker threads."""
+
+    def __init__(self):
+        self.customers: list[tuple[str, str, str]] = []  # (customer_id, account_id, account_number)
+        self._lock = threading.Lock()
+
+    def add(self, entry: tuple[str, str, str]) -> None:
+        with self._lock:
+            self.customers.append(entry)
+
+    def pick(self, rng: random.Random) -> tuple[str, str, str]:
+        return self.customers[rng.randrange(len(self.customers))]
+
+
+def _onboard(db: FirestoreClient, pop: Population, rng: random.Random) -> None:
+    bvn = str(uuid.uuid4().int)[:11]
+    if db.get_customer_by_bvn(bvn):
+        return
+    cid = db.create_customer(bvn=bvn, name="Bench")
+    db.update_customer_kyc_reference(cid, REFERENCE_IMAGE_B64)
+    number = "9" + uuid.uuid4().hex[:9]
+    acc_id = db.add_account(cid, number, "current", 10_000_000.0)
+    db.update_customer_limit(cid, 50_000_000)
+    pop.add((cid, acc_id, number))
+
+
+def _verify(db: FirestoreClient, pop: Population, rng: random.Random) -> None:
+    cid, _, _ = pop.pick(rng)
+    db.get_customer_reference_image(cid)
+
+
+def _login(db: FirestoreClient, pop: Population, rng: random.Random) -> None:
+    cid, _, _ = pop.pick(rng)
+    db.get_device_public_key(cid)
+    for row in db.get_fido2_credentials(cid):
+        db.update_fido2_sign_count(row["credential_id_b64"], row["sign_count"] + 1)
+    db.add_device_auth_event(cid, "login", "Y2hhbGxlbmdl", "c2lnbmF0dXJl", device_name="bench")
+
+
+def _transfer(db: FirestoreClient, pop: Population, rng: random.Random) -> None:
+    sender, _, _ = pop.pick(rng)
+    _, _, beneficiary_number = pop.pick(rng)
+    accounts = db.get_accounts(sender)
+    try:
+        db.execute_transfer(sender, accounts[0]["id"], beneficiary_number, 1.0, {"user_id": sender})
+    except ValueError:
+        pass  # same-account picks are expected
+
+
+FLOWS = {"onboard": _onboard, "verify": _verify, "login": _login, "transfer": _transfer}
+
+
+def parse_mix(spec: str) -> list[tuple[str, int]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in FLOWS:
+            raise ValueError(f"Unknown flow {name!r}; expected one of {sorted(FLOWS)}")
+        mix.append((name.strip(), int(weight or 1)))
+    return mix
+
+
+def seed(db: FirestoreClient, pop: Population, count: int, seed_value: int) -> None:
+    rng = random.Random(seed_value)
+    for i in range(count):
+        _onboard(db, pop, rng)
+        cid = pop.customers[-1][0]
+        db.set_device_public_key(cid, base64.b64encode(uuid.uuid4().bytes * 2).decode("ascii"))
+        db.add_fido2_credential(cid, base64.b64encode(uuid.uuid4().bytes).decode("ascii"), "ZGF0YQ==")
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def run(db: FirestoreClient, pop: Population, mix: list[tuple[str, int]], ops: int, threads: int, seed_value: int):
+    names = [n for n, _ in mix]
+    weights = [w for _, w in mix]
+    plan_rng = random.Random(seed_value)
+    plan = plan_rng.choices(names, weights=weights, k=ops)
+    latencies: dict[str, list[float]] = {n: [] for n in names}
+    lock = threading.Lock()
+
+    def worker(chunk: list[str], worker_seed: int) -> None:
+        rng = random.Random(worker_seed)
+        local: dict[str, list[float]] = {n: [] for n in names}
+        for name in chunk:
+            t0 = time.perf_counter()
+            FLOWS[name](db, pop, rng)
+            local[name].append(time.perf_counter() - t0)
+        with lock:
+            for n, values in local.items():
+                latencies[n].extend(values)
+
+    chunks = [plan[i::threads] for i in range(threads)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, chunks, [seed_value + i + 1 for i in range(threads)]))
+    elapsed = time.perf_counter() - start
+    return latencies, elapsed
+
+
+def report(latencies: dict[str, list[float]], elapsed: float) -> None:
+    print(f"\n{'flow':<10} {'count':>8} {'ops/sec':>10} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    all_values: list[float] = []
+    for name, values in latencies.items():
+        if not values:
+            continue
+        all_values.extend(values)
+        s = sorted(values)
+        print(
+            f"{name:<10} {len(s):>8} {len(s) / elapsed:>10.1f} {_percentile(s, 50) * 1000:>9.2f} "
+            f"{_percentile(s, 99) * 1000:>9.2f} {statistics.fmean(s) * 1000:>9.2f}"
+        )
+    s = sorted(all_values)
+    print(
+        f"{'total':<10} {len(s):>8} {len(s) / elapsed:>10.1f} {_percentile(s, 50) * 1000:>9.2f} "
+        f"{_percentile(s, 99) * 1000:>9.2f} {statistics.fmean(s) * 1000 if s else 0:>9.2f}"
+    )
+    print(f"\nwall time {elapsed:.2f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Storage backend load benchmark")
+    parser.add_argument("--backend", choices=BACKEND_NAMES, default="memory")
+    parser.add_argument("--customers", type=int, default=500, help="customers seeded before the timed run")
+    parser.add_argument("--ops", type=int, default=10_000, help="number of flows to replay")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted flow mix (default: {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    with tempfile.TemporaryDirectory() as workdir:
+        db = FirestoreClient(backend=build_backend(args.backend, workdir))
+        pop = Population()
+        t0 = time.perf_counter()
+        seed(db, pop, max(2, args.customers), args.seed)
+        print(f"backend={args.backend} seeded {len(pop.customers)} customers in {time.perf_counter() - t0:.2f}s")
+        print(f"replaying {args.ops} ops, mix={args.mix}, threads={args.threads}")
+        latencies, elapsed = run(db, pop, mix, args.ops, args.threads, args.seed)
+        report(latencies, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+"""
+Offline evaluation and threshold calibration for the anti-spoof ensemble.
+
+Runs the SpoofDetectionService pipeline (decode, face detection, per-model crop + predict) over a labelled image
+folder in parallel batches and reports ISO/IEC 30107-3 error rates for the ensemble, every model subset and a
+cheap-model-first cascade:
+
+- APCER: attacks accepted as real, per attack type (the worst type is reported)
+- BPCER: bona fide faces rejected
+- ACER:  (APCER + BPCER) / 2
+- EER / AUC from the ROC over all thresholds, plus per-stage latency of the pipeline
+
+Layout: <data>/real/... holds bona fide images (also "live" or "bonafide"); every other top-level folder is an
+attack type (print/, replay/, mask/, ...). Images are found recursively.
+
+Per-model outputs (log-softmax) and face boxes are cached under --cache, keyed by image path, size and mtime and by
+model checksum, so re-runs that only change thresholds, models or fusion weights don't touch the models; only new
+images or new model files are computed.
+
+Run from backend:
+    python scripts/eval_spoof.py --data /data/spoof_eval --workers 8
+    python scripts/eval_spoof.py --data /data/spoof_eval --thresholds 0.5,0.7,0.8,0.9 --roc-csv roc.csv
+    python scripts/eval_spoof.py --data /data/spoof_eval --sweep-weights 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+# Run from backend so app is importable
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from app.services.spoof_fusion import FUSION_FILE, ScoreFusion, load_fusion  # noqa: E402
+
+BONA_FIDE_DIRS = {"real", "live", "bonafide", "bona_fide"}
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+DEFAULT_THRESHOLDS = "0.5,0.6,0.7,0.8,0.9,0.95"
+SERVICE_THRESHOLD = 0.8  # detect_spoof's default confidence_threshold
+UNDECODABLE = -1  # cached box of an image cv2 can't decode
+
+
+@dataclass
+class Sample:
+    path: Path
+    key: str  # cache key: relative path, size and mtime
+    attack: str  # "" for bona fide, else the attack type
+
+
+def collect_samples(root: Path) -> list[Sample]:
+    samples = []
+    for top in sorted(p for p in root.iterdir() if p.is_dir()):
+        attack = "" if top.name.lower() in BONA_FIDE_DIRS else top.name
+        for path in sorted(top.rglob("*")):
+            if path.suffix.lower() not in IMAGE_EXTS or not path.is_file():
+                continue
+            st = path.stat()
+            samples.append(Sample(path, f"{path.relative_to(root)}:{st.st_size}:{st.st_mtime_ns}", attack))
+    return samples
+
+
+def _file_digest(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()[:12]
+
+
+class ScoreCache:
+    """Face boxes (bboxes.npz) and one <model stem>-<sha1>.npz of log-softmax outputs per model, keyed by image."""
+
+    def __init__(self, directory: Path, model_dir: Path, model_files: list[str]):
+        self.directory = directory
+        directory.mkdir(parents=True, exist_ok=True)
+        self.model_tags = {name: f"{Path(name).stem}-{_file_digest(model_dir / name)}" for name in model_files}
+        self.bboxes = self._load("bboxes")
+        self.logits = {name: self._load(tag) for name, tag in self.model_tags.items()}
+
+    def _load(self, tag: str) -> dict[str, np.ndarray]:
+        path = self.directory / f"{tag}.npz"
+        if not path.exists():
+            return {}
+        data = np.load(path)
+        return dict(zip(data["keys"].tolist(), data["values"]))
+
+    def _store(self, tag: str, entries: dict[str, np.ndarray]) -> None:
+        if not entries:
+            return
+        path = self.directory / f"{tag}.npz"
+        tmp = path.with_suffix(".tmp")
+        keys = list(entries)
+        with open(tmp, "wb") as f:
+            np.savez(f, keys=np.array(keys), values=np.stack([entries[k] for k in keys]))
+        os.replace(tmp, path)
+
+    def save(self) -> None:
+        self._store("bboxes", self.bboxes)
+        for name, tag in self.model_tags.items():
+            self._store(tag, self.logits[name])
+
+
+# ---- worker processes: one SpoofDetectionService each ----
+
+_service = None
+_models = None  # every model in the directory, whatever fusion.json selects
+
+
+def _init_worker(model_dir: str, threads: int) -> None:
+    global _service, _models
+    from app.services.spoof_detection import SpoofDetectionService
+    from app.services.spoof_models import load_model_set
+
+    os.environ["SPOOF_TORCH_THREADS"] = str(threads)
+    os.environ["SPOOF_MODEL_POLL_SEC"] = "0"  # no reload watcher in the workers
+    _service = SpoofDetectionService(model_dir)
+    if not _service.use_silent_face:
+        raise RuntimeError("Silent-Face-Anti-Spoofing is not available (see INSTALL_SILENT_FACE.md)")
+    _models = load_model_set(model_dir, _service.model, use_fusion=False)
+
+
+def _score_batch(jobs: list[tuple[str, Optional[list], list[str]]]) -> list[tuple]:
+    """(path, cached bbox or None, models to run) -> (bbox or None if undecodable, {model: log-softmax}, timings)."""
+    import cv2
+
+    from app.services.spoof_detection import _add_timing
+
+    out = []
+    for path, bbox, model_files in jobs:
+        timings: dict[str, float] = {}
+        start = time.perf_counter()
+        image = cv2.imdecode(np.frombuffer(Path(path).read_bytes(), np.uint8), cv2.IMREAD_COLOR)
+        _add_timing(timings, "decode", start)
+        if image is None:
+            out.append((None, {}, timings))
+            continue
+        if bbox is None:
+            bbox = _service._detect_face(image, timings)
+        subset = replace(_models, models=tuple(m for m in _models.models if m.spec.file in model_files))
+        results = _service._predict_models(image, bbox, subset, timings)
+        logits = {name: np.log(np.clip(p[0], 1e-12, None)).astype(np.float32) for name, p in results.items()}
+        out.append(([int(v) for v in bbox], logits, timings))
+    return out
+
+
+def score_all(
+    samples: list[Sample],
+    model_dir: Path,
+    model_files: list[str],
+    cache: ScoreCache,
+    workers: int,
+    batch_size: int,
+    threads: int,
+) -> tuple[dict[str, list[float]], list[Sample], float]:
+    """Fill the cache for every (sample, model) pair; returns per-stage latencies, undecodable samples, wall time."""
+    pending = []
+    latencies: dict[str, list[float]] = {}
+    failed: list[Sample] = []
+    for s in samples:
+        if s.key in cache.bboxes and cache.bboxes[s.key][0] == UNDECODABLE:
+            failed.append(s)
+            continue
+        missing = [m for m in model_files if s.key not in cache.logits[m]]
+        if missing:
+            pending.append((s, missing))
+    if not pending:
+        return latencies, failed, 0.0
+
+    print(f"Scoring {len(pending)} images ({len(samples) - len(pending)} fully cached) with {workers} workers...")
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(str(model_dir), threads)) as pool:
+            jobs = [[(str(s.path), cache.bboxes[s.key].tolist() if s.key in cache.bboxes else None, missing)
+                     for s, missing in batch] for batch in batches]
+            for done, (batch, results) in enumerate(zip(batches, pool.map(_score_batch, jobs)), 1):
+                for (sample, _), (bbox, logits, timings) in zip(batch, results):
+                    if bbox is None:
+                        cache.bboxes[sample.key] = np.full(4, UNDECODABLE, dtype=np.int32)
+                        failed.append(sample)
+                        continue
+                    cache.bboxes[sample.key] = np.asarray(bbox, dtype=np.int32)
+                    for name, value in logits.items():
+                        cache.logits[name][sample.key] = value
+                    for stage, seconds in timings.items():
+                        latencies.setdefault(stage, []).append(seconds)
+                    latencies.setdefault("total", []).append(sum(timings.values()))
+                print(f"  {done}/{len(batches)} batches", end="\r", flush=True)
+    finally:
+        cache.save()
+    print()
+    return latencies, failed, time.perf_counter() - start
+
+
+# ---- metrics ----
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    z = logits - logits.max(axis=-1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def apply_fusion(fusion: ScoreFusion, logits: dict[str, np.ndarray], names: list[str]) -> np.ndarray:
+    return fusion.fuse({n: softmax(logits[n]) for n in (fusion.model_files or names)})
+
+
+def fuse(logits: dict[str, np.ndarray], names: list[str], weights: Optional[dict[str, float]] = None) -> np.ndarray:
+    """Weighted mean of the models' softmax outputs (equal weights = the service's plain average)."""
+    models = {n: {"weight": 1.0 if weights is None else weights[n], "temperature": 1.0} for n in names}
+    return apply_fusion(ScoreFusion("weighted", models), logits, names)
+
+
+def real_score(probs: np.ndarray) -> np.ndarray:
+    """detect_spoof accepts iff argmax is "real" (1) and its probability >= threshold, i.e. iff this >= threshold."""
+    return np.where(probs.argmax(axis=1) == 1, probs[:, 1], 0.0)
+
+
+def error_rates(score: np.ndarray, attack: np.ndarray, threshold: float) -> dict:
+    accepted = score >= threshold
+    bona = attack == ""
+    by_type = {t: float(accepted[attack == t].mean()) for t in sorted(set(attack[~bona]))}
+    apcer = max(by_type.values()) if by_type else float("nan")
+    bpcer = float((~accepted[bona]).mean()) if bona.any() else float("nan")
+    return {"apcer": apcer, "bpcer": bpcer, "acer": (apcer + bpcer) / 2, "apcer_by_type": by_type}
+
+
+def roc(score: np.ndarray, attack: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(thresholds, APCER, BPCER) at every distinct score; APCER pools all attack types here."""
+    attack_scores = np.sort(score[attack != ""])
+    bona_scores = np.sort(score[attack == ""])
+    thresholds = np.unique(np.concatenate([score, [np.inf]]))
+    apcer = 1.0 - np.searchsorted(attack_scores, thresholds, "left") / max(len(attack_scores), 1)
+    bpcer = np.searchsorted(bona_scores, thresholds, "left") / max(len(bona_scores), 1)
+    return thresholds, apcer, bpcer
+
+
+def eer(thresholds: np.ndarray, apcer: np.ndarray, bpcer: np.ndarray) -> tuple[float, float]:
+    i = int(np.argmin(np.abs(apcer - bpcer)))
+    return float((apcer[i] + bpcer[i]) / 2), float(thresholds[i])
+
+
+def auc(apcer: np.ndarray, bpcer: np.ndarray) -> float:
+    """Area under accepted-bona-fide vs accepted-attack rate."""
+    accepted = 1.0 - bpcer
+    order = np.lexsort((accepted, apcer))
+    x = np.concatenate([[0.0], apcer[order], [1.0]])
+    y = np.concatenate([[0.0], accepted[order], [1.0]])
+    return float(np.sum(np.diff(x) * (y[1:] + y[:-1]) / 2))
+
+
+def _mean_ms(latencies: dict[str, list[float]], stage: str) -> Optional[float]:
+    values = latencies.get(stage)
+    return statistics.fmean(values) * 1000 if values else None
+
+
+def subset_cost_ms(latencies: dict[str, list[float]], names: list[str]) -> Optional[float]:
+    """Mean per-image cost of decode + detect + the models' crop and predict; None when nothing was timed."""
+    parts = [_mean_ms(latencies, "decode"), _mean_ms(latencies, "detect")]
+    for n in names:
+        parts += [_mean_ms(latencies, f"crop:{n}"), _mean_ms(latencies, f"predict:{n}")]
+    return None if any(p is None for p in parts) else sum(parts)
+
+
+def _fmt_ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def parse_weights(spec: str, model_files: list[str]) -> dict[str, float]:
+    weights = {}
+    for part in spec.split(","):
+        name, _, value = part.partition("=")
+        if name.strip() not in model_files:
+            raise ValueError(f"Unknown model {name!r}; expected one of {model_files}")
+        weights[name.strip()] = float(value)
+    return weights
+
+
+# ---- report ----
+
+def report_latency(latencies: dict[str, list[float]], failed: list[Sample], wall: float) -> None:
+    if failed:
+        print(f"\nSkipped {len(failed)} undecodable images, e.g. {failed[0].path}")
+    if not latencies:
+        print("\nLatency: everything was cached (delete --cache or add images to re-time the pipeline)")
+        return
+    count = len(latencies["total"])
+    print(f"\nPer-stage latency over {count} images ({count / wall:.1f} images/s end to end)")
+    print(f"{'stage':<48}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for stage in sorted(latencies, key=lambda s: (s == "total", s)):
+        values = sorted(latencies[stage])
+        print(f"{stage:<48}{statistics.fmean(values) * 1000:>10.2f}"
+              f"{_percentile(values, 50) * 1000:>10.2f}{_percentile(values, 95) * 1000:>10.2f}")
+
+
+def report_thresholds(score: np.ndarray, attack: np.ndarray, thresholds: list[float]) -> None:
+    types = sorted(set(attack[attack != ""]))
+    print(f"{'threshold':>10}{'APCER':>9}{'BPCER':>9}{'ACER':>9}" + "".join(f"{t[:12]:>14}" for t in types))
+    for t in thresholds:
+        r = error_rates(score, attack, t)
+        print(f"{t:>10.2f}{r['apcer']:>9.2%}{r['bpcer']:>9.2%}{r['acer']:>9.2%}"
+              + "".join(f"{r['apcer_by_type'][name]:>14.2%}" for name in types))
+
+
+def report_subsets(logits, attack, model_files, latencies, threshold) -> None:
+    print(f"\nModel subsets at threshold {threshold:.2f} (equal-weight average, as detect_spoof)")
+    print(f"{'models':<64}{'cost ms':>9}{'APCER':>9}{'BPCER':>9}{'ACER':>9}{'EER':>9}{'t@EER':>8}{'AUC':>8}")
+    sizes = range(1, len(model_files) + 1) if len(model_files) <= 4 else (1, len(model_files))
+    for size in sizes:
+        for names in itertools.combinations(model_files, size):
+            score = real_score(fuse(logits, list(names)))
+            r = error_rates(score, attack, threshold)
+            e, t_eer = eer(*roc(score, attack))
+            label = " + ".join(names)
+            print(f"{label[:63]:<64}{_fmt_ms(subset_cost_ms(latencies, list(names))):>9}{r['apcer']:>9.2%}"
+                  f"{r['bpcer']:>9.2%}{r['acer']:>9.2%}{e:>9.2%}{t_eer:>8.3f}{auc(*roc(score, attack)[1:]):>8.4f}")
+
+
+def report_cascade(logits, attack, model_files, latencies, threshold, margin) -> None:
+    """Cheapest model alone unless its score is within margin of the threshold; then the full ensemble."""
+    costs = {n: subset_cost_ms(latencies, [n]) for n in model_files}
+    first = min(model_files, key=lambda n: (costs[n] is None, costs[n] or 0.0, n))
+    first_score = real_score(fuse(logits, [first]))
+    full_score = real_score(fuse(logits, model_files))
+    escalate = np.abs(first_score - threshold) < margin
+    score = np.where(escalate, full_score, first_score)
+    r = error_rates(score, attack, threshold)
+    first_cost, full_cost = costs[first], subset_cost_ms(latencies, model_files)
+    expected = None
+    if first_cost is not None and full_cost is not None:
+        expected = first_cost + escalate.mean() * (full_cost - first_cost)
+    print(f"\nCascade: {first} first, full ensemble when |score - {threshold:.2f}| < {margin:.2f}")
+    print(f"  escalated {escalate.mean():.1%} of images, expected cost {_fmt_ms(expected)} ms "
+          f"(full ensemble {_fmt_ms(full_cost)} ms)")
+    print(f"  APCER {r['apcer']:.2%}  BPCER {r['bpcer']:.2%}  ACER {r['acer']:.2%}")
+
+
+def report_weight_sweep(logits, attack, model_files, threshold, steps) -> None:
+    """Every weight vector on the simplex with step 1/steps, ranked by ACER at threshold, then EER."""
+    results = []
+    for combo in itertools.product(range(steps + 1), repeat=len(model_files)):
+        if sum(combo) != steps:
+            continue
+        weights = {n: c / steps for n, c in zip(model_files, combo)}
+        names = [n for n in model_files if weights[n] > 0]
+        score = real_score(fuse(logits, names, weights))
+        r = error_rates(score, attack, threshold)
+        results.append((r["acer"], eer(*roc(score, attack))[0], weights))
+    results.sort(key=lambda item: (item[0], item[1]))
+    print(f"\nFusion weight sweep (step {1 / steps:.2f}), best 5 by ACER at {threshold:.2f}")
+    for acer, e, weights in results[:5]:
+        print(f"  ACER {acer:.2%}  EER {e:.2%}  " + ", ".join(f"{n}={w:.2f}" for n, w in weights.items()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Anti-spoof ensemble evaluation and threshold calibration")
+    parser.add_argument("--data", type=Path, required=True, help="labelled folder: real/ plus one folder per attack")
+    parser.add_argument("--model-dir", type=Path, default=None,
+                        help="anti-spoof models (default: the service's resources/anti_spoof_models)")
+    parser.add_argument("--cache", type=Path, default=Path(".spoof_eval_cache"), help="per-model output cache")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="pipeline processes")
+    parser.add_argument("--threads", type=int, default=1, help="torch threads per worker")
+    parser.add_argument("--batch-size", type=int, default=32, help="images per worker task")
+    parser.add_argument("--threshold", type=float, default=SERVICE_THRESHOLD,
+                        help="operating point for the subset, cascade and weight reports")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS, help="thresholds for the ensemble table")
+    parser.add_argument("--fusion", type=Path, default=None,
+                        help=f"fusion config for the ensemble table (default: {FUSION_FILE} in the model dir, if any)")
+    parser.add_argument("--weights", default=None, help="fusion weights for the ensemble table, e.g. a.pth=0.7,b.pth=0.3")
+    parser.add_argument("--sweep-weights", type=int, default=0, metavar="STEPS",
+                        help="grid-search fusion weights in steps of 1/STEPS")
+    parser.add_argument("--cascade-margin", type=float, default=0.1)
+    parser.add_argument("--roc-csv", type=Path, default=None, help="write threshold,APCER,BPCER of the ensemble")
+    args = parser.parse_args()
+
+    model_dir = args.model_dir
+    if model_dir is None:
+        from app.services.spoof_detection import _get_silent_face_paths
+
+        candidates = [Path(p) / "resources" / "anti_spoof_models" for p in _get_silent_face_paths()]
+        model_dir = next((p for p in candidates if p.is_dir()), None)
+        if model_dir is None:
+            parser.error("no anti-spoof model directory found; pass --model-dir")
+    model_dir = model_dir.resolve()
+    model_files = sorted(f for f in os.listdir(model_dir) if f.endswith(".pth"))
+    if not model_files:
+        parser.error(f"no .pth models in {model_dir}")
+
+    samples = collect_samples(args.data)
+    if not samples:
+        parser.error(f"no images under {args.data}")
+    cache = ScoreCache(args.cache, model_dir, model_files)
+    latencies, failed, wall = score_all(samples, model_dir, model_files, cache,
+                                        args.workers, args.batch_size, args.threads)
+
+    failed_keys = {s.key for s in failed}
+    samples = [s for s in samples if s.key not in failed_keys]
+    attack = np.array([s.attack for s in samples])
+    logits = {n: np.stack([cache.logits[n][s.key] for s in samples]) for n in model_files}
+    if args.weights:
+        weights = parse_weights(args.weights, model_files)
+        fusion = ScoreFusion.from_dict({"method": "weighted", "models": {n: {"weight": w} for n, w in weights.items()}})
+        fusion_label = f"weights {args.weights}"
+    else:
+        if args.fusion:
+            with open(args.fusion) as f:
+                fusion = ScoreFusion.from_dict(json.load(f))
+        else:
+            fusion = load_fusion(model_dir)
+        missing = [n for n in fusion.model_files or [] if n not in model_files]
+        if missing:
+            parser.error(f"fusion config names models not in {model_dir}: {missing}")
+        fusion_label = f"fusion {fusion.label}"
+
+    types = sorted(set(attack[attack != ""]))
+    print(f"\n{len(samples)} images: {int((attack == '').sum())} bona fide, "
+          f"{int((attack != '').sum())} attacks ({', '.join(types) or 'none'}); models: {', '.join(model_files)}")
+    report_latency(latencies, failed, wall)
+
+    score = real_score(apply_fusion(fusion, logits, model_files))
+    thresholds, apcer, bpcer = roc(score, attack)
+    e, t_eer = eer(thresholds, apcer, bpcer)
+    print(f"\nEnsemble ({fusion_label}, models {', '.join(fusion.model_files or model_files)}): "
+          f"EER {e:.2%} at threshold {t_eer:.3f}, AUC {auc(apcer, bpcer):.4f}")
+    report_thresholds(score, attack, [float(t) for t in args.thresholds.split(",")])
+    if args.roc_csv:
+        with open(args.roc_csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["threshold", "apcer", "bpcer"])
+            writer.writerows(zip(thresholds.tolist(), apcer.tolist(), bpcer.tolist()))
+        print(f"ROC written to {args.roc_csv}")
+
+    report_subsets(logits, attack, model_files, latencies, args.threshold)
+    if len(model_files) > 1:
+        report_cascade(logits, attack, model_files, latencies, args.threshold, args.cascade_margin)
+    if args.sweep_weights and len(model_files) > 1:
+        report_weight_sweep(logits, attack, model_files, args.threshold, args.sweep_weights)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Fit the anti-spoof score fusion offline and version it next to the models.
+
+Uses the per-model outputs cached by scripts/eval_spoof.py (computing any that are missing) for a labelled folder,
+fits on a deterministic split of the images and compares the held-out result with equal-weight averaging and the
+current fusion.json:
+
+- weighted: a temperature per model (binary NLL of P(real)), then weights on a simplex grid
+- logistic: P(real) = sigmoid(b + sum_m a_m * log-odds_m(real)), L2-regularised Newton iterations
+
+--models fits a subset, e.g. to check whether a cheaper ensemble matches all models. --write saves the fit as the
+next version of <model_dir>/fusion.json (the previous version is kept as fusion.v<N>.json).
+
+Run from backend:
+    python scripts/fit_spoof_fusion.py --data /data/spoof_eval --method logistic
+    python scripts/fit_spoof_fusion.py --data /data/spoof_eval --models 2.7_80x80_MiniFASNetV2.pth --write
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import itertools
+import os
+from pathlib import Path
+
+import numpy as np
+
+from eval_spoof import (  # noqa: E402  (also puts backend on sys.path)
+    SERVICE_THRESHOLD,
+    ScoreCache,
+    apply_fusion,
+    collect_samples,
+    eer,
+    error_rates,
+    real_score,
+    roc,
+    score_all,
+    softmax,
+)
+from app.services.spoof_fusion import REAL, ScoreFusion, load_fusion, log_odds, save_fusion  # noqa: E402
+
+TEMPERATURES = np.geomspace(0.25, 4.0, 33)
+
+
+def holdout_mask(keys: list[str], fraction: float) -> np.ndarray:
+    """Stable per-image split: the same image is always on the same side."""
+    buckets = [int(hashlib.md5(k.encode()).hexdigest()[:8], 16) % 1000 for k in keys]
+    return np.array(buckets) < fraction * 1000
+
+
+def binary_nll(p_real: np.ndarray, y: np.ndarray) -> float:
+    p = np.clip(p_real, 1e-6, 1 - 1e-6)
+    return float(-np.mean(y * np.log(p) + (1 - y) * np.log1p(-p)))
+
+
+def fit_weighted(logits: dict[str, np.ndarray], names: list[str], y: np.ndarray, steps: int) -> ScoreFusion:
+    temperatures = {}
+    for n in names:
+        losses = [binary_nll(softmax(logits[n] / t)[:, REAL], y) for t in TEMPERATURES]
+        temperatures[n] = float(TEMPERATURES[int(np.argmin(losses))])
+    best = None
+    for combo in itertools.product(range(steps + 1), repeat=len(names)):
+        if sum(combo) != steps:
+            continue
+        models = {n: {"weight": c / steps, "temperature": temperatures[n]} for n, c in zip(names, combo) if c}
+        fusion = ScoreFusion("weighted", models)
+        loss = binary_nll(apply_fusion(fusion, logits, names)[:, REAL], y)
+        if best is None or loss < best[0]:
+            best = (loss, fusion)
+    return best[1]
+
+
+def fit_logistic(logits: dict[str, np.ndarray], names: list[str], y: np.ndarray,
+                 l2: float = 1e-2, iterations: int = 50) -> ScoreFusion:
+    x = np.column_stack([np.ones(len(y))] + [log_odds(softmax(logits[n])) for n in names])
+    w = np.zeros(x.shape[1])
+    reg = l2 * np.eye(x.shape[1])
+    reg[0, 0] = 0.0  # intercept is not penalised
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-x @ w))
+        grad = x.T @ (p - y) / len(y) + reg @ w
+        hess = (x * (p * (1 - p))[:, None]).T @ x / len(y) + reg
+        step = np.linalg.solve(hess, grad)
+        w -= step
+        if np.abs(step).max() < 1e-8:
+            break
+    models = {n: {"coef": float(c)} for n, c in zip(names, w[1:])}
+    return ScoreFusion("logistic", models, intercept=float(w[0]))
+
+
+def evaluate(fusion: ScoreFusion, logits, names, y, attack, threshold) -> dict:
+    probs = apply_fusion(fusion, logits, names)
+    score = real_score(probs)
+    r = error_rates(score, attack, threshold)
+    e, t_eer = eer(*roc(score, attack))
+    return {"nll": binary_nll(probs[:, REAL], y), "acer": r["acer"], "apcer": r["apcer"], "bpcer": r["bpcer"],
+            "eer": e, "t_eer": t_eer}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fit anti-spoof score fusion on cached model outputs")
+    parser.add_argument("--data", type=Path, required=True, help="labelled folder: real/ plus one folder per attack")
+    parser.add_argument("--model-dir", type=Path, default=None,
+                        help="anti-spoof models (default: the service's resources/anti_spoof_models)")
+    parser.add_argument("--cache", type=Path, default=Path(".spoof_eval_cache"), help="eval_spoof.py output cache")
+    parser.add_argument("--method", choices=("weighted", "logistic"), default="weighted")
+    parser.add_argument("--models", default=None, help="comma-separated subset of models to fuse (default: all)")
+    parser.add_argument("--holdout", type=float, default=0.3, help="fraction of images held out for the report")
+    parser.add_argument("--steps", type=int, default=20, help="weight grid resolution (weighted)")
+    parser.add_argument("--l2", type=float, default=1e-2, help="L2 penalty (logistic)")
+    parser.add_argument("--threshold", type=float, default=SERVICE_THRESHOLD)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--write", action="store_true", help="save the fit as the next fusion.json version")
+    args = parser.parse_args()
+
+    model_dir = args.model_dir
+    if model_dir is None:
+        from app.services.spoof_detection import _get_silent_face_paths
+
+        candidates = [Path(p) / "resources" / "anti_spoof_models" for p in _get_silent_face_paths()]
+        model_dir = next((p for p in candidates if p.is_dir()), None)
+        if model_dir is None:
+            parser.error("no anti-spoof model directory found; pass --model-dir")
+    model_dir = model_dir.resolve()
+    model_files = sorted(f for f in os.listdir(model_dir) if f.endswith(".pth"))
+    names = args.models.split(",") if args.models else model_files
+    unknown = [n for n in names if n not in model_files]
+    if unknown:
+        parser.error(f"unknown models {unknown}; expected some of {model_files}")
+
+    samples = collect_samples(args.data)
+    cache = ScoreCache(args.cache, model_dir, model_files)
+    _, failed, _ = score_all(samples, model_dir, model_files, cache, args.workers, batch_size=32, threads=1)
+    failed_keys = {s.key for s in failed}
+    samples = [s for s in samples if s.key not in failed_keys]
+    attack = np.array([s.attack for s in samples])
+    y = (attack == "").astype(np.float64)
+    logits = {n: np.stack([cache.logits[n][s.key] for s in samples]) for n in model_files}
+
+    test = holdout_mask([s.key for s in samples], args.holdout)
+    if test.all() or not test.any():
+        parser.error("need images on both sides of the split; adjust --holdout or add images")
+    train_logits = {n: v[~test] for n, v in logits.items()}
+    test_logits = {n: v[test] for n, v in logits.items()}
+
+    if args.method == "weighted":
+        fitted = fit_weighted(train_logits, names, y[~test], args.steps)
+    else:
+        fitted = fit_logistic(train_logits, names, y[~test], args.l2)
+
+    candidates = [("equal, all models", ScoreFusion(), model_files)]
+    current = load_fusion(model_dir)
+    if current.model_files is not None:
+        candidates.append((f"current ({current.label})", current, model_files))
+    candidates.append((f"fitted {args.method}", fitted, names))
+
+    print(f"\nTrain {int((~test).sum())} / held-out {int(test.sum())} images; "
+          f"held-out metrics at threshold {args.threshold:.2f}")
+    print(f"{'fusion':<28}{'models':>7}{'NLL':>8}{'APCER':>9}{'BPCER':>9}{'ACER':>9}{'EER':>9}{'t@EER':>8}")
+    for label, fusion, fusion_names in candidates:
+        m = evaluate(fusion, test_logits, fusion_names, y[test], attack[test], args.threshold)
+        count = len(fusion.model_files or fusion_names)
+        print(f"{label:<28}{count:>7}{m['nll']:>8.4f}{m['apcer']:>9.2%}{m['bpcer']:>9.2%}{m['acer']:>9.2%}"
+              f"{m['eer']:>9.2%}{m['t_eer']:>8.3f}")
+    if args.write:
+        path = save_fusion(model_dir, fitted)
+        print(f"\nWrote {path} (v{fitted.version})")
+    print(f"\nFitted config: {fitted.to_dict()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Local stand-in for a Redis server: enough of RESP2 for the shared auth state backend (no persistence, single db).
+
+Supports PING, GET, SET (PX / EX / KEEPTTL / NX / XX), GETDEL, DEL, DBSIZE, FLUSHDB, SELECT, AUTH.
+Use it to run several workers locally without installing Redis, or to check the client end to end.
+
+Usage (from backend/):
+  python scripts/redis_stand_in.py --port 6380
+  AUTH_STATE_BACKEND=redis REDIS_URL=redis://localhost:6380/0 WORKERS=4 ./run-local.sh
+
+  python scripts/redis_stand_in.py --check   # start on a free port and exercise the state stores against it
+"""
+
+import argparse
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+_BACKEND = Path(__file__).resolve().parent.parent
+if str(_BACKEND) not in sys.path:
+    sys.path.insert(0, str(_BACKEND))
+
+
+class StandInServer:
+    def __init__(self):
+        self._data: dict[bytes, tuple[bytes, float | None]] = {}
+
+    def _live(self, key: bytes):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def _set(self, args: list[bytes]) -> bytes:
+        key, value, opts = args[0], args[1], [a.upper() for a in args[2:]]
+        expires_at = None
+        existing = self._live(key)
+        i = 0
+        while i < len(opts):
+            opt = opts[i]
+            if opt in (b"PX", b"EX"):
+                n = int(args[2 + i + 1])
+                expires_at = time.monotonic() + (n / 1000.0 if opt == b"PX" else float(n))
+                i += 1
+            elif opt == b"KEEPTTL" and existing is not None:
+                expires_at = existing[1]
+            elif opt == b"NX" and existing is not None:
+                return b"$-1\r\n"
+            elif opt == b"XX" and existing is None:
+                return b"$-1\r\n"
+            i += 1
+        self._data[key] = (value, expires_at)
+        return b"+OK\r\n"
+
+    def handle(self, args: list[bytes]) -> bytes:
+        cmd = args[0].upper()
+        if cmd == b"PING":
+            return b"+PONG\r\n"
+        if cmd in (b"SELECT", b"AUTH"):
+            return b"+OK\r\n"
+        if cmd == b"SET":
+            return self._set(args[1:])
+        if cmd in (b"GET", b"GETDEL"):
+            entry = self._live(args[1])
+            if entry is None:
+                return b"$-1\r\n"
+            if cmd == b"GETDEL":
+                del self._data[args[1]]
+            return b"$%d\r\n%s\r\n" % (len(entry[0]), entry[0])
+        if cmd == b"DEL":
+            n = sum(1 for k in args[1:] if self._live(k) is not None and self._data.pop(k, None) is not None)
+            return b":%d\r\n" % n
+        if cmd == b"DBSIZE":
+            return b":%d\r\n" % sum(1 for k in list(self._data) if self._live(k) is not None)
+        if cmd == b"FLUSHDB":
+            self._data.clear()
+            return b"+OK\r\n"
+        return b"-ERR unknown command '%s'\r\n" % cmd
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.startswith(b"*"):
+                    writer.write(b"-ERR inline commands not supported\r\n")
+                    continue
+                args = []
+                for _ in range(int(line[1:-2])):
+                    length = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                writer.write(self.handle(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int, ready: threading.Event | None = None) -> None:
+        server = await asyncio.start_server(self._client, host, port)
+        self.port = server.sockets[0].getsockname()[1]
+        if ready is not None:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+
+def start_in_thread(host: str = "127.0.0.1", port: int = 0) -> StandInServer:
+    """Run a stand-in on a background thread; returns once it is listening (see .port)."""
+    server = StandInServer()
+    ready = threading.Event()
+    threading.Thread(target=lambda: asyncio.run(server.serve(host, port, ready)), daemon=True).start()
+    ready.wait(5)
+    return server
+
+
+def check() -> int:
+    from app.services.resp_client import RespClient
+    from app.services.state_store import KeyedChallengeState, RedisStateStore
+
+    server = start_in_thread()
+    client = RespClient(f"redis://127.0.0.1:{server.port}/0")
+    assert client.ping()
+    store = RedisStateStore("check", 0.5, client)
+    store.set("a", {"x": 1, "raw": b"\x00\x01"})
+    assert store.get("a") == {"x": 1, "raw": b"\x00\x01"}
+    assert store.update("a", {"x": 2})
+    assert not store.add("a", {"x": 3})
+    assert store.pop("a") == {"x": 2} and store.pop("a") is None
+    assert not store.update("a", {"x": 4})
+    store.set("b", {})
+    time.sleep(0.6)
+    assert store.get("b") is None
+    challenges = KeyedChallengeState("check_challenge", RedisStateStore("check_challenge", 5, client))
+    c = challenges.issue({"customer_id": "c1"})
+    assert challenges.take(c) == {"customer_id": "c1"} and challenges.take(c) is None
+    print(f"OK: state stores against stand-in on port {server.port}")
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=6380)
+    ap.add_argument("--check", action="store_true", help="Self-check the state store client and exit")
+    args = ap.parse_args()
+    if args.check:
+        return check()
+    print(f"Redis stand-in listening on {args.host}:{args.port}")
+    try:
+        asyncio.run(StandInServer().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,7 +2,7 @@
 """
 Reset all FIDO2 passkey data so you can re-register from scratch.
 
-- Clears the local credentials file (when not using Firestore).
+- Clears passkeys from the local in-memory store WAL/snapshot and legacy credentials file (when not using Firestore).
 - Deletes all FIDO2 credentials from Firestore (when configured).
 - Does NOT remove passkeys from the device (see instructions below).
 
@@ -24,6 +24,26 @@ if str(BACKEND_DIR) not in sys.path:
     sys.path.insert(0, str(BACKEND_DIR))
 
 FIDO2_FILE = BACKEND_DIR / "data" / "fido2_credentials.json"
+DATA_DIR = BACKEND_DIR / "data"
+
+
+def clear_memory_wal() -> int:
+    """Remove FIDO2 credentials from the in-memory store WAL (compacts into a fresh snapshot). Returns count removed."""
+    from app.db.memory_store import empty_store
+    from app.db.memory_wal import MemoryWAL
+
+    wal = MemoryWAL(DATA_DIR)
+    if not wal.exists():
+        print("  (no local memory store WAL)")
+        return 0
+    store = empty_store()
+    wal.load(store)
+    count = len(store["fido2_credentials"])
+    store["fido2_credentials"].clear()
+    wal.compact()
+    wal.close()
+    print(f"  Cleared {count} credential(s) from {wal.snapshot_path.parent}")
+    return count
 
 
 def clear_file_store() -> int:
@@ -48,7 +68,7 @@ def clear_file_store() -> int:
 def clear_firestore() -> int:
     """Delete all documents in the fido2_credentials collection. Returns count removed."""
     try:
-        from app.db.firestore_client import get_firestore_client
+        from app.db.firestore_store import get_firestore_client
 
         COLLECTION = "fido2_credentials"
         db = get_firestore_client()
@@ -72,6 +92,7 @@ def clear_firestore() -> int:
 def main() -> None:
     print("Resetting FIDO2 passkey data...")
     print("\n1. Local file store (dev fallback):")
+    clear_memory_wal()
     clear_file_store()
     print("\n2. Firestore (if configured):")
     clear_firestore()
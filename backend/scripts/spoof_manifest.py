@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Write the next version of <model_dir>/manifest.json for the anti-spoof models.
+
+Every .pth file in the directory is listed with a fresh sha256; entries already in the manifest keep their type,
+input size, scale and backend, new files are described from their names (2.7_80x80_MiniFASNetV2.pth). A running
+service picks the new manifest up within SPOOF_MODEL_POLL_SEC seconds (app/services/spoof_models.py).
+
+Run from backend after adding or replacing a model:
+    python scripts/spoof_manifest.py
+    python scripts/spoof_manifest.py --model-dir /models/anti_spoof --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Run from backend so app is importable
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+# also puts Silent-Face-Anti-Spoofing on sys.path, which parses the model file names
+from app.services.spoof_detection import _get_silent_face_paths  # noqa: E402
+from app.services.spoof_models import build_manifest, read_manifest, write_manifest  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Checksum the anti-spoof models into a versioned manifest")
+    parser.add_argument("--model-dir", type=Path, default=None,
+                        help="anti-spoof models (default: the service's resources/anti_spoof_models)")
+    parser.add_argument("--dry-run", action="store_true", help="print the manifest instead of writing it")
+    args = parser.parse_args()
+
+    model_dir = args.model_dir
+    if model_dir is None:
+        candidates = [Path(p) / "resources" / "anti_spoof_models" for p in _get_silent_face_paths()]
+        model_dir = next((p for p in candidates if p.is_dir()), None)
+        if model_dir is None:
+            parser.error("no anti-spoof model directory found; pass --model-dir")
+    model_dir = model_dir.resolve()
+
+    manifest = build_manifest(str(model_dir))
+    if not manifest["models"]:
+        parser.error(f"no .pth models in {model_dir}")
+    if args.dry_run:
+        print(json.dumps(manifest, indent=2))
+        return
+
+    current, _ = read_manifest(str(model_dir))
+    path = write_manifest(str(model_dir), manifest)
+    print(f"Wrote {path} v{manifest['version']} (was v{current}):")
+    for entry in manifest["models"]:
+        print(f"  {entry['file']}  {entry['type']} {entry['input'][0]}x{entry['input'][1]} "
+              f"scale={entry['scale']}  sha256={entry['sha256'][:12]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Storage backend conformance checks.
+
+Runs the same behavioural checks against any StorageBackend through FirestoreClient, so the Firestore,
+in-memory and SQLite implementations cannot drift apart. Every check uses fresh random BVNs/usernames,
+so it is safe to run against a shared Firestore emulator.
+
+Run from backend:
+    python scripts/storage_conformance.py                    # memory + sqlite
+    python scripts/storage_conformance.py --backend firestore  # needs FIRESTORE_EMULATOR_HOST (or real credentials)
+
+Exits non-zero if any check fails.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import traceback
+import uuid
+from pathlib import Path
+
+# Run from backend so app is importable
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from app.db.backend import StorageBackend  # noqa: E402
+from app.db.firestore_client import MAX_LIMIT_NGN, MIN_LIMIT_NGN, FirestoreClient  # noqa: E402
+
+BACKEND_NAMES = ("memory", "sqlite", "firestore")
+
+
+def build_backend(name: str, workdir: str) -> StorageBackend:
+    """Fresh, non-persistent (memory) or throwaway (sqlite) backend for checks and benchmarks."""
+    if name == "memory":
+        from app.db.memory_store import MemoryStore
+        return MemoryStore()
+    if name == "sqlite":
+        from app.db.sqlite_store import SQLiteStore
+        return SQLiteStore(path=str(Path(workdir) / f"conformance-{uuid.uuid4().hex}.db"))
+    if name == "firestore":
+        from app.db.firestore_store import FirestoreStore, get_firestore_client
+        client = get_firestore_client()
+        if client is None:
+            raise RuntimeError("Firestore not available; set FIRESTORE_EMULATOR_HOST to use the local emulator")
+        return FirestoreStore(client)
+    raise ValueError(f"Unknown backend: {name}")
+
+
+def _uid() -> str:
+    return uuid.uuid4().hex[:10]
+
+
+def _bvn() -> str:
+    return str(uuid.uuid4().int)[:11]
+
+
+def _kyc_customer(db: FirestoreClient, balance: float) -> tuple[str, str, str]:
+    """Create a KYC-verified customer with one account. Returns (customer_id, account_id, account_number)."""
+    cid = db.create_customer(bvn=_bvn(), name="Conformance")
+    db.set_kyc_completed(cid, True)
+    account_number = "8" + str(uuid.uuid4().int)[:9]
+    acc_id = db.add_account(cid, account_number, "current", balance)
+    return cid, acc_id, account_number
+
+
+def check_customer_crud(db: FirestoreClient) -> None:
+    bvn = _bvn()
+    cid = db.create_customer(bvn=bvn, name="Ada", email="a@example.com")
+    cust = db.get_customer_by_id(cid)
+    assert cust and cust["id"] == cid and cust["name"] == "Ada"
+    assert cust["kyc_completed"] is False
+    assert db.get_customer_by_bvn(bvn)["id"] == cid
+    assert db.get_customer_by_id("missing-" + _uid()) is None
+    assert db.get_customer_by_bvn("no-such-bvn") is None
+    assert db.update_customer_bvn_and_name(cid, bvn, "Ada L") is True
+    assert db.get_customer_by_id(cid)["name"] == "Ada L"
+    assert db.update_customer_bvn_and_name("missing-" + _uid(), bvn, "x") is False
+
+
+def check_username(db: FirestoreClient) -> None:
+    username = "user-" + _uid()
+    cid, created = db.ensure_customer_for_username(f"  {username} ")
+    assert created is True
+    assert db.ensure_customer_for_username(username) == (cid, False)
+    assert db.get_customer_by_username(username)["id"] == cid
+    assert db.get_customer_by_username("") is None
+
+
+def check_limits_and_kyc(db: FirestoreClient) -> None:
+    cid = db.create_customer(bvn=_bvn(), name="Lim")
+    assert db.get_kyc_status(cid) == {
+        "kyc_completed": False, "has_reference_image": False, "current_limit_ngn": MIN_LIMIT_NGN,
+    }
+    assert db.update_customer_limit(cid, 1) is True
+    assert db.get_customer_limit(cid) == MIN_LIMIT_NGN
+    assert db.update_customer_limit(cid, 10 ** 12) is True
+    assert db.get_customer_limit(cid) == MAX_LIMIT_NGN
+    assert db.update_customer_kyc_reference(cid, "aGVsbG8=") is True
+    status = db.get_kyc_status(cid)
+    assert status["kyc_completed"] is True and status["has_reference_image"] is True
+    assert db.get_customer_reference_image(cid) == b"hello"
+    assert db.get_kyc_status("missing-" + _uid()) is None
+
+
+def check_fido2(db: FirestoreClient) -> None:
+    cid = db.create_customer(bvn=_bvn(), name="Passkey")
+    cred_id = "cred/" + _uid() + "=="
+    db.add_fido2_credential(cid, cred_id, "ZGF0YQ==", credential_id_client="raw-" + cred_id)
+    rows = db.get_fido2_credentials(cid)
+    assert rows == [{
+        "credential_id_b64": cred_id, "credential_data_b64": "ZGF0YQ==",
+        "sign_count": 0, "credential_id_client": "raw-" + cred_id,
+    }]
+    assert db.update_fido2_sign_count(cred_id, 7) is True
+    assert db.get_fido2_credentials(cid)[0]["sign_count"] == 7
+    assert db.update_fido2_sign_count("missing-" + _uid(), 1) is False
+    assert db.get_fido2_credentials("missing-" + _uid()) == []
+
+
+def check_device_keys(db: FirestoreClient) -> None:
+    cid = db.create_customer(bvn=_bvn(), name="Device")
+    assert db.get_device_public_key(cid) is None
+    db.set_device_public_key(cid, "a2V5MQ==")
+    db.set_device_public_key(cid, "a2V5Mg==")
+    doc = db.get_device_public_key(cid)
+    assert doc["public_key_b64"] == "a2V5Mg==" and doc["algorithm"] == "ed25519"
+    db.add_device_auth_event(cid, "login", "Y2g=", "c2ln", device_name="Pixel")
+
+
+def check_accounts(db: FirestoreClient) -> None:
+    cid, acc_id, number = _kyc_customer(db, 1000.0)
+    accounts = db.get_accounts(cid)
+    assert [a["id"] for a in accounts] == [acc_id]
+    assert accounts[0]["account_number"] == number and accounts[0]["balance_ngn"] == 1000.0
+    found = db.get_account_by_account_number(number)
+    assert found["id"] == acc_id and found["customer_id"] == cid
+    assert db.update_balance(cid, acc_id, 250.0) is True
+    assert db.get_accounts(cid)[0]["balance_ngn"] == 250.0
+    assert db.update_balance(cid, "missing-" + _uid(), 1.0) is False
+    assert db.get_account_by_account_number("0000000000") is None
+
+
+def check_transfer(db: FirestoreClient) -> None:
+    sender, sender_acc, _ = _kyc_customer(db, 500_000.0)
+    receiver, receiver_acc, receiver_number = _kyc_customer(db, 0.0)
+    tx_id = db.execute_transfer(sender, sender_acc, receiver_number, 1_000.0, {"user_id": sender}, client_ip="127.0.0.1")
+    assert tx_id
+    assert db.get_accounts(sender)[0]["balance_ngn"] == 499_000.0
+    assert db.get_accounts(receiver)[0]["balance_ngn"] == 1_000.0
+
+    def expect_error(message: str, *args) -> None:
+        try:
+            db.execute_transfer(*args, {})
+        except ValueError as e:
+            assert str(e) == message, f"expected {message!r}, got {str(e)!r}"
+        else:
+            raise AssertionError(f"expected ValueError {message!r}")
+
+    expect_error("Amount must be positive", sender, sender_acc, receiver_number, 0)
+    expect_error("Insufficient balance", sender, sender_acc, receiver_number, 10 ** 9)
+    expect_error("Amount exceeds your transfer limit", sender, sender_acc, receiver_number, 200_000.0)
+    expect_error("Beneficiary account not found", sender, sender_acc, "0000000000", 10.0)
+    expect_error("Sender account not found", sender, "missing-" + _uid(), receiver_number, 10.0)
+    expect_error("Cannot transfer to the same account", sender, sender_acc, db.get_accounts(sender)[0]["account_number"], 10.0)
+    unverified = db.create_customer(bvn=_bvn(), name="NoKyc")
+    number = "7" + str(uuid.uuid4().int)[:9]
+    db.add_account(unverified, number, "current", 0.0)
+    expect_error("Beneficiary must be KYC verified to receive transfers", sender, sender_acc, number, 10.0)
+    expect_error("Sender must be KYC verified to transfer", unverified, db.get_accounts(unverified)[0]["id"], receiver_number, 10.0)
+    # Failed transfers must not move money
+    assert db.get_accounts(sender)[0]["balance_ngn"] == 499_000.0
+
+
+def check_ledger(db: FirestoreClient) -> None:
+    sender, sender_acc, _ = _kyc_customer(db, 10_000.0)
+    receiver, receiver_acc, receiver_number = _kyc_customer(db, 0.0)
+    for _ in range(5):
+        db.execute_transfer(sender, sender_acc, receiver_number, 100.0, {"user_id": sender})
+    assert db.update_balance(receiver, receiver_acc, 1_000.0) is True
+    page = db.get_account_statement(sender, sender_acc, limit=4)
+    assert page["balance_ngn"] == 9_500.0
+    assert [e["entry_type"] for e in page["entries"]] == ["debit"] * 4
+    assert page["entries"][0]["balance_after_ngn"] == 9_500.0 and page["next_cursor"]
+    rest = db.get_account_statement(sender, sender_acc, limit=4, cursor=page["next_cursor"])
+    assert [e["entry_type"] for e in rest["entries"]] == ["debit", "opening"] and rest["next_cursor"] is None
+    seqs = [e["seq"] for e in page["entries"] + rest["entries"]]
+    assert seqs == sorted(seqs, reverse=True) and len(set(seqs)) == 6
+    assert sum(e["amount_ngn"] for e in page["entries"] + rest["entries"]) == 9_500.0
+    received = db.get_account_statement(receiver, receiver_acc, limit=10)["entries"]
+    assert [e["entry_type"] for e in received] == ["adjustment"] + ["credit"] * 5
+    assert received[0]["amount_ngn"] == 500.0 and received[0]["balance_after_ngn"] == 1_000.0
+    assert received[1]["transaction_id"] and received[1]["counterparty_account_id"] == sender_acc
+    assert db.get_account_statement(receiver, sender_acc) is None
+    try:
+        db.get_account_statement(sender, sender_acc, cursor="not-a-cursor")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError for a malformed cursor")
+
+
+CHECKS = [
+    check_customer_crud,
+    check_username,
+    check_limits_and_kyc,
+    check_fido2,
+    check_device_keys,
+    check_accounts,
+    check_transfer,
+    check_ledger,
+]
+
+
+def run(name: str, workdir: str) -> int:
+    """Run all checks against one backend. Returns number of failures."""
+    db = FirestoreClient(backend=build_backend(name, workdir))
+    failures = 0
+    for check in CHECKS:
+        try:
+            check(db)
+            print(f"  ok    {check.__name__}")
+        except Exception:
+            failures += 1
+            print(f"  FAIL  {check.__name__}")
+            traceback.print_exc()
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Storage backend conformance checks")
+    parser.add_argument("--backend", action="append", choices=BACKEND_NAMES,
+                        help="backend to check (repeatable; default: memory and sqlite)")
+    args = parser.parse_args()
+    failures = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.backend or ["memory", "sqlite"]:
+            print(f"{name}:")
+            failures += run(name, workdir)
+    print("\nAll checks passed." if not failures else f"\n{failures} check(s) failed.")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,12 @@
+// crypto.getRandomValues for idempotency keys (not built into React Native)
+import 'react-native-get-random-values';
+
 import { API_BASE_URL } from '../config';
 
+/** Retries of a transfer whose response never arrived, or that the server reports as still in progress (409). */
+const TRANSFER_RETRIES = 2;
+const TRANSFER_RETRY_DELAY_MS = 1000;
+
 export interface Account {
   id: string;
   customer_id: string;
@@ -51,16 +58,51 @@ export async function getAccounts(customerId: string): Promise<Account[]> {
   return res.json();
 }
 
-/** POST /api/transactions/transfer - both sender and beneficiary must be KYC verified */
-export async function transfer(body: TransferRequest): Promise<TransferResponse> {
-  const res = await fetch(`${API_BASE_URL}/api/transactions/transfer`, {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json', Accept: 'application/json' },
-    body: JSON.stringify(body),
-  });
-  if (!res.ok) {
-    const err = await res.json().catch(() => ({ detail: 'Transfer failed' }));
-    throw new Error(err.detail || `Status ${res.status}`);
+/** Random Idempotency-Key (UUID v4) for one transfer attempt. */
+export function newIdempotencyKey(): string {
+  const bytes = crypto.getRandomValues(new Uint8Array(16));
+  bytes[6] = (bytes[6] & 0x0f) | 0x40;
+  bytes[8] = (bytes[8] & 0x3f) | 0x80;
+  const hex = Array.from(bytes, (b) => b.toString(16).padStart(2, '0')).join('');
+  return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-${hex.slice(12, 16)}-${hex.slice(16, 20)}-${hex.slice(20)}`;
+}
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+/**
+ * POST /api/transactions/transfer - both sender and beneficiary must be KYC verified.
+ * Create one idempotencyKey per transfer attempt (newIdempotencyKey). The request is retried with the same key and
+ * body when the response is lost or the first request is still in progress, so the server returns the original
+ * result instead of transferring twice.
+ */
+export async function transfer(
+  body: TransferRequest,
+  idempotencyKey: string = newIdempotencyKey()
+): Promise<TransferResponse> {
+  const headers: Record<string, string> = {
+    'Content-Type': 'application/json',
+    Accept: 'application/json',
+    'Idempotency-Key': idempotencyKey,
+  };
+  const payload = JSON.stringify(body);
+  for (let attempt = 0; ; attempt++) {
+    let res: Response;
+    try {
+      res = await fetch(`${API_BASE_URL}/api/transactions/transfer`, { method: 'POST', headers, body: payload });
+    } catch (e) {
+      // The transfer may or may not have gone through; retrying with the same key is safe either way
+      if (attempt >= TRANSFER_RETRIES) throw e;
+      await sleep(TRANSFER_RETRY_DELAY_MS * (attempt + 1));
+      continue;
+    }
+    if (res.status === 409 && attempt < TRANSFER_RETRIES) {
+      await sleep(TRANSFER_RETRY_DELAY_MS * (attempt + 1));
+      continue;
+    }
+    if (!res.ok) {
+      const err = await res.json().catch(() => ({ detail: 'Transfer failed' }));
+      throw new Error(err.detail || `Status ${res.status}`);
+    }
+    return res.json();
   }
-  return res.json();
 }
@@ -16,7 +16,7 @@ import type { RootStackParamList } from '../navigation/AppNavigator';
 import { CameraView, useCameraPermissions } from 'expo-camera';
 import { useAuth } from '../context/AuthContext';
 import { kycOnboard, kycVerify, updateLimit, type VerificationResult } from '../api/kyc';
-import { transfer } from '../api/transactions';
+import { newIdempotencyKey, transfer } from '../api/transactions';
 import { registerDeviceKey } from '../api/deviceAuth';
 import { generateAndStoreKey } from '../lib/deviceKey';
 import ResultDisplay from '../components/ResultDisplay';
@@ -103,20 +103,23 @@ export default function KYCCaptureScreen() {
       const pending = params.pendingTransfer;
       if (pending && customerId) {
         try {
-          await transfer({
-            sender_customer_id: customerId,
-            beneficiary_account_number: pending.beneficiary_account_number,
-            amount_ngn: pending.amount_ngn,
-            audit: {
-              user_id: user?.userId ?? customerId,
-              device_id: getDeviceId(),
-              public_key_id: 'poc',
-              nonce: `n-${Date.now()}`,
-              transaction_hash: `h-${Date.now()}`,
-              digital_signature: 's-poc',
-              biometric_modality: 'FACE',
+          await transfer(
+            {
+              sender_customer_id: customerId,
+              beneficiary_account_number: pending.beneficiary_account_number,
+              amount_ngn: pending.amount_ngn,
+              audit: {
+                user_id: user?.userId ?? customerId,
+                device_id: getDeviceId(),
+                public_key_id: 'poc',
+                nonce: `n-${Date.now()}`,
+                transaction_hash: `h-${Date.now()}`,
+                digital_signature: 's-poc',
+                biometric_modality: 'FACE',
+              },
             },
-          });
+            newIdempotencyKey()
+          );
         } catch (e) {
           Alert.alert('Transfer failed', e instanceof Error ? e.message : 'Please try again.', [
             { text: 'OK', onPress: resetToTransfer },
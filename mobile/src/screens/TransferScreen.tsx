@@ -25,7 +25,7 @@ import {
   verifyTransaction,
 } from '../api/deviceAuth';
 import { signChallengeAfterBiometrics } from '../lib/deviceKey';
-import { getAccounts, transfer, type TransferAuditPayload } from '../api/transactions';
+import { getAccounts, newIdempotencyKey, transfer, type TransferAuditPayload } from '../api/transactions';
 import { colors, radius, spacing } from '../theme';
 import { KYC_AMOUNT_THRESHOLD_NGN, MAX_TRANSFER_AMOUNT_NGN } from '../constants';
 
@@ -170,13 +170,17 @@ export default function TransferScreen() {
       const deviceName = getDeviceName();
       await verifyTransaction(state_id, signature, deviceName);
       console.log('[Transfer] handleAuthWithPasskey: step 4 → transfer with state_id');
-      await transfer({
-        sender_customer_id: customerId,
-        beneficiary_account_number: accountNumber.trim(),
-        amount_ngn: amountNum,
-        audit: buildAuditPayload(user?.userId ?? customerId, getDeviceId(), 'FACE'),
-        state_id,
-      });
+      // One key per attempt: transfer() resends it (with the same body) if the response is lost
+      await transfer(
+        {
+          sender_customer_id: customerId,
+          beneficiary_account_number: accountNumber.trim(),
+          amount_ngn: amountNum,
+          audit: buildAuditPayload(user?.userId ?? customerId, getDeviceId(), 'FACE'),
+          state_id,
+        },
+        newIdempotencyKey()
+      );
       console.log('[Transfer] handleAuthWithPasskey: step 5 → done, success');
       setSuccessModalVisible(true);
       setStep('form');
@@ -209,16 +213,19 @@ export default function TransferScreen() {
       } else {
         await new Promise((r) => setTimeout(r, 300));
       }
-      await transfer({
-        sender_customer_id: customerId,
-        beneficiary_account_number: accountNumber.trim(),
-        amount_ngn: amountNum,
-        audit: buildAuditPayload(
-          user?.userId ?? customerId,
-          getDeviceId(),
-          useBiometric ? 'FINGER' : 'FACE'
-        ),
-      });
+      await transfer(
+        {
+          sender_customer_id: customerId,
+          beneficiary_account_number: accountNumber.trim(),
+          amount_ngn: amountNum,
+          audit: buildAuditPayload(
+            user?.userId ?? customerId,
+            getDeviceId(),
+            useBiometric ? 'FINGER' : 'FACE'
+          ),
+        },
+        newIdempotencyKey()
+      );
       setSuccessModalVisible(true);
       setStep('form');
       setSelectedBank(null);